@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+
+
+def extreme_positions(values, k=3, largest=True):
+    """
+    Позиции k наибольших (или наименьших) значений, как у nlargest/nsmallest:
+    при равных значениях первой идёт строка, которая встречается раньше
+    """
+    values = np.asarray(values, dtype=np.float64)
+    k = min(k, len(values))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+
+    keys = -values if largest else values
+    kth = np.partition(keys, k - 1)[k - 1]
+    candidates = np.flatnonzero(keys <= kth)
+    order = np.lexsort((candidates, keys[candidates]))[:k]
+
+    return candidates[order]
+
+
+def distribution(column, sort_index=False):
+    """
+    Количество строк по значениям колонки за один проход хешированием, как value_counts:
+    по убыванию количества (или по значению при sort_index=True)
+    """
+    codes, uniques = pd.factorize(column.to_numpy(), sort=sort_index)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    result = pd.Series(counts, index=pd.Index(uniques, name=column.name), name='count', dtype='int64')
+
+    if not sort_index:
+        result = result.iloc[np.argsort(-counts, kind='stable')]
+
+    return result
+
+
+class ReviewAggregates:
+    """
+    Сводная статистика обработанных отзывов, посчитанная один раз
+    Количества, средние и центрированные суммы квадратов тональности считаются
+    по группам рейтинга (np.bincount) и объединяются по формулам Чана, из них
+    получаются средние, стандартные отклонения, медиана рейтинга и корреляция Пирсона
+    рейтинга с тональностью, поэтому отчёты и страницы дашборда не сканируют данные
+    заново. Отзывы без рейтинга, как в groupby, не входят в группы рейтинга и корреляцию
+    Также хранятся распределения категорий и позиции экстремальных отзывов
+    """
+
+    def __init__(self, df, n_extremes=3):
+        self.count = len(df)
+
+        ratings = df['rating'].to_numpy()
+        sentiment = df['sentiment_score'].to_numpy(dtype=np.float64)
+
+        # Группы по рейтингу (код -1 - рейтинг пропущен): количество, среднее
+        # и центрированная сумма квадратов тональности
+        codes, rating_values = pd.factorize(ratings, sort=True)
+        rating_values = np.asarray(rating_values, dtype=np.float64)
+        n_groups = len(rating_values)
+        rated = codes >= 0
+        codes, rated_sentiment = codes[rated], sentiment[rated]
+        group_count = np.bincount(codes, minlength=n_groups)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            group_mean = np.bincount(codes, weights=rated_sentiment, minlength=n_groups) / group_count
+            deviation = rated_sentiment - group_mean[codes]
+            group_m2 = np.bincount(codes, weights=deviation * deviation, minlength=n_groups)
+            group_var = group_m2 / (group_count - 1)
+
+        self.rating_groups = pd.DataFrame({
+            'mean': group_mean,
+            'std': np.sqrt(group_var),
+            'count': group_count
+        }, index=pd.Index(rating_values.astype(ratings.dtype), name='rating'))
+        self.rating_distribution = self.rating_groups['count'].rename('count')
+
+        # Тональность - по всем отзывам, центрированно относительно среднего
+        n = self.count
+        self.sentiment_mean = sentiment.mean() if n else np.nan
+        self.sentiment_std = np.sqrt(((sentiment - self.sentiment_mean) ** 2).sum() / (n - 1)) if n > 1 else np.nan
+
+        # Рейтинг и корреляция - по отзывам с рейтингом: группы объединяются по Чану,
+        # рейтинг внутри группы постоянен, поэтому его отклонения дают только средние групп
+        n_rated = group_count.sum()
+        self.rating_mean = (rating_values * group_count).sum() / n_rated if n_rated else np.nan
+        rated_mean = (group_mean * group_count).sum() / n_rated if n_rated else np.nan
+        rating_ss = (group_count * (rating_values - self.rating_mean) ** 2).sum()
+        sentiment_ss = group_m2.sum() + (group_count * (group_mean - rated_mean) ** 2).sum()
+        cross_ss = (group_count * (rating_values - self.rating_mean) * (group_mean - rated_mean)).sum()
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.correlation = cross_ss / np.sqrt(rating_ss * sentiment_ss) if n_rated > 1 else np.nan
+
+        self.rating_median = self._median(rating_values, group_count)
+
+        self.sentiment_distribution = distribution(df['sentiment_category'])
+        self.rating_category_distribution = (
+            distribution(df['rating_category']) if 'rating_category' in df.columns else None
+        )
+
+        self.word_count_mean = df['word_count'].mean() if 'word_count' in df.columns else np.nan
+        self.text_length_mean = df['text_length'].mean() if 'text_length' in df.columns else np.nan
+
+        # Позиции (для df.iloc) самых позитивных и самых негативных отзывов
+        self.most_positive = extreme_positions(sentiment, n_extremes, largest=True)
+        self.most_negative = extreme_positions(sentiment, n_extremes, largest=False)
+
+        # Группы по темам, если отзывы кластеризованы (колонка topic_id)
+        self.topic_groups = self._topic_groups(df, sentiment) if 'topic_id' in df.columns else None
+
+    @staticmethod
+    def _topic_groups(df, sentiment):
+        """
+        Размер, доля, средние рейтинг и тональность и доля негативных отзывов
+        по темам (topic_id = -1 - отзывы без темы)
+        """
+        codes, topic_ids = pd.factorize(df['topic_id'].to_numpy(), sort=True)
+        n_groups = len(topic_ids)
+        ratings = df['rating'].to_numpy(dtype=np.float64)
+        negative = (df['sentiment_category'] == 'Негативная').to_numpy(dtype=np.float64)
+
+        # Строки без темы (код -1) не входят в группы, отзывы без рейтинга - в средний рейтинг
+        valid = codes >= 0
+        codes, ratings, sentiment, negative = codes[valid], ratings[valid], sentiment[valid], negative[valid]
+        rated = ~np.isnan(ratings)
+
+        count = np.bincount(codes, minlength=n_groups)
+        rated_count = np.bincount(codes[rated], minlength=n_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return pd.DataFrame({
+                'count': count,
+                'share': count / max(len(df), 1) * 100,
+                'rating_mean': np.bincount(codes[rated], weights=ratings[rated], minlength=n_groups) / rated_count,
+                'sentiment_mean': np.bincount(codes, weights=sentiment, minlength=n_groups) / count,
+                'negative_share': np.bincount(codes, weights=negative, minlength=n_groups) / count * 100
+            }, index=pd.Index(np.asarray(topic_ids, dtype=np.int64), name='topic_id'))
+
+    @staticmethod
+    def _median(values, counts):
+        """Медиана по отсортированным значениям и их количествам"""
+        n = counts.sum()
+        if n == 0:
+            return np.nan
+
+        cumulative = np.cumsum(counts)
+        lower = values[np.searchsorted(cumulative, (n - 1) // 2, side='right')]
+        upper = values[np.searchsorted(cumulative, n // 2, side='right')]
+        return (lower + upper) / 2
+
+    def share(self, category, column='sentiment_category'):
+        """Доля отзывов (в процентах) с данным значением категории"""
+        counts = self.sentiment_distribution if column == 'sentiment_category' else self.rating_category_distribution
+        if not self.count:
+            return 0.0
+        return counts.get(category, 0) / self.count * 100
+
+    def rating_share(self, ratings):
+        """Доля отзывов (в процентах) с рейтингом из списка ratings"""
+        if not self.count:
+            return 0.0
+        return sum(self.rating_distribution.get(rating, 0) for rating in ratings) / self.count * 100
+
+
+def histogram_bins(values, bins=50):
+    """Гистограмма, посчитанная заранее: центры, ширины и количества по корзинам"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    counts, edges = np.histogram(values, bins=bins)
+
+    return pd.DataFrame({
+        'center': (edges[:-1] + edges[1:]) / 2,
+        'width': np.diff(edges),
+        'count': counts
+    })
+
+
+def box_stats(df, value, by):
+    """
+    Статистики ящика с усами для каждой группы, как у plotly: квартили (линейная
+    интерполяция), среднее и усы до крайних значений в пределах 1.5 IQR от квартилей
+    """
+    grouped = df.groupby(by, sort=True)[value]
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    quartiles.columns = ['q1', 'median', 'q3']
+
+    iqr = quartiles['q3'] - quartiles['q1']
+    low = df[by].map(quartiles['q1'] - 1.5 * iqr)
+    high = df[by].map(quartiles['q3'] + 1.5 * iqr)
+    inside = df[value].between(low, high)
+
+    stats = quartiles.assign(
+        mean=grouped.mean(),
+        lowerfence=df.loc[inside, value].groupby(df.loc[inside, by]).min(),
+        upperfence=df.loc[inside, value].groupby(df.loc[inside, by]).max(),
+        count=grouped.size()
+    )
+
+    return stats
+
+
+def stratified_sample(df, by, n_rows=2000, seed=42):
+    """
+    Случайная выборка не более n_rows строк, в которой каждая группа by представлена
+    поровну (малые группы берутся целиком). Возвращает позиции строк для df.iloc
+    """
+    if len(df) <= n_rows:
+        return np.arange(len(df))
+
+    codes, uniques = pd.factorize(df[by].to_numpy())
+    per_group = max(1, n_rows // max(len(uniques), 1))
+
+    # Случайный ранг строки внутри группы: первые per_group рангов попадают в выборку
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(df)), codes))
+    sorted_codes = codes[order]
+    group_starts = np.searchsorted(sorted_codes, sorted_codes, side='left')
+    rank = np.arange(len(df)) - group_starts
+
+    return np.sort(order[rank < per_group])
@@ -6,74 +6,177 @@ from wordcloud import WordCloud
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+import sys
 import warnings
+import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from storage import get_storage, compact_review_frame, data_version, matches_data_version
+from processing import ReviewProcessor, segment_frequencies
+from rollups import TimeSeriesRollup
+from sketches import ReviewSketches
+from aggregates import ReviewAggregates, histogram_bins, box_stats, stratified_sample
+from duplicates import duplicate_mask
+from topics import topic_labels, TOPIC_TERM_COLUMNS
+from instrumentation import traced, record_file_written
 
 warnings.filterwarnings('ignore')
 
 # Настройка русского языка для matplotlib
 plt.rcParams['font.family'] = 'DejaVu Sans'
 
+# Графики отчёта: имя файла -> метод ReviewAnalyzer, который его строит
+CHART_METHODS = {
+    'rating_distribution': 'create_rating_distribution_plot',
+    'sentiment_analysis': 'create_sentiment_analysis_plot',
+    'wordcloud': 'create_word_cloud',
+    'time_series': 'create_time_series_plot'
+}
+
+# Форматы файлов графиков
+IMAGE_FORMATS = ('png', 'svg', 'webp')
+
+# Начиная с этого числа отзывов интерактивный дашборд строится по агрегатам
+AGGREGATED_DASHBOARD_ROWS = 10000
+
 
 class ReviewAnalyzer:
-    def __init__(self):
+    def __init__(self, storage=None, compact=False, headless=False, dpi=300, image_format='png',
+                 exclude_duplicates=False):
         self.df = None
+        # Версия загруженного файла (путь, время изменения, размер): по ней проверяется,
+        # что сохранённые агрегаты и скетчи посчитаны по этим данным
+        self.data_version = None
+        # Хранилище данных: 'csv' (по умолчанию), 'parquet' или объект хранилища
+        self.storage = get_storage(storage)
+        # Держать данные в памяти в компактной схеме типов
+        self.compact = compact
+        # Частоты слов и готовые облака слов
+        self.term_frequencies = None
+        self._word_clouds = {}
+        # Агрегаты по дням, неделям и месяцам
+        self.time_rollup = None
+        # Скетчи квантилей и числа различных авторов и слов по дням
+        self.sketches = None
+        # Сводная статистика загруженных данных
+        self.aggregates = None
+        # Самые весомые слова тем (колонка topic_id)
+        self.topic_terms = None
+        # Пакетная отрисовка графиков без окон (backend Agg) в пуле процессов
+        self.headless = headless
+        # Разрешение и формат файлов графиков
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Неизвестный формат графиков: {image_format}")
+        self.dpi = dpi
+        self.image_format = image_format
+        # Не учитывать в статистике повторы почти одинаковых отзывов (колонка dup_group_id)
+        self.exclude_duplicates = exclude_duplicates
+
+    @traced
+    def load_processed_data(self, filepath=None, columns=None):
+        """Загружает обработанные данные (опционально только нужные колонки)"""
+        if filepath is None:
+            filepath = f'data/processed/processed_reviews{self.storage.extension}'
 
-    def load_processed_data(self, filepath='data/processed/processed_reviews.csv'):
-        """Загружает обработанные данные"""
         try:
-            self.df = pd.read_csv(filepath, encoding='utf-8')
-            self.df['date'] = pd.to_datetime(self.df['date'])
+            self.df = self.storage.load(filepath, columns=columns)
+            self.data_version = data_version(filepath)
+            if self.compact:
+                self.df = compact_review_frame(self.df)
+            self.term_frequencies = None
+            self._word_clouds = {}
+            self.time_rollup = None
+            self.sketches = None
+            self.aggregates = None
+            self.topic_terms = None
             print(f"Загружено {len(self.df)} обработанных отзывов")
+            if self.exclude_duplicates:
+                self.drop_near_duplicates()
             return True
         except FileNotFoundError:
             print(f"Файл {filepath} не найден")
             return False
 
+    def drop_near_duplicates(self):
+        """
+        Оставляет из каждой группы почти одинаковых отзывов только первый
+        Сохранённые частоты слов и временные агрегаты посчитаны по всем отзывам,
+        поэтому они пересчитываются по оставшимся данным
+        """
+        if self.df is None or 'dup_group_id' not in self.df.columns:
+            print("Группы дублей не найдены: обработайте отзывы с near_duplicates=True")
+            return 0
+
+        mask = duplicate_mask(self.df['dup_group_id'].to_numpy())
+        self.df = self.df[~mask].reset_index(drop=True)
+        self.term_frequencies = ReviewProcessor(storage=self.storage).compute_term_frequencies(self.df)
+        self._word_clouds = {}
+        self.time_rollup = TimeSeriesRollup().update(self.df)
+        self.sketches = ReviewSketches().update(self.df)
+        self.aggregates = None
+        print(f"Исключено {mask.sum()} почти одинаковых отзывов, осталось {len(self.df)}")
+
+        return int(mask.sum())
+
+    @traced
+    def get_aggregates(self):
+        """Сводная статистика загруженных данных (считается один раз после загрузки)"""
+        if self.aggregates is None:
+            self.aggregates = ReviewAggregates(self.df)
+
+        return self.aggregates
+
+    @traced
     def basic_statistics(self):
         """Выводит базовую статистику"""
         if self.df is None:
             print("Данные не загружены")
             return
 
+        stats = self.get_aggregates()
+
         print("=== БАЗОВАЯ СТАТИСТИКА ===")
-        print(f"Общее количество отзывов: {len(self.df)}")
-        print(f"Средний рейтинг: {self.df['rating'].mean():.2f}")
-        print(f"Медианный рейтинг: {self.df['rating'].median()}")
-        print(f"Средняя длина отзыва: {self.df['word_count'].mean():.1f} слов")
+        print(f"Общее количество отзывов: {stats.count}")
+        print(f"Средний рейтинг: {stats.rating_mean:.2f}")
+        print(f"Медианный рейтинг: {stats.rating_median}")
+        print(f"Средняя длина отзыва: {stats.word_count_mean:.1f} слов")
 
         print("\nРаспределение по рейтингам:")
-        print(self.df['rating'].value_counts().sort_index())
+        print(stats.rating_distribution)
 
         print("\nРаспределение по тональности:")
-        print(self.df['sentiment_category'].value_counts())
+        print(stats.sentiment_distribution)
 
         print("\nСтатистика по тональности:")
-        print(f"Средний score тональности: {self.df['sentiment_score'].mean():.3f}")
-        print(f"Стандартное отклонение: {self.df['sentiment_score'].std():.3f}")
+        print(f"Средний score тональности: {stats.sentiment_mean:.3f}")
+        print(f"Стандартное отклонение: {stats.sentiment_std:.3f}")
 
+    @traced
     def correlation_analysis(self):
         """Анализ корреляций между рейтингом и тональностью"""
         if self.df is None:
             return
 
-        correlation = self.df['rating'].corr(self.df['sentiment_score'])
-        print(f"\nКорреляция между рейтингом и тональностью: {correlation:.3f}")
+        stats = self.get_aggregates()
+        print(f"\nКорреляция между рейтингом и тональностью: {stats.correlation:.3f}")
 
         # Группировка по рейтингам
-        rating_sentiment = self.df.groupby('rating')['sentiment_score'].agg(['mean', 'std', 'count'])
         print("\nСредняя тональность по рейтингам:")
-        print(rating_sentiment)
+        print(stats.rating_groups)
 
+    @traced
     def create_rating_distribution_plot(self):
         """Создает график распределения рейтингов"""
         if self.df is None:
             return
 
-        plt.figure(figsize=(10, 6))
+        fig = plt.figure(figsize=(10, 6))
 
         # Основной график
         plt.subplot(1, 2, 1)
-        rating_counts = self.df['rating'].value_counts().sort_index()
+        stats = self.get_aggregates()
+        rating_counts = stats.rating_distribution
         plt.bar(rating_counts.index, rating_counts.values, color='steelblue', alpha=0.7)
         plt.title('Распределение рейтингов')
         plt.xlabel('Рейтинг')
@@ -82,15 +185,15 @@ class ReviewAnalyzer:
 
         # Круговая диаграмма
         plt.subplot(1, 2, 2)
-        sentiment_counts = self.df['sentiment_category'].value_counts()
+        sentiment_counts = stats.sentiment_distribution
         colors = ['lightcoral', 'lightgray', 'lightgreen']
         plt.pie(sentiment_counts.values, labels=sentiment_counts.index, autopct='%1.1f%%', colors=colors)
         plt.title('Распределение тональности')
 
         plt.tight_layout()
-        plt.savefig('data/external/rating_distribution.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        return self._save_figure(fig, 'rating_distribution')
 
+    @traced
     def create_sentiment_analysis_plot(self):
         """Создает график анализа тональности"""
         if self.df is None:
@@ -119,7 +222,7 @@ class ReviewAnalyzer:
         axes[1, 0].grid(True, alpha=0.3)
 
         # График 4: Средняя тональность по рейтингам
-        avg_sentiment = self.df.groupby('rating')['sentiment_score'].mean()
+        avg_sentiment = self.get_aggregates().rating_groups['mean']
         axes[1, 1].bar(avg_sentiment.index, avg_sentiment.values, color='orange', alpha=0.7)
         axes[1, 1].set_xlabel('Рейтинг')
         axes[1, 1].set_ylabel('Средняя тональность')
@@ -127,50 +230,172 @@ class ReviewAnalyzer:
         axes[1, 1].set_xticks(range(1, 6))
 
         plt.tight_layout()
-        plt.savefig('data/external/sentiment_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
-
-    def create_word_cloud(self):
+        return self._save_figure(fig, 'sentiment_analysis')
+
+    @traced
+    def get_term_frequencies(self):
+        """
+        Таблица частот слов: сохранённая на этапе обработки или, если её нет,
+        посчитанная по загруженным данным
+        """
+        if self.term_frequencies is None:
+            processor = ReviewProcessor(storage=self.storage)
+            self.term_frequencies = processor.load_term_frequencies()
+            if self.term_frequencies is None:
+                self.term_frequencies = processor.compute_term_frequencies(self.df)
+
+        return self.term_frequencies
+
+    def get_topic_terms(self):
+        """Слова тем, сохранённые на этапе обработки (пустая таблица, если их нет)"""
+        if self.topic_terms is None:
+            self.topic_terms = ReviewProcessor(storage=self.storage).load_topic_terms()
+            if self.topic_terms is None:
+                self.topic_terms = pd.DataFrame(columns=TOPIC_TERM_COLUMNS)
+
+        return self.topic_terms
+
+    def topic_table(self):
+        """
+        Разбивка отзывов по темам: подпись из трёх главных слов, размер, доля,
+        средние рейтинг и тональность, доля негативных (None, если тем нет)
+        """
+        if self.df is None:
+            return None
+
+        groups = self.get_aggregates().topic_groups
+        if groups is None:
+            return None
+
+        labels = topic_labels(self.get_topic_terms())
+        table = groups.copy()
+        table.insert(0, 'label', [labels.get(topic_id, 'без темы' if topic_id < 0 else '')
+                                  for topic_id in table.index])
+        return table
+
+    @traced
+    def topic_analysis(self):
+        """Выводит разбивку отзывов по темам"""
+        table = self.topic_table()
+        if table is None:
+            print("\nТемы не найдены: обработайте отзывы с topics=True")
+            return None
+
+        print("\n=== ТЕМЫ ОТЗЫВОВ ===")
+        for topic_id, row in table.iterrows():
+            print(f"Тема {topic_id} ({row['label']}): {row['count']} отзывов ({row['share']:.1f}%), "
+                  f"рейтинг {row['rating_mean']:.2f}, тональность {row['sentiment_mean']:.3f}, "
+                  f"негативных {row['negative_share']:.1f}%")
+
+        return table
+
+    def get_word_cloud(self, segment='all', value='', max_words=100, width=800, height=400):
+        """Облако слов сегмента по готовым частотам (результат запоминается)"""
+        key = (segment, str(value), max_words, width, height)
+        if key not in self._word_clouds:
+            frequencies = segment_frequencies(self.get_term_frequencies(), segment, value)
+            if not frequencies:
+                return None
+
+            self._word_clouds[key] = WordCloud(
+                width=width,
+                height=height,
+                background_color='white',
+                max_words=max_words,
+                relative_scaling=0.5,
+                colormap='viridis'
+            ).generate_from_frequencies(frequencies)
+
+        return self._word_clouds[key]
+
+    @traced
+    def create_word_cloud(self, segment='all', value=''):
         """Создает облако слов"""
         if self.df is None:
             return
 
-        # Объединяем все тексты
-        all_text = ' '.join(self.df['clean_text'].dropna())
+        # Создаем облако слов из заранее посчитанных частот
+        wordcloud = self.get_word_cloud(segment, value)
 
-        if not all_text.strip():
+        if wordcloud is None:
             print("Нет текста для создания облака слов")
             return
 
-        # Создаем облако слов
-        wordcloud = WordCloud(
-            width=800,
-            height=400,
-            background_color='white',
-            max_words=100,
-            relative_scaling=0.5,
-            colormap='viridis'
-        ).generate(all_text)
-
-        plt.figure(figsize=(12, 6))
+        fig = plt.figure(figsize=(12, 6))
         plt.imshow(wordcloud, interpolation='bilinear')
         plt.axis('off')
         plt.title('Облако слов из отзывов', fontsize=16)
         plt.tight_layout(pad=0)
-        plt.savefig('data/external/wordcloud.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        return self._save_figure(fig, 'wordcloud')
+
+    @traced
+    def get_time_rollup(self):
+        """
+        Агрегаты по времени: сохранённые пайплайном или, если их нет
+        или они посчитаны по другим данным, посчитанные по загруженным отзывам
+        """
+        if self.time_rollup is None:
+            path = ReviewProcessor(storage=self.storage).time_rollups_path()
+            rollup = TimeSeriesRollup.load(self.storage, path)
+
+            if rollup is None or not matches_data_version(path, self.data_version):
+                rollup = TimeSeriesRollup().update(self.df)
+
+            self.time_rollup = rollup
+
+        return self.time_rollup
+
+    @traced
+    def get_sketches(self):
+        """
+        Скетчи квантилей и различных значений: сохранённые пайплайном или, если их нет
+        или они посчитаны по другим данным, посчитанные по загруженным отзывам
+        """
+        if self.sketches is None:
+            path = ReviewProcessor(storage=self.storage).sketches_path()
+            sketches = ReviewSketches.load(path)
+            if sketches is None or not matches_data_version(path, self.data_version):
+                sketches = ReviewSketches().update(self.df)
+
+            self.sketches = sketches
+
+        return self.sketches
+
+    @traced
+    def distribution_summary(self, grain='month', n_periods=6):
+        """
+        Выводит приближённые квантили длины и тональности и число различных авторов
+        и слов за всю историю и за последние n_periods периодов (по скетчам, без пересчёта)
+        """
+        if self.df is None:
+            return None
+
+        sketches = self.get_sketches()
+        summary = sketches.summary()
+
+        print("\n=== РАСПРЕДЕЛЕНИЯ (ПРИБЛИЖЁННО) ===")
+        print(f"Различных авторов: ~{summary['authors']}, различных слов: ~{summary['vocabulary']}")
+        for column, title in [('word_count', 'Длина, слов'), ('text_length', 'Длина, символов'),
+                              ('sentiment_score', 'Тональность')]:
+            print(f"{title}: медиана {summary[f'{column}_p50']:.3g}, p90 {summary[f'{column}_p90']:.3g}, "
+                  f"p99 {summary[f'{column}_p99']:.3g}")
 
-    def create_time_series_plot(self):
-        """Создает график динамики по времени"""
+        periods = sketches.frame(grain)
+        if not periods.empty:
+            print(f"\nПоследние периоды ({grain}):")
+            print(periods[['review_count', 'authors', 'vocabulary', 'word_count_p50', 'sentiment_score_p50']]
+                  .tail(n_periods))
+
+        return summary
+
+    @traced
+    def create_time_series_plot(self, grain='month', start=None, end=None):
+        """Создает график динамики по времени (grain: 'day', 'week', 'month'; start/end - диапазон дат)"""
         if self.df is None:
             return
 
-        # Группируем данные по месяцам
-        monthly_data = self.df.set_index('date').resample('M').agg({
-            'rating': 'mean',
-            'sentiment_score': 'mean',
-            'text': 'count'
-        }).rename(columns={'text': 'review_count'})
+        # Временной ряд берём из готовых агрегатов
+        monthly_data = self.get_time_rollup().frame(grain, start, end)
 
         fig, axes = plt.subplots(3, 1, figsize=(12, 10))
 
@@ -194,9 +419,77 @@ class ReviewAnalyzer:
         axes[2].grid(True, alpha=0.3)
 
         plt.tight_layout()
-        plt.savefig('data/external/time_series.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        return self._save_figure(fig, 'time_series')
+
+    def _save_figure(self, fig, name):
+        """
+        Сохраняет график в data/external с заданными разрешением и форматом
+        В headless режиме фигура закрывается вместо показа, чтобы не копить память
+        """
+        filepath = f'data/external/{name}.{self.image_format}'
+        fig.savefig(filepath, dpi=self.dpi, format=self.image_format, bbox_inches='tight')
+        record_file_written(filepath)
+
+        if self.headless:
+            plt.close(fig)
+        else:
+            plt.show()
+
+        return filepath
+
+    def _chart_state(self):
+        """
+        Копия анализатора для процессов отрисовки: из данных остаются только колонки
+        для графиков, агрегаты, частоты слов и временные ряды считаются заранее один раз
+        """
+        state = copy.copy(self)
+        state.aggregates = self.get_aggregates()
+        state.term_frequencies = self.get_term_frequencies()
+        state.time_rollup = self.get_time_rollup()
+        state.df = self.df[['rating', 'sentiment_score']]
+        state._word_clouds = {}
+        state.headless = True
+        return state
+
+    @traced
+    def render_charts(self, charts=None, n_workers=None):
+        """
+        Отрисовывает графики отчёта без окон параллельно в пуле процессов (backend Agg)
+        При одном процессе графики рисуются в текущем процессе без смены backend
+        Возвращает для каждого графика путь к файлу и время отрисовки в секундах
+        """
+        if self.df is None:
+            return {}
+
+        charts = list(charts or CHART_METHODS)
+        n_workers = min(n_workers or os.cpu_count() or 1, len(charts))
+
+        start = time.perf_counter()
+        state = self._chart_state()
+
+        if n_workers <= 1:
+            # Backend вызывающего процесса не меняется, иначе блокнот или GUI потеряли бы
+            # интерактивные графики: фигуры строятся с выключенным интерактивным режимом
+            # и закрываются после сохранения (state.headless)
+            with plt.ioff():
+                rendered = [_render_chart(state, name) for name in charts]
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_chart_worker,
+                                     initargs=(state,)) as executor:
+                rendered = list(executor.map(_render_chart_worker, charts))
 
+        total_time = time.perf_counter() - start
+
+        results = {}
+        print(f"Графики ({n_workers} процессов, {self.image_format}, {self.dpi} dpi):")
+        for name, filepath, seconds in rendered:
+            results[name] = {'file': filepath, 'seconds': seconds}
+            print(f"  {name:20} {seconds:.2f} с -> {filepath}")
+        print(f"  Всего: {total_time:.2f} с")
+
+        return results
+
+    @traced
     def find_extreme_reviews(self):
         """Находит самые позитивные и негативные отзывы"""
         if self.df is None:
@@ -205,8 +498,9 @@ class ReviewAnalyzer:
         print("=== ЭКСТРЕМАЛЬНЫЕ ОТЗЫВЫ ===")
 
         # Самые позитивные отзывы
+        stats = self.get_aggregates()
         print("\nСамые позитивные отзывы:")
-        positive_reviews = self.df.nlargest(3, 'sentiment_score')[['text', 'rating', 'sentiment_score']]
+        positive_reviews = self.df.iloc[stats.most_positive][['text', 'rating', 'sentiment_score']]
         for i, (_, row) in enumerate(positive_reviews.iterrows(), 1):
             print(f"{i}. Рейтинг: {row['rating']}, Тональность: {row['sentiment_score']:.3f}")
             print(f"   Текст: {row['text'][:100]}...")
@@ -214,12 +508,13 @@ class ReviewAnalyzer:
 
         # Самые негативные отзывы
         print("Самые негативные отзывы:")
-        negative_reviews = self.df.nsmallest(3, 'sentiment_score')[['text', 'rating', 'sentiment_score']]
+        negative_reviews = self.df.iloc[stats.most_negative][['text', 'rating', 'sentiment_score']]
         for i, (_, row) in enumerate(negative_reviews.iterrows(), 1):
             print(f"{i}. Рейтинг: {row['rating']}, Тональность: {row['sentiment_score']:.3f}")
             print(f"   Текст: {row['text'][:100]}...")
             print()
 
+    @traced
     def analyze_rating_sentiment_mismatch(self):
         """Анализирует несоответствия между рейтингом и тональностью"""
         if self.df is None:
@@ -245,11 +540,19 @@ class ReviewAnalyzer:
                 print(f"Текст: {row['text']}")
                 print()
 
-    def create_interactive_dashboard(self):
-        """Создает интерактивный дашборд с Plotly"""
+    @traced
+    def create_interactive_dashboard(self, aggregated=None, sample_size=2000, bins=50):
+        """
+        Создает интерактивный дашборд с Plotly
+        aggregated=True - в HTML попадают только агрегаты (см. _add_aggregated_traces),
+        None - агрегаты включаются автоматически для больших данных
+        """
         if self.df is None:
             return
 
+        if aggregated is None:
+            aggregated = len(self.df) >= AGGREGATED_DASHBOARD_ROWS
+
         # Создаем подграфики
         fig = make_subplots(
             rows=2, cols=2,
@@ -260,12 +563,26 @@ class ReviewAnalyzer:
         )
 
         # График 1: Распределение рейтингов
-        rating_counts = self.df['rating'].value_counts().sort_index()
+        rating_counts = self.get_aggregates().rating_distribution
         fig.add_trace(
             go.Bar(x=rating_counts.index, y=rating_counts.values, name='Рейтинги'),
             row=1, col=1
         )
 
+        if aggregated:
+            self._add_aggregated_traces(fig, sample_size, bins)
+        else:
+            self._add_raw_traces(fig)
+
+        fig.update_layout(height=800, title_text="Дашборд анализа отзывов")
+        fig.write_html('data/external/dashboard.html')
+        record_file_written('data/external/dashboard.html')
+        print("Интерактивный дашборд сохранен в data/external/dashboard.html")
+
+        return fig
+
+    def _add_raw_traces(self, fig):
+        """Графики 2-4 дашборда по всем отзывам (для небольших данных)"""
         # График 2: Scatter plot
         fig.add_trace(
             go.Scatter(
@@ -296,12 +613,72 @@ class ReviewAnalyzer:
                 row=2, col=2
             )
 
-        fig.update_layout(height=800, title_text="Дашборд анализа отзывов")
-        fig.write_html('data/external/dashboard.html')
-        print("Интерактивный дашборд сохранен в data/external/dashboard.html")
+    def _add_aggregated_traces(self, fig, sample_size=2000, bins=50):
+        """
+        Графики 2-4 дашборда по агрегатам: размер HTML не зависит от числа отзывов
+        Тепловая карта плотности и стратифицированная выборка точек (WebGL) вместо
+        всех точек, заранее посчитанные гистограмма и статистики ящиков с усами
+        """
+        # График 2: плотность отзывов по рейтингу и тональности + выборка точек
+        ratings = self.get_aggregates().rating_distribution.index.to_numpy()
+        sentiment_edges = np.linspace(-1, 1, bins + 1)
+        density, _, _ = np.histogram2d(
+            self.df['rating'].to_numpy(dtype=np.float64),
+            np.clip(self.df['sentiment_score'].to_numpy(dtype=np.float64), -1, 1),
+            bins=[np.append(ratings - 0.5, ratings[-1] + 0.5), sentiment_edges]
+        )
+        fig.add_trace(
+            go.Heatmap(
+                x=ratings,
+                y=(sentiment_edges[:-1] + sentiment_edges[1:]) / 2,
+                z=density.T,
+                colorscale='Blues',
+                showscale=False,
+                name='Плотность',
+                hovertemplate='Рейтинг: %{x}<br>Тональность: %{y:.2f}<br>Отзывов: %{z}<extra></extra>'
+            ),
+            row=1, col=2
+        )
 
-        return fig
+        sample = self.df.iloc[stratified_sample(self.df, 'rating', sample_size)]
+        fig.add_trace(
+            go.Scattergl(
+                x=sample['rating'],
+                y=sample['sentiment_score'],
+                mode='markers',
+                marker={'size': 4, 'opacity': 0.5},
+                name='Тональность vs Рейтинг (выборка)',
+                text=sample['text'].str[:100],
+                hovertemplate='Рейтинг: %{x}<br>Тональность: %{y:.3f}<br>%{text}...'
+            ),
+            row=1, col=2
+        )
+
+        # График 3: гистограмма тональности по готовым корзинам
+        histogram = histogram_bins(self.df['sentiment_score'], bins)
+        fig.add_trace(
+            go.Bar(x=histogram['center'], y=histogram['count'], width=histogram['width'], name='Тональность'),
+            row=2, col=1
+        )
 
+        # График 4: ящики с усами длины отзывов по статистикам групп
+        for rating, stats in box_stats(self.df, 'word_count', 'rating').iterrows():
+            fig.add_trace(
+                go.Box(
+                    x=[f'Рейтинг {rating}'],
+                    q1=[stats['q1']],
+                    median=[stats['median']],
+                    q3=[stats['q3']],
+                    mean=[stats['mean']],
+                    lowerfence=[stats['lowerfence']],
+                    upperfence=[stats['upperfence']],
+                    name=f'Рейтинг {rating}',
+                    showlegend=False
+                ),
+                row=2, col=2
+            )
+
+    @traced
     def generate_insights(self):
         """Генерирует основные инсайты из анализа"""
         if self.df is None:
@@ -309,10 +686,12 @@ class ReviewAnalyzer:
 
         print("=== ОСНОВНЫЕ ИНСАЙТЫ ===")
 
+        stats = self.get_aggregates()
+
         # Общая статистика
-        total_reviews = len(self.df)
-        avg_rating = self.df['rating'].mean()
-        positive_ratio = len(self.df[self.df['sentiment_category'] == 'Позитивная']) / total_reviews * 100
+        total_reviews = stats.count
+        avg_rating = stats.rating_mean
+        positive_ratio = stats.share('Позитивная')
 
         print(f"1. Общий анализ:")
         print(f"   - Проанализировано {total_reviews} отзывов")
@@ -320,7 +699,7 @@ class ReviewAnalyzer:
         print(f"   - Позитивных отзывов: {positive_ratio:.1f}%")
 
         # Корреляция
-        correlation = self.df['rating'].corr(self.df['sentiment_score'])
+        correlation = stats.correlation
         print(f"\n2. Соответствие рейтинга и тональности:")
         print(f"   - Корреляция: {correlation:.3f}")
         if correlation > 0.5:
@@ -331,25 +710,25 @@ class ReviewAnalyzer:
             print("   - Слабое соответствие между рейтингом и тональностью")
 
         # Распределение по рейтингам
-        rating_dist = self.df['rating'].value_counts().sort_index()
-        most_common_rating = rating_dist.idxmax()
+        most_common_rating = stats.rating_distribution.idxmax()
         print(f"\n3. Распределение рейтингов:")
         print(f"   - Наиболее частый рейтинг: {most_common_rating}")
-        print(f"   - Высокие рейтинги (4-5): {(rating_dist[4] + rating_dist[5]) / total_reviews * 100:.1f}%")
-        print(f"   - Низкие рейтинги (1-2): {(rating_dist[1] + rating_dist[2]) / total_reviews * 100:.1f}%")
+        print(f"   - Высокие рейтинги (4-5): {stats.rating_share([4, 5]):.1f}%")
+        print(f"   - Низкие рейтинги (1-2): {stats.rating_share([1, 2]):.1f}%")
 
         # Длина отзывов
-        avg_length = self.df['word_count'].mean()
+        avg_length = stats.word_count_mean
         print(f"\n4. Характеристики отзывов:")
         print(f"   - Средняя длина: {avg_length:.1f} слов")
 
         # Топ проблемы (если есть негативные отзывы)
-        negative_reviews = self.df[self.df['sentiment_category'] == 'Негативная']
-        if len(negative_reviews) > 0:
+        negative_count = stats.sentiment_distribution.get('Негативная', 0)
+        if negative_count > 0:
             print(f"\n5. Негативные отзывы:")
-            print(f"   - Количество: {len(negative_reviews)} ({len(negative_reviews) / total_reviews * 100:.1f}%)")
+            print(f"   - Количество: {negative_count} ({stats.share('Негативная'):.1f}%)")
             print("   - Основные проблемы можно выявить из анализа негативных отзывов")
 
+    @traced
     def run_full_analysis(self):
         """Запускает полный анализ"""
         print("Запуск полного анализа отзывов...")
@@ -359,21 +738,27 @@ class ReviewAnalyzer:
             return
 
         # Создаем директорию для результатов
-        import os
         os.makedirs('data/external', exist_ok=True)
 
         # Базовая статистика
         self.basic_statistics()
+        self.distribution_summary()
 
         # Корреляционный анализ
         self.correlation_analysis()
 
+        # Разбивка по темам
+        self.topic_analysis()
+
         # Графики
         print("\nСоздание графиков...")
-        self.create_rating_distribution_plot()
-        self.create_sentiment_analysis_plot()
-        self.create_word_cloud()
-        self.create_time_series_plot()
+        if self.headless:
+            self.render_charts()
+        else:
+            self.create_rating_distribution_plot()
+            self.create_sentiment_analysis_plot()
+            self.create_word_cloud()
+            self.create_time_series_plot()
 
         # Экстремальные отзывы
         self.find_extreme_reviews()
@@ -391,6 +776,29 @@ class ReviewAnalyzer:
         print("Результаты сохранены в папке data/external/")
 
 
+# Анализатор внутри процесса отрисовки, создаётся один раз при запуске процесса
+_chart_analyzer = None
+
+
+def _init_chart_worker(analyzer):
+    """Переключает процесс на backend Agg и запоминает анализатор"""
+    global _chart_analyzer
+    plt.switch_backend('Agg')
+    _chart_analyzer = analyzer
+
+
+def _render_chart(analyzer, name):
+    """Строит один график и возвращает путь к файлу и время отрисовки"""
+    start = time.perf_counter()
+    filepath = getattr(analyzer, CHART_METHODS[name])()
+    return name, filepath, time.perf_counter() - start
+
+
+def _render_chart_worker(name):
+    """Строит один график в процессе пула"""
+    return _render_chart(_chart_analyzer, name)
+
+
 if __name__ == "__main__":
-    analyzer = ReviewAnalyzer()
+    analyzer = ReviewAnalyzer(headless='--headless' in sys.argv, exclude_duplicates='--exclude-duplicates' in sys.argv)
     analyzer.run_full_analysis()
\ No newline at end of file
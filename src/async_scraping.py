@@ -0,0 +1,123 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import aiohttp
+
+from scraping import ReviewScraper
+from instrumentation import traced, record_bytes
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов (token bucket)
+    Пополняется со скоростью rate токенов в секунду, вмещает до capacity токенов
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Ждёт, пока в ведре появится токен, и забирает его"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncReviewScraper(ReviewScraper):
+    """
+    Асинхронный скрапер отзывов на aiohttp
+    Пул соединений с ограничением на хост, token bucket на каждый хост,
+    повторы с экспоненциальной задержкой и случайным разбросом,
+    разбор HTML в пуле потоков, чтобы не блокировать event loop
+    """
+
+    # Статусы, при которых запрос имеет смысл повторить
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, storage=None, max_connections=100, per_host_limit=10, rate=20.0, burst=None,
+                 max_retries=3, backoff=0.5, timeout=10, parse_workers=4):
+        super().__init__(storage)
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.parse_workers = parse_workers
+        self.buckets = {}
+
+    def _bucket(self, url):
+        """Возвращает token bucket для хоста из URL"""
+        host = urlparse(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return self.buckets[host]
+
+    async def _fetch(self, session, url):
+        """Скачивает страницу с учётом лимита частоты и повторами при ошибках"""
+        for attempt in range(self.max_retries + 1):
+            await self._bucket(url).acquire()
+
+            try:
+                async with session.get(url) as response:
+                    if response.status not in self.RETRY_STATUSES:
+                        response.raise_for_status()
+                        record_bytes(read=response.content_length or 0)
+                        return await response.text()
+                    error = f"HTTP {response.status}"
+            except aiohttp.ClientResponseError as e:
+                # Ошибки клиента (4xx кроме 429) повторять бесполезно
+                print(f"Ошибка при загрузке {url}: {e}")
+                return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+
+            if attempt < self.max_retries:
+                # Экспоненциальная задержка с полным случайным разбросом
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+        print(f"Не удалось загрузить {url} после {self.max_retries + 1} попыток: {error}")
+        return None
+
+    async def _scrape_page(self, session, parser_pool, url):
+        """Скачивает страницу и разбирает её в пуле потоков"""
+        html = await self._fetch(session, url)
+        if html is None:
+            return []
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(parser_pool, self.parse_reviews_page, html)
+
+    async def scrape_pages_async(self, urls):
+        """Параллельно скачивает и разбирает страницы, сохраняя порядок URL"""
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.per_host_limit)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        with ThreadPoolExecutor(max_workers=self.parse_workers) as parser_pool:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                             headers=dict(self.session.headers)) as session:
+                pages = await asyncio.gather(*(self._scrape_page(session, parser_pool, url) for url in urls))
+
+        return [review for page in pages for review in page]
+
+    @traced
+    def scrape_pages(self, urls, delay=None):
+        """Синхронная обёртка над scrape_pages_async (delay не используется: частоту задаёт rate)"""
+        self.buckets = {}
+        return asyncio.run(self.scrape_pages_async(urls))
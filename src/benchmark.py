@@ -0,0 +1,493 @@
+"""
+Бенчмарки производительности пайплайна анализа отзывов
+Запуск: python benchmark.py [количество_строк]
+Набор бенчмарков на синтетических данных с результатами в JSON:
+python benchmark.py --suite [количество_строк] [--output benchmark_results.json]
+"""
+
+import argparse
+import contextlib
+import html
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from aggregates import ReviewAggregates
+from analysis import ReviewAnalyzer
+from async_scraping import AsyncReviewScraper
+from indexing import InvertedIndex, ReviewIndex, split_words
+from lemmatizer import Lemmatizer
+from pipeline import peak_memory_mb
+from processing import ReviewProcessor
+from rollups import TimeSeriesRollup
+from scraping import ReviewScraper
+from storage import CsvStorage, ParquetStorage
+from synthetic import generate_reviews
+
+
+def make_reviews(n_rows, filepath='data/raw/reviews.csv'):
+    """Размножает сырые отзывы до нужного количества строк"""
+    df = pd.read_csv(filepath, encoding='utf-8')
+    repeats = n_rows // len(df) + 1
+    return pd.concat([df] * repeats, ignore_index=True).head(n_rows)
+
+
+def measure(func, *args):
+    """Возвращает результат функции и время её выполнения в секундах"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark_sentiment(processor, texts):
+    """Сравнивает построчный и пакетный анализ тональности"""
+    clean_texts = texts.apply(processor.clean_text)
+
+    row_scores, row_time = measure(clean_texts.apply, processor.get_sentiment_score)
+    batch_scores, batch_time = measure(processor.get_sentiment_scores, clean_texts)
+
+    if not row_scores.astype(float).equals(batch_scores):
+        raise AssertionError("Пакетный анализ тональности расходится с построчным")
+
+    return {
+        'rows': len(texts),
+        'row_rows_per_sec': len(texts) / row_time,
+        'batch_rows_per_sec': len(texts) / batch_time,
+        'speedup': row_time / batch_time
+    }
+
+
+def benchmark_parallel(processor, n_rows, n_workers=None):
+    """Сравнивает последовательную и параллельную обработку отзывов"""
+    df = make_reviews(n_rows)
+
+    serial_df, serial_time = measure(processor.process_reviews, df)
+    parallel_df, parallel_time = measure(processor.process_reviews_parallel, df, n_workers)
+
+    if serial_df.to_csv(index=False) != parallel_df.to_csv(index=False):
+        raise AssertionError("Параллельная обработка расходится с последовательной")
+
+    return {
+        'rows': n_rows,
+        'serial_rows_per_sec': n_rows / serial_time,
+        'parallel_rows_per_sec': n_rows / parallel_time,
+        'speedup': serial_time / parallel_time
+    }
+
+
+def benchmark_storage(processed_df, columns=('rating', 'sentiment_score')):
+    """Сравнивает время загрузки и размер файлов CSV и Parquet"""
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, storage in [('csv', CsvStorage()), ('parquet', ParquetStorage())]:
+            filepath = os.path.join(tmp_dir, f'processed_reviews{storage.extension}')
+
+            _, save_time = measure(storage.save, processed_df, filepath)
+            _, load_time = measure(storage.load, filepath)
+            _, projected_time = measure(storage.load, filepath, list(columns))
+
+            results[name] = {
+                'file_size_mb': os.path.getsize(filepath) / 1024 ** 2,
+                'save_sec': save_time,
+                'load_sec': load_time,
+                'load_projected_sec': projected_time
+            }
+
+    return results
+
+
+def render_reviews_page(reviews):
+    """Собирает HTML страницу с отзывами в разметке, которую понимает parse_reviews_page"""
+    items = ''.join(
+        f'<div class="review" data-rating="{review["rating"]}">'
+        f'<span class="review-author">{html.escape(review["author"])}</span>'
+        f'<time datetime="{review["date"]}">{review["date"]}</time>'
+        f'<p class="review-text">{html.escape(review["text"])}</p>'
+        f'</div>'
+        for review in reviews
+    )
+    return f'<html><head><meta charset="utf-8"></head><body>{items}</body></html>'
+
+
+def start_fixture_server(page_html, latency=0.02):
+    """
+    Запускает локальный HTTP сервер, который отдаёт одну и ту же страницу с отзывами
+    по любому пути с задержкой latency секунд. Возвращает сервер и его адрес
+    """
+    body = page_html.encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def benchmark_scraping(n_pages=200, latency=0.02):
+    """Сравнивает пропускную способность синхронного и асинхронного скрапера (страниц в секунду)"""
+    reviews = make_reviews(20).to_dict('records')
+    server, base_url = start_fixture_server(render_reviews_page(reviews), latency)
+    urls = [f'{base_url}/reviews?page={page}' for page in range(n_pages)]
+
+    try:
+        sync_reviews, sync_time = measure(ReviewScraper().scrape_pages, urls, (0, 0))
+        async_reviews, async_time = measure(AsyncReviewScraper(rate=1000).scrape_pages, urls)
+    finally:
+        server.shutdown()
+
+    if sync_reviews != async_reviews:
+        raise AssertionError("Асинхронный скрапер вернул другие отзывы")
+
+    return {
+        'pages': n_pages,
+        'sync_pages_per_sec': n_pages / sync_time,
+        'async_pages_per_sec': n_pages / async_time,
+        'speedup': sync_time / async_time
+    }
+
+
+def benchmark_lemmatizer(clean_texts, uncached_rows=10000):
+    """
+    Скорость лемматизации (слов в секунду): без кэша (нормализация каждого слова)
+    на первых uncached_rows отзывах, с холодным и с прогретым кэшем на всех отзывах
+    """
+    clean_texts = list(clean_texts)
+    lemmatizer = Lemmatizer()
+
+    sample_tokens = [token for text in clean_texts[:uncached_rows] for token in split_words(text)]
+    normalize = lemmatizer._normalizer()
+    _, uncached_time = measure(lambda tokens: [normalize(token) for token in tokens], sample_tokens)
+
+    _, cold_time = measure(lemmatizer.lemmatize_texts, clean_texts)
+    cold_stats = lemmatizer.stats()
+
+    lemmatizer.reset_stats()
+    _, warm_time = measure(lemmatizer.lemmatize_texts, clean_texts)
+    warm_stats = lemmatizer.stats()
+
+    return {
+        'rows': len(clean_texts),
+        'backend': lemmatizer.backend,
+        'tokens': warm_stats['tokens'],
+        'unique_tokens': cold_stats['misses'],
+        'uncached_tokens_per_sec': len(sample_tokens) / uncached_time if uncached_time else None,
+        'cold_tokens_per_sec': cold_stats['tokens'] / cold_time,
+        'warm_tokens_per_sec': warm_stats['tokens'] / warm_time,
+        'cold_hit_rate': cold_stats['hit_rate'],
+        'warm_hit_rate': warm_stats['hit_rate']
+    }
+
+
+def make_search_corpus(n_rows, vocabulary_size=20000, words_per_review=20, seed=42):
+    """
+    Синтетический корпус для поиска: списки слов отзывов из словаря, в который входят
+    слова тональности. Частоты слов распределены по закону Ципфа, как в живых текстах
+    """
+    processor = ReviewProcessor()
+    lexicon = processor.positive_words + processor.negative_words + ['доставка', 'брак', 'качество']
+    vocabulary = np.array(lexicon + [f'слово{i}' for i in range(vocabulary_size - len(lexicon))])
+
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    words = rng.choice(vocabulary, size=n_rows * words_per_review, p=weights / weights.sum())
+
+    return words.reshape(n_rows, words_per_review).tolist()
+
+
+def benchmark_search(n_rows=1000000, queries=('доставка', 'доставка брак', 'доставка OR брак',
+                                               'отличный качество рекомендую', 'слово100 OR слово5000'),
+                     repeats=20):
+    """Время построения инвертированного индекса и задержка AND/OR запросов (мс на запрос)"""
+    token_lists = make_search_corpus(n_rows)
+    index, build_time = measure(InvertedIndex.from_token_lists, token_lists)
+
+    results = {'rows': n_rows, 'terms': len(index.terms), 'build_sec': build_time,
+               'index_mb': index.nbytes() / 1024 ** 2,
+               'queries': {}}
+
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            rows = index.search(query)
+        results['queries'][query] = {
+            'hits': len(rows),
+            'latency_ms': (time.perf_counter() - start) / repeats * 1000
+        }
+
+    return results
+
+
+def run_benchmarks(n_rows=100000):
+    """Запускает все бенчмарки и выводит результаты"""
+    processor = ReviewProcessor()
+    texts = make_reviews(n_rows)['text']
+
+    print(f"=== БЕНЧМАРК ТОНАЛЬНОСТИ ({n_rows} строк) ===")
+    results = benchmark_sentiment(processor, texts)
+    print(f"Построчно (apply):  {results['row_rows_per_sec']:,.0f} строк/с")
+    print(f"Пакетно (batch):    {results['batch_rows_per_sec']:,.0f} строк/с")
+    print(f"Ускорение:          {results['speedup']:.2f}x")
+
+    print(f"\n=== БЕНЧМАРК ЛЕММАТИЗАЦИИ ({n_rows} строк) ===")
+    lemma_results = benchmark_lemmatizer(texts.apply(processor.clean_text))
+    print(f"Способ:             {lemma_results['backend']}, {lemma_results['tokens']:,} слов, "
+          f"{lemma_results['unique_tokens']:,} уникальных")
+    print(f"Без кэша:           {lemma_results['uncached_tokens_per_sec']:,.0f} слов/с")
+    print(f"Холодный кэш:       {lemma_results['cold_tokens_per_sec']:,.0f} слов/с")
+    print(f"Прогретый кэш:      {lemma_results['warm_tokens_per_sec']:,.0f} слов/с "
+          f"(попаданий {lemma_results['warm_hit_rate']:.1%})")
+
+    print(f"\n=== БЕНЧМАРК ПАРАЛЛЕЛЬНОЙ ОБРАБОТКИ ({n_rows} строк) ===")
+    parallel_results = benchmark_parallel(processor, n_rows)
+    print(f"Последовательно:    {parallel_results['serial_rows_per_sec']:,.0f} строк/с")
+    print(f"Параллельно:        {parallel_results['parallel_rows_per_sec']:,.0f} строк/с")
+    print(f"Ускорение:          {parallel_results['speedup']:.2f}x")
+
+    print(f"\n=== БЕНЧМАРК ХРАНИЛИЩА ({n_rows} строк) ===")
+    processed_df = processor._add_review_features(make_reviews(n_rows))
+    storage_results = benchmark_storage(processed_df)
+    for name, values in storage_results.items():
+        print(f"{name:8} размер: {values['file_size_mb']:.2f} МБ, загрузка: {values['load_sec']:.3f} с, "
+              f"только rating/sentiment_score: {values['load_projected_sec']:.3f} с")
+
+    print("\n=== БЕНЧМАРК СКРАПИНГА (локальный сервер) ===")
+    scraping_results = benchmark_scraping()
+    print(f"Синхронно:          {scraping_results['sync_pages_per_sec']:,.1f} страниц/с")
+    print(f"Асинхронно:         {scraping_results['async_pages_per_sec']:,.1f} страниц/с")
+    print(f"Ускорение:          {scraping_results['speedup']:.2f}x")
+
+    print("\n=== БЕНЧМАРК ПОЛНОТЕКСТОВОГО ПОИСКА (1 000 000 синтетических отзывов) ===")
+    search_results = benchmark_search()
+    print(f"Построение индекса: {search_results['build_sec']:.2f} с, {search_results['terms']:,} слов, "
+          f"{search_results['index_mb']:.1f} МБ")
+    for query, values in search_results['queries'].items():
+        print(f"{query!r:32} найдено: {values['hits']:>9,}, {values['latency_ms']:.2f} мс")
+
+    return {
+        'sentiment': results,
+        'lemmatizer': lemma_results,
+        'parallel': parallel_results,
+        'storage': storage_results,
+        'scraping': scraping_results,
+        'search': search_results
+    }
+
+
+def run_isolated(func, *args):
+    """
+    Запускает бенчмарк в отдельном процессе (fork), чтобы пиковая память (RSS)
+    относилась только к нему. Возвращает результат функции, время и пик памяти в МБ
+    Без fork (Windows) бенчмарк выполняется в текущем процессе
+    """
+    def target(connection):
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                result = func(*args)
+                seconds = time.perf_counter() - start
+            connection.send((result, seconds, peak_memory_mb(), None))
+        except Exception as e:
+            connection.send((None, 0.0, peak_memory_mb(), repr(e)))
+        finally:
+            connection.close()
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func(*args)
+        return result, time.perf_counter() - start, peak_memory_mb()
+
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=target, args=(sender,))
+    process.start()
+    sender.close()
+    result, seconds, peak_mb, error = receiver.recv()
+    process.join()
+
+    if error is not None:
+        raise RuntimeError(f"Бенчмарк {func.__name__} завершился с ошибкой: {error}")
+
+    return result, seconds, peak_mb
+
+
+def suite_clean_text(processor, raw_df):
+    """Построчная очистка текста (ReviewProcessor.clean_text)"""
+    raw_df['text'].apply(processor.clean_text)
+
+
+def suite_process_reviews(processor, raw_df):
+    """Полная обработка отзывов (ReviewProcessor.process_reviews)"""
+    processor.process_reviews(raw_df)
+
+
+def suite_extract_keywords(processor, processed_df):
+    """TF-IDF ключевые слова по очищенным текстам"""
+    processor.extract_keywords(processed_df['clean_text'], cleaned=True)
+
+
+def suite_lemmatize(processed_df):
+    """Лемматизация очищенных текстов с холодным и прогретым кэшем"""
+    return benchmark_lemmatizer(processed_df['clean_text'].fillna(''))
+
+
+def suite_storage(processed_df, storage):
+    """Сохранение и загрузка обработанных данных: время каждого шага и размер файла"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, f'processed_reviews{storage.extension}')
+        _, save_time = measure(storage.save, processed_df, filepath)
+        _, load_time = measure(storage.load, filepath)
+
+        return {
+            'save_sec': save_time,
+            'load_sec': load_time,
+            'file_size_mb': os.path.getsize(filepath) / 1024 ** 2
+        }
+
+
+def suite_analyzer_stats(processed_df):
+    """Сводная статистика и текстовые отчёты ReviewAnalyzer"""
+    analyzer = ReviewAnalyzer()
+    analyzer.df = processed_df
+    analyzer.basic_statistics()
+    analyzer.correlation_analysis()
+    analyzer.find_extreme_reviews()
+    analyzer.generate_insights()
+
+
+def suite_analyzer_plots(processed_df):
+    """Отрисовка графиков отчёта без окон (ReviewAnalyzer.render_charts) во временной папке"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.makedirs(os.path.join(tmp_dir, 'data/external'))
+        os.chdir(tmp_dir)
+        try:
+            analyzer = ReviewAnalyzer(headless=True)
+            analyzer.df = processed_df
+            analyzer.term_frequencies = ReviewProcessor().compute_term_frequencies(processed_df)
+            charts = analyzer.render_charts()
+        finally:
+            os.chdir(cwd)
+
+    return {name: values['seconds'] for name, values in charts.items()}
+
+
+def suite_dashboard_prep(processed_df):
+    """Данные, которые дашборд готовит один раз на версию данных: индексы, агрегаты, частоты слов"""
+    timings = {}
+    _, timings['review_index_sec'] = measure(ReviewIndex, processed_df)
+    _, timings['aggregates_sec'] = measure(ReviewAggregates, processed_df)
+    _, timings['time_rollup_sec'] = measure(TimeSeriesRollup().update, processed_df)
+    _, timings['term_frequencies_sec'] = measure(ReviewProcessor().compute_term_frequencies, processed_df)
+    _, timings['search_index_sec'] = measure(ReviewProcessor().build_search_index, processed_df)
+    return timings
+
+
+def git_version():
+    """Короткий хеш текущего коммита (None вне git)"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(n_rows=100000, output='benchmark_results.json', seed=42):
+    """
+    Набор бенчмарков на синтетических отзывах (от 10 тыс. до 10 млн строк)
+    Каждый бенчмарк выполняется в отдельном процессе; для него записываются время,
+    пропускная способность (строк в секунду) и пиковая память. Результаты пишутся в JSON,
+    чтобы сравнивать версии между собой
+    """
+    processor = ReviewProcessor()
+
+    print(f"Генерация {n_rows} синтетических отзывов...")
+    raw_df, generate_time = measure(generate_reviews, n_rows, seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        processed_df = processor.process_reviews(raw_df)
+
+    benchmarks = [
+        ('clean_text', suite_clean_text, (processor, raw_df)),
+        ('process_reviews', suite_process_reviews, (processor, raw_df)),
+        ('extract_keywords', suite_extract_keywords, (processor, processed_df)),
+        ('lemmatize', suite_lemmatize, (processed_df,)),
+        ('storage_csv', suite_storage, (processed_df, CsvStorage())),
+        ('analyzer_stats', suite_analyzer_stats, (processed_df,)),
+        ('analyzer_plots', suite_analyzer_plots, (processed_df,)),
+        ('dashboard_prep', suite_dashboard_prep, (processed_df,))
+    ]
+
+    # Parquet доступен только с pyarrow
+    try:
+        benchmarks.insert(5, ('storage_parquet', suite_storage, (processed_df, ParquetStorage())))
+    except ImportError:
+        print("pyarrow не установлен, бенчмарк Parquet пропущен")
+
+    results = {
+        'version': git_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'rows': n_rows,
+        'seed': seed,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+        'generate_sec': generate_time,
+        'baseline_peak_rss_mb': peak_memory_mb(),
+        'benchmarks': {}
+    }
+
+    print(f"\n=== НАБОР БЕНЧМАРКОВ ({n_rows} строк) ===")
+    for name, func, args in benchmarks:
+        details, seconds, peak_mb = run_isolated(func, *args)
+        results['benchmarks'][name] = {
+            'seconds': seconds,
+            'rows_per_sec': n_rows / seconds if seconds else None,
+            'peak_rss_mb': peak_mb,
+            'details': details
+        }
+        memory = f"{peak_mb:.0f} МБ" if peak_mb is not None else '-'
+        print(f"{name:18} {seconds:8.2f} с  {n_rows / seconds:12,.0f} строк/с  пик памяти {memory}")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {output}")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарки пайплайна анализа отзывов")
+    parser.add_argument('rows', nargs='?', type=int, default=100000, help="количество строк")
+    parser.add_argument('--suite', action='store_true', help="набор бенчмарков на синтетических данных с JSON")
+    parser.add_argument('--output', default='benchmark_results.json', help="файл результатов набора")
+    parser.add_argument('--seed', type=int, default=42, help="seed генератора синтетических отзывов")
+    arguments = parser.parse_args()
+
+    if arguments.suite:
+        run_suite(arguments.rows, arguments.output, arguments.seed)
+    else:
+        run_benchmarks(arguments.rows)
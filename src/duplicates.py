@@ -0,0 +1,201 @@
+"""
+Поиск почти одинаковых отзывов (копипаста, шаблонный спам) через MinHash LSH
+Для каждого отзыва считается MinHash-подпись по шинглам из shingle_size подряд
+идущих слов, подпись делится на полосы (bands), и отзывы с совпадающей полосой
+становятся кандидатами в дубли. Кандидаты объединяются в группы компонентами
+связности, поэтому время работы линейно по числу отзывов, а не квадратично
+Каждая связь проверяется по b-битным MinHash-подписям (младшие 8 бит каждого
+минимума), чтобы случайные совпадения полос не склеивали непохожие отзывы
+"""
+
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from indexing import split_words
+
+# Множитель для полиномиального хеша шинглов и полос (по модулю 2^64)
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def shingle_hashes(texts, shingle_size=3):
+    """
+    Хеши шинглов очищенных текстов: 64-битный хеш каждых shingle_size подряд идущих слов
+    Текст короче shingle_size слов даёт один шингл из всех слов, пустой - ни одного
+    Возвращает хеши шинглов (подряд по отзывам) и число шинглов каждого отзыва
+    """
+    token_lists = [split_words(text) if isinstance(text, str) else [] for text in texts]
+    lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=len(token_lists))
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(len(token_lists), dtype=np.int64)
+
+    # Хеши слов не зависят от части данных, поэтому шинглы совпадают между частями
+    words = np.fromiter(chain.from_iterable(token_lists), dtype=object, count=total)
+    word_hashes = pd.util.hash_array(words)
+
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    counts = np.where(lengths > 0, np.maximum(lengths - shingle_size + 1, 1), 0)
+
+    # Начала шинглов: позиции первых counts[i] слов каждого отзыва
+    shingle_rows = np.repeat(np.arange(len(lengths)), counts)
+    shingle_offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    shingle_starts = starts[shingle_rows] + shingle_offsets
+    row_ends = ends[shingle_rows]
+
+    shingles = np.zeros(len(shingle_starts), dtype=np.uint64)
+    for offset in range(shingle_size):
+        positions = shingle_starts + offset
+        inside = positions < row_ends
+        values = np.where(inside, word_hashes[np.minimum(positions, total - 1)], np.uint64(0))
+        shingles = shingles * HASH_MULTIPLIER + values
+
+    return shingles, counts
+
+
+class NearDuplicateDetector:
+    """
+    Детектор почти одинаковых отзывов, который обрабатывает данные частями
+    partial_fit считает подписи части и хранит от каждой только ключи полос
+    (bands 64-битных чисел на отзыв) и младшие 8 бит минимумов (num_perm байт),
+    group_ids объединяет отзывы с общими полосами, если оценка их похожести
+    по Жаккару не ниже similarity. Порог, с которого отзывы становятся кандидатами,
+    примерно (1 / bands) ** (1 / rows), где rows = num_perm / bands:
+    для 64 перестановок и 16 полос это 0.5
+    """
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=3, similarity=0.5, seed=42):
+        if num_perm % bands:
+            raise ValueError(f"Число перестановок {num_perm} должно делиться на число полос {bands}")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.shingle_size = shingle_size
+        self.similarity = similarity
+
+        # Случайные хеш-функции h(x) = (a * x + b) >> 32 с нечётным a
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+        self.band_keys = []
+        self.fingerprints = []
+        self.has_shingles = []
+        self.n_rows = 0
+
+    @property
+    def threshold(self):
+        """Примерная похожесть по Жаккару, начиная с которой отзывы попадают в одну группу"""
+        return (1 / self.bands) ** (1 / self.rows_per_band)
+
+    def signatures(self, texts):
+        """
+        MinHash-подписи текстов: минимум каждой хеш-функции по шинглам отзыва
+        Возвращает подписи (строки без шинглов - нули) и маску отзывов с шинглами
+        """
+        shingles, counts = shingle_hashes(texts, self.shingle_size)
+        has_shingles = counts > 0
+        signatures = np.zeros((len(counts), self.num_perm), dtype=np.uint64)
+        if not has_shingles.any():
+            return signatures, has_shingles
+
+        group_starts = (np.cumsum(counts) - counts)[has_shingles]
+        for i in range(self.num_perm):
+            hashes = (self.a[i] * shingles + self.b[i]) >> np.uint64(32)
+            signatures[has_shingles, i] = np.minimum.reduceat(hashes, group_starts)
+
+        return signatures, has_shingles
+
+    def partial_fit(self, texts):
+        """Добавляет часть отзывов: считает подписи и запоминает ключи их полос"""
+        signatures, has_shingles = self.signatures(texts)
+
+        keys = np.zeros((len(signatures), self.bands), dtype=np.uint64)
+        for band in range(self.bands):
+            columns = signatures[:, band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            for column in columns.T:
+                keys[:, band] = keys[:, band] * HASH_MULTIPLIER + column
+
+        self.band_keys.append(keys)
+        self.fingerprints.append((signatures & np.uint64(0xFF)).astype(np.uint8))
+        self.has_shingles.append(has_shingles)
+        self.n_rows += len(signatures)
+
+        return self
+
+    def estimate_similarity(self, fingerprints, sources, targets, batch_size=1000000):
+        """
+        Оценка похожести по Жаккару пар отзывов по b-битным подписям: младшие 8 бит
+        совпадают с вероятностью J + (1 - J) / 256
+        """
+        agreement = np.empty(len(sources), dtype=np.float64)
+        for start in range(0, len(sources), batch_size):
+            end = start + batch_size
+            agreement[start:end] = (fingerprints[sources[start:end]] == fingerprints[targets[start:end]]).mean(axis=1)
+
+        return (agreement - 1 / 256) / (1 - 1 / 256)
+
+    def group_ids(self):
+        """
+        Номер группы почти одинаковых отзывов для каждой строки в порядке добавления
+        (-1 - у отзыва нет похожих). Группы нумеруются по первому отзыву группы
+        """
+        if self.n_rows == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        has_shingles = np.concatenate(self.has_shingles)
+        fingerprints = np.concatenate(self.fingerprints)
+        rows = np.flatnonzero(has_shingles)
+
+        # Каждый отзыв связывается с первым отзывом, у которого совпала та же полоса,
+        # если их подписи достаточно похожи
+        sources = []
+        targets = []
+        for band in range(self.bands):
+            keys = np.concatenate([chunk[:, band] for chunk in self.band_keys])[rows]
+            codes, uniques = pd.factorize(keys)
+            first = np.empty(len(uniques), dtype=np.int64)
+            first[codes[::-1]] = rows[::-1]
+            linked = first[codes] != rows
+            band_sources = rows[linked]
+            band_targets = first[codes][linked]
+
+            similar = self.estimate_similarity(fingerprints, band_sources, band_targets) >= self.similarity
+            sources.append(band_sources[similar])
+            targets.append(band_targets[similar])
+
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+        graph = sparse.coo_matrix(
+            (np.ones(len(sources), dtype=np.int8), (sources, targets)),
+            shape=(self.n_rows, self.n_rows)
+        )
+        _, labels = connected_components(graph, directed=False)
+
+        sizes = np.bincount(labels)
+        duplicated = sizes[labels] > 1
+        group_ids = np.full(self.n_rows, -1, dtype=np.int64)
+        group_ids[duplicated] = pd.factorize(labels[duplicated])[0]
+
+        return group_ids
+
+
+def find_near_duplicates(texts, chunksize=100000, **params):
+    """Номера групп почти одинаковых отзывов для колонки очищенных текстов (-1 - без дублей)"""
+    detector = NearDuplicateDetector(**params)
+    texts = pd.Series(texts)
+    for start in range(0, len(texts), chunksize):
+        detector.partial_fit(texts.iloc[start:start + chunksize].tolist())
+
+    return detector.group_ids()
+
+
+def duplicate_mask(group_ids):
+    """Строки, которые повторяют более ранний отзыв своей группы (первый отзыв группы остаётся)"""
+    groups = pd.Series(group_ids)
+    return ((groups >= 0) & groups.duplicated()).to_numpy()
@@ -0,0 +1,225 @@
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Очистка текста в ReviewProcessor.clean_text: пробелы и символы, которые удаляются
+WHITESPACE_PATTERN = re.compile(r'\s+')
+SPECIAL_CHARS_PATTERN = re.compile(r'[^\w\s!?.,]')
+
+# Знаки препинания, которые остаются после ReviewProcessor.clean_text и отделяют слова
+PUNCTUATION_TABLE = str.maketrans('!?.,', '    ')
+
+
+def split_words(text):
+    """Разбивает очищенный текст на слова без знаков препинания"""
+    return text.translate(PUNCTUATION_TABLE).split()
+
+
+def clean_words(text):
+    """Слова произвольного текста после той же очистки, что и у индексированных отзывов ('Wi-Fi' -> 'wifi')"""
+    return split_words(SPECIAL_CHARS_PATTERN.sub('', text).lower())
+
+
+def descending_order(values):
+    """
+    Порядок строк по убыванию значения; при равных значениях строки
+    остаются в исходном порядке (устойчивая сортировка)
+    """
+    values = np.asarray(values)
+    n_rows = len(values)
+    ascending_reversed = np.argsort(values[::-1], kind='stable')
+    return (n_rows - 1 - ascending_reversed)[::-1]
+
+
+class ReviewIndex:
+    """
+    Индекс обработанных отзывов для фильтрации и постраничного вывода
+    Хранит номера строк для каждой пары (рейтинг, тональность) и заранее
+    отсортированные порядки строк по каждому ключу сортировки, поэтому запрос
+    не копирует и не сортирует весь датафрейм
+    """
+
+    SORT_KEYS = ('date', 'rating', 'sentiment_score')
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+
+        # Номера строк (по возрастанию) для каждой пары (рейтинг, тональность)
+        ratings = df['rating'].to_numpy()
+        sentiments = df['sentiment_category'].astype(str).to_numpy()
+        pairs = pd.MultiIndex.from_arrays([ratings, sentiments])
+        codes, uniques = pd.factorize(pairs)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+
+        self.groups = {}
+        for rows in np.split(order, bounds):
+            if len(rows):
+                rating, sentiment = uniques[codes[rows[0]]]
+                self.groups[(rating, sentiment)] = rows
+
+        # Порядок строк по убыванию каждого ключа и место каждой строки в этом порядке
+        self.orders = {}
+        self.ranks = {}
+        for key in self.SORT_KEYS:
+            values = df[key].to_numpy()
+            if key == 'date':
+                values = values.astype('datetime64[ns]').view('int64')
+            self.orders[key] = descending_order(values)
+            self.ranks[key] = np.empty(self.n_rows, dtype=np.int64)
+            self.ranks[key][self.orders[key]] = np.arange(self.n_rows)
+
+    def filter_rows(self, rating=None, sentiment=None):
+        """Номера строк, подходящих под фильтры (None - без фильтра по этому полю)"""
+        if rating is None and sentiment is None:
+            return None
+
+        matched = [
+            rows for (group_rating, group_sentiment), rows in self.groups.items()
+            if (rating is None or group_rating == rating) and (sentiment is None or group_sentiment == sentiment)
+        ]
+        if not matched:
+            return np.array([], dtype=np.int64)
+
+        return np.sort(np.concatenate(matched))
+
+    def query(self, rating=None, sentiment=None, sort_by='date', offset=0, limit=10):
+        """
+        Страница результатов: возвращает общее число найденных строк и номера строк
+        страницы (позиции для df.iloc), упорядоченные по убыванию sort_by
+        """
+        rows = self.filter_rows(rating, sentiment)
+        return self.top_rows(rows, sort_by, offset, limit)
+
+    def top_rows(self, rows, sort_by='date', offset=0, limit=10):
+        """Выбирает страницу из набора строк rows (None - все строки) по убыванию sort_by"""
+        if rows is None:
+            return self.n_rows, self.orders[sort_by][offset:offset + limit]
+
+        total = len(rows)
+        end = min(offset + limit, total)
+        if offset >= end:
+            return total, np.array([], dtype=np.int64)
+
+        # Частичный отбор первых end строк вместо полной сортировки
+        row_ranks = self.ranks[sort_by][rows]
+        if end < total:
+            selected = np.argpartition(row_ranks, end - 1)[:end]
+        else:
+            selected = np.arange(total)
+        selected = selected[np.argsort(row_ranks[selected])]
+
+        return total, rows[selected[offset:end]]
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс для полнотекстового поиска по отзывам: слово -> номера строк
+    Списки номеров строк хранятся в одном массиве uint32 в виде разностей соседних
+    номеров (delta-кодирование) и границ списков, а слова - в отсортированном массиве
+    строк Python (object): массив фиксированной ширины занимал бы на каждое слово
+    столько, сколько самое длинное слово. В файле слова хранятся одним буфером UTF-8
+    с границами слов
+    """
+
+    # Разделители OR-частей запроса
+    OR_SEPARATORS = ('or', 'или', '|')
+
+    def __init__(self, terms, offsets, deltas, n_rows):
+        self.terms = terms
+        self.offsets = offsets
+        self.deltas = deltas
+        self.n_rows = n_rows
+
+    @classmethod
+    def from_token_lists(cls, token_lists):
+        """Строит индекс по спискам слов отзывов (номер строки = позиция списка)"""
+        token_lists = list(token_lists)
+        n_rows = len(token_lists)
+        lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=n_rows)
+
+        codes, terms = pd.factorize(pd.Series([token for tokens in token_lists for token in tokens], dtype=object))
+        terms = np.asarray(terms, dtype=object)
+
+        # Номера слов в алфавитном порядке, чтобы искать слово бинарным поиском
+        alphabetical = np.argsort(terms)
+        term_ranks = np.empty(len(terms), dtype=np.int64)
+        term_ranks[alphabetical] = np.arange(len(terms))
+
+        # Уникальные пары (слово, строка), отсортированные по слову, затем по строке
+        pairs = np.unique(term_ranks[codes] * max(n_rows, 1) + np.repeat(np.arange(n_rows), lengths))
+        term_ids = pairs // max(n_rows, 1)
+        rows = pairs % max(n_rows, 1)
+
+        # Внутри каждого списка храним разности соседних номеров, первый номер - как есть
+        offsets = np.searchsorted(term_ids, np.arange(len(terms) + 1))
+        deltas = np.diff(rows, prepend=0)
+        deltas[offsets[:-1]] = rows[offsets[:-1]]
+
+        return cls(terms[alphabetical], offsets.astype(np.int64), deltas.astype(np.uint32), n_rows)
+
+    def postings(self, term):
+        """Номера строк, в которых встречается слово (по возрастанию)"""
+        position = np.searchsorted(self.terms, term)
+        if position >= len(self.terms) or self.terms[position] != term:
+            return np.array([], dtype=np.int64)
+
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return np.cumsum(self.deltas[start:end], dtype=np.int64)
+
+    def search(self, query):
+        """
+        Поиск по запросу: слова через пробел - И, части через OR / ИЛИ / | - ИЛИ
+        Например: 'доставка брак' или 'доставка OR брак'. Возвращает номера строк
+        """
+        clauses = [[]]
+        for word in query.lower().split():
+            if word in self.OR_SEPARATORS:
+                clauses.append([])
+            else:
+                # Слова запроса очищаются так же, как тексты отзывов перед индексацией
+                clauses[-1].extend(clean_words(word))
+
+        result = np.array([], dtype=np.int64)
+        for words in clauses:
+            if not words:
+                continue
+
+            # Пересечение начинаем с самого короткого списка
+            lists = sorted((self.postings(word) for word in words), key=len)
+            rows = lists[0]
+            for other in lists[1:]:
+                rows = np.intersect1d(rows, other, assume_unique=True)
+
+            result = np.union1d(result, rows)
+
+        return result
+
+    def nbytes(self):
+        """Размер индекса в памяти в байтах (списки строк, границы и сами слова)"""
+        return (self.deltas.nbytes + self.offsets.nbytes + self.terms.nbytes
+                + sum(sys.getsizeof(term) for term in self.terms))
+
+    def save(self, filepath):
+        """Сохраняет индекс в сжатый файл .npz (слова - буфер UTF-8 и границы слов в нём)"""
+        encoded = [term.encode('utf-8') for term in self.terms]
+        term_bytes = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        term_offsets = np.concatenate([[0], np.cumsum([len(term) for term in encoded], dtype=np.int64)])
+        np.savez_compressed(filepath, term_bytes=term_bytes, term_offsets=term_offsets, offsets=self.offsets,
+                            deltas=self.deltas, n_rows=np.array([self.n_rows]))
+
+    @classmethod
+    def load(cls, filepath):
+        """Загружает индекс из файла .npz"""
+        with np.load(filepath) as data:
+            if 'terms' in data:
+                # Файл старого формата: слова в массиве фиксированной ширины
+                terms = data['terms'].astype(object)
+            else:
+                buffer = data['term_bytes'].tobytes()
+                bounds = data['term_offsets'].tolist()
+                terms = np.array([buffer[start:end].decode('utf-8') for start, end in zip(bounds[:-1], bounds[1:])],
+                                 dtype=object)
+            return cls(terms, data['offsets'], data['deltas'], int(data['n_rows'][0]))
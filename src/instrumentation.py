@@ -0,0 +1,369 @@
+"""
+Инструментирование пайплайна: спаны времени выполнения методов и этапов,
+количество обработанных строк и прочитанных/записанных байт
+Результаты уходят в подключаемые приёмники: JSON-лог, файл метрик Prometheus,
+профиль cProfile/pyinstrument для выбранного спана
+Пока инструментирование выключено, обёртка метода сводится к одной проверке флага,
+а построчные методы (clean_text, get_sentiment_score) не оборачиваются вовсе
+"""
+
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+
+# Включено ли инструментирование (проверяется при каждом вызове обёрнутого метода)
+_enabled = False
+_sinks = []
+# Открытый спан текущего контекста: потоки, запущенные через copy_context().run
+# (этапы пайплайна), видят спан, открытый в запустившем их потоке, как родителя
+_current = contextvars.ContextVar('instrumentation_span', default=None)
+# Байты вложенных спанов из разных потоков складываются в общий родительский спан
+_bytes_lock = threading.Lock()
+
+
+class Span:
+    """Один замер: имя, родительский спан, время, строки и байты ввода-вывода"""
+
+    def __init__(self, name, parent=None, rows=None):
+        self.name = name
+        self.parent = parent
+        self.rows = rows
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.thread = threading.current_thread().name
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'span': self.name,
+            'parent': self.parent.name if self.parent is not None else None,
+            'start': self.start_time,
+            'seconds': self.seconds,
+            'rows': self.rows,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'thread': self.thread,
+            'error': self.error
+        }
+
+
+class JsonLogSink:
+    """Структурированный лог: одна JSON-строка на каждый завершённый спан"""
+
+    def __init__(self, filepath='data/processed/trace.jsonl'):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        self.file = open(filepath, 'a', encoding='utf-8')
+
+    def on_span_start(self, span):
+        pass
+
+    def on_span_end(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class PrometheusSink:
+    """
+    Метрики в текстовом формате Prometheus (для node_exporter textfile collector):
+    суммарное время, число вызовов, строки и байты по каждому спану
+    """
+
+    METRICS = [
+        ('reviews_span_seconds_total', 'seconds', 'Суммарное время выполнения спана, секунды'),
+        ('reviews_span_calls_total', 'calls', 'Количество выполнений спана'),
+        ('reviews_span_rows_total', 'rows', 'Обработано строк'),
+        ('reviews_span_bytes_read_total', 'bytes_read', 'Прочитано байт'),
+        ('reviews_span_bytes_written_total', 'bytes_written', 'Записано байт')
+    ]
+
+    def __init__(self, filepath='data/processed/metrics.prom'):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def on_span_start(self, span):
+        pass
+
+    def on_span_end(self, span):
+        with self.lock:
+            totals = self.totals.setdefault(span.name, dict.fromkeys(['seconds', 'calls', 'rows', 'bytes_read',
+                                                                      'bytes_written'], 0))
+            totals['seconds'] += span.seconds
+            totals['calls'] += 1
+            totals['rows'] += span.rows or 0
+            totals['bytes_read'] += span.bytes_read
+            totals['bytes_written'] += span.bytes_written
+
+    def flush(self):
+        """Перезаписывает файл метрик целиком (через временный файл, чтобы не читать половину)"""
+        with self.lock:
+            lines = []
+            for metric, key, help_text in self.METRICS:
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} counter')
+                for name, totals in sorted(self.totals.items()):
+                    lines.append(f'{metric}{{span="{name}"}} {totals[key]}')
+
+        os.makedirs(os.path.dirname(self.filepath) or '.', exist_ok=True)
+        tmp_path = f'{self.filepath}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.filepath)
+
+    def close(self):
+        self.flush()
+
+
+class ProfilerSink:
+    """
+    Профилирует выбранный спан (например 'stage.process') целиком:
+    cProfile пишет .prof (смотреть через snakeviz или pstats), pyinstrument - .html
+    """
+
+    def __init__(self, span_name, filepath=None, profiler='cprofile'):
+        if profiler == 'pyinstrument' and pyinstrument is None:
+            raise ImportError("Для профилирования pyinstrument установите его: pip install pyinstrument")
+
+        self.span_name = span_name
+        self.profiler = profiler
+        extension = 'html' if profiler == 'pyinstrument' else 'prof'
+        self.filepath = filepath or f'data/processed/profile_{span_name}.{extension}'
+        self.active = {}
+
+    def on_span_start(self, span):
+        if span.name != self.span_name or self.active:
+            return
+
+        if self.profiler == 'pyinstrument':
+            profile = pyinstrument.Profiler()
+            profile.start()
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+        self.active[span] = profile
+
+    def on_span_end(self, span):
+        profile = self.active.pop(span, None)
+        if profile is None:
+            return
+
+        os.makedirs(os.path.dirname(self.filepath) or '.', exist_ok=True)
+        if self.profiler == 'pyinstrument':
+            profile.stop()
+            with open(self.filepath, 'w', encoding='utf-8') as f:
+                f.write(profile.output_html())
+        else:
+            profile.disable()
+            profile.dump_stats(self.filepath)
+        print(f"Профиль {span.name} сохранен в {self.filepath}")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def enable(sinks=None, json_log='data/processed/trace.jsonl', prometheus='data/processed/metrics.prom',
+           profile_span=None, profiler='cprofile'):
+    """
+    Включает инструментирование. По умолчанию пишет JSON-лог и метрики Prometheus;
+    profile_span - имя спана для профилирования (например 'stage.process')
+    """
+    global _enabled, _sinks
+
+    if sinks is None:
+        sinks = []
+        if json_log:
+            sinks.append(JsonLogSink(json_log))
+        if prometheus:
+            sinks.append(PrometheusSink(prometheus))
+        if profile_span:
+            sinks.append(ProfilerSink(profile_span, profiler=profiler))
+
+    _sinks = list(sinks)
+    _enabled = True
+
+
+def enable_from_env():
+    """Включает инструментирование, если задана переменная окружения REVIEWS_TRACE=1"""
+    if os.environ.get('REVIEWS_TRACE') == '1' and not _enabled:
+        enable(profile_span=os.environ.get('REVIEWS_PROFILE') or None)
+
+
+def disable():
+    """Выключает инструментирование и закрывает приёмники"""
+    global _enabled, _sinks
+
+    _enabled = False
+    for sink in _sinks:
+        sink.close()
+    _sinks = []
+
+
+def flush():
+    """Сбрасывает накопленные данные приёмников на диск"""
+    for sink in _sinks:
+        sink.flush()
+
+
+def is_enabled():
+    return _enabled
+
+
+def _flush_before_fork():
+    """Сбрасывает буферы приёмников, чтобы дочерний процесс не унаследовал незаписанные строки"""
+    if _enabled:
+        flush()
+
+
+def _disable_in_child():
+    """
+    Выключает инструментирование в дочернем процессе (пулы обработки и графиков):
+    файлы приёмников остаются у родителя, и записи процессов не перемешиваются
+    """
+    global _enabled, _sinks
+
+    _enabled = False
+    _sinks = []
+    _current.set(None)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_flush_before_fork, after_in_child=_disable_in_child)
+
+
+def current_span():
+    """Открытый спан текущего контекста (None, если нет или инструментирование выключено)"""
+    if not _enabled:
+        return None
+    return _current.get()
+
+
+class span:
+    """
+    Контекстный менеджер спана: with span('stage.process', rows=len(df)) as current: ...
+    При выключенном инструментировании ничего не замеряет
+    """
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.span = None
+        self.token = None
+
+    def __enter__(self):
+        if not _enabled:
+            return None
+
+        self.span = Span(self.name, _current.get(), self.rows)
+        self.token = _current.set(self.span)
+        for sink in _sinks:
+            sink.on_span_start(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.span is None:
+            return False
+
+        self.span.seconds = time.perf_counter() - self.span.started
+        if exc is not None:
+            self.span.error = repr(exc)
+
+        _current.reset(self.token)
+
+        # Байты вложенных спанов входят и в родительский
+        if self.span.parent is not None:
+            with _bytes_lock:
+                self.span.parent.bytes_read += self.span.bytes_read
+                self.span.parent.bytes_written += self.span.bytes_written
+
+        for sink in _sinks:
+            sink.on_span_end(self.span)
+        return False
+
+
+def count_rows(result, args=()):
+    """Строки, обработанные методом: длина результата или первого аргумента-датафрейма"""
+    for value in (result,) + tuple(args):
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return len(value)
+    return None
+
+
+def traced(func=None, name=None):
+    """
+    Декоратор метода: каждый вызов записывается как спан 'Класс.метод'
+    с количеством обработанных строк. Выключенное инструментирование - один вызов
+    функции и проверка флага, поэтому построчные методы не оборачиваются
+    """
+    def decorate(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            with span(span_name) as current:
+                result = func(*args, **kwargs)
+                if current is not None and current.rows is None:
+                    current.rows = count_rows(result, args[1:])
+                return result
+
+        return wrapper
+
+    return decorate(func) if func is not None else decorate
+
+
+def record_rows(rows):
+    """Задаёт количество строк текущего спана"""
+    current = current_span()
+    if current is not None:
+        current.rows = rows
+
+
+def record_bytes(read=0, written=0):
+    """Добавляет прочитанные/записанные байты к текущему спану"""
+    current = current_span()
+    if current is not None:
+        current.bytes_read += read
+        current.bytes_written += written
+
+
+def record_file_read(filepath):
+    """Добавляет к текущему спану размер прочитанного файла"""
+    if _enabled and os.path.exists(filepath):
+        record_bytes(read=os.path.getsize(filepath))
+
+
+def record_file_written(filepath):
+    """Добавляет к текущему спану размер записанного файла"""
+    if _enabled and os.path.exists(filepath):
+        record_bytes(written=os.path.getsize(filepath))
@@ -0,0 +1,150 @@
+"""
+Лемматизация русских слов для анализа тональности и ключевых слов
+Морфологический разбор (pymorphy) дорог для каждого слова, но словарь отзывов
+сильно повторяется, поэтому нормальные формы хранятся в ограниченном LRU-кэше
+по исходному слову: после прогрева почти каждый запрос - попадание в кэш
+Без pymorphy слова приводятся к основе стеммером Snowball из nltk
+"""
+
+from collections import OrderedDict
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from indexing import split_words
+
+try:
+    import pymorphy3 as pymorphy
+except ImportError:
+    try:
+        import pymorphy2 as pymorphy
+    except ImportError:
+        pymorphy = None
+
+try:
+    from nltk.stem.snowball import SnowballStemmer
+except ImportError:
+    SnowballStemmer = None
+
+# Доступные способы нормализации слов в порядке предпочтения
+BACKENDS = ['pymorphy', 'snowball', 'none']
+
+
+def default_backend():
+    """Лучший доступный способ нормализации: pymorphy, затем Snowball, иначе без изменений"""
+    if pymorphy is not None:
+        return 'pymorphy'
+    if SnowballStemmer is not None:
+        return 'snowball'
+    return 'none'
+
+
+class Lemmatizer:
+    """
+    Нормальные формы слов с LRU-кэшем на maxsize слов
+    Статистика кэша (попадания, промахи, число слов) накапливается за всё время работы
+    """
+
+    def __init__(self, maxsize=100000, backend=None):
+        backend = backend or default_backend()
+        if backend not in BACKENDS:
+            raise ValueError(f"Неизвестный способ лемматизации: {backend}. Доступны: {BACKENDS}")
+        if backend == 'pymorphy' and pymorphy is None:
+            raise ImportError("Для лемматизации через pymorphy установите его: pip install pymorphy3")
+        if backend == 'snowball' and SnowballStemmer is None:
+            raise ImportError("Для стемминга Snowball установите nltk: pip install nltk")
+
+        self.backend = backend
+        # Стеммер даёт обрезанные основы ('доставк'), которые нельзя показывать
+        # пользователю: ими сравниваются слова, но не подписываются ключевые слова
+        self.produces_words = backend != 'snowball'
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.tokens = 0
+        self._normalize = None
+
+    def __getstate__(self):
+        # Анализатор создаётся заново в каждом процессе, кэш передаётся как есть
+        state = self.__dict__.copy()
+        state['_normalize'] = None
+        return state
+
+    def _normalizer(self):
+        """Функция нормализации слова (анализатор загружается при первом промахе кэша)"""
+        if self._normalize is None:
+            if self.backend == 'pymorphy':
+                analyzer = pymorphy.MorphAnalyzer()
+                self._normalize = lambda word: analyzer.parse(word)[0].normal_form
+            elif self.backend == 'snowball':
+                self._normalize = SnowballStemmer('russian').stem
+            else:
+                self._normalize = str
+        return self._normalize
+
+    def lemma(self, token):
+        """Нормальная форма слова (из кэша, если слово уже встречалось)"""
+        cache = self.cache
+        if token in cache:
+            self.hits += 1
+            cache.move_to_end(token)
+            return cache[token]
+
+        self.misses += 1
+        lemma = self._normalizer()(token)
+        cache[token] = lemma
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+        return lemma
+
+    def lemmatize_tokens(self, tokens):
+        """Нормальные формы списка слов"""
+        tokens = list(tokens)
+        self.tokens += len(tokens)
+        return [self.lemma(token) for token in tokens]
+
+    def lemmatize_text(self, text):
+        """Очищенный текст, в котором слова заменены нормальными формами"""
+        return ' '.join(self.lemmatize_tokens(split_words(text))) if isinstance(text, str) else ''
+
+    def lemmatize_texts(self, texts):
+        """
+        Лемматизирует колонку очищенных текстов: слова всех текстов собираются
+        в один массив, повторы внутри пакета схлопываются (pd.factorize), и кэш
+        запрашивается один раз на уникальное слово пакета
+        Возвращает список строк из нормальных форм через пробел
+        """
+        token_lists = [split_words(text) if isinstance(text, str) else [] for text in texts]
+        lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=len(token_lists))
+        flat = np.fromiter(chain.from_iterable(token_lists), dtype=object, count=int(lengths.sum()))
+        self.tokens += len(flat)
+
+        codes, uniques = pd.factorize(flat)
+        lemmas = np.array([self.lemma(token) for token in uniques], dtype=object)[codes].tolist()
+
+        ends = np.cumsum(lengths).tolist()
+        starts = [0] + ends[:-1]
+        return [' '.join(lemmas[start:end]) for start, end in zip(starts, ends)]
+
+    def stats(self):
+        """Статистика кэша: слова, запросы, попадания, промахи, доля попаданий и размер"""
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'tokens': self.tokens,
+            'lookups': lookups,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'cache_size': len(self.cache),
+            'maxsize': self.maxsize
+        }
+
+    def reset_stats(self):
+        """Обнуляет статистику, не очищая кэш"""
+        self.hits = 0
+        self.misses = 0
+        self.tokens = 0
@@ -10,9 +10,16 @@ import sys
 # Добавляем src в путь для импорта модулей
 sys.path.append('')
 
+import pandas as pd
+
 from scraping import ReviewScraper
 from processing import ReviewProcessor
-from analysis import ReviewAnalyzer
+from analysis import ReviewAnalyzer, CHART_METHODS
+from aggregates import ReviewAggregates
+from rollups import TimeSeriesRollup
+from sketches import ReviewSketches
+from pipeline import Pipeline
+import instrumentation
 
 
 def create_directories():
@@ -29,65 +36,134 @@ def create_directories():
         print(f"✓ Создана директория: {directory}")
 
 
-def run_full_pipeline():
-    """Запускает полный пайплайн анализа отзывов"""
+def make_analyzer(df, aggregates=None, term_frequencies=None, time_rollup=None, topic_terms=None, sketches=None):
+    """Анализатор над уже загруженными данными и готовыми агрегатами (без чтения с диска)"""
+    analyzer = ReviewAnalyzer(headless=True)
+    analyzer.df = df
+    analyzer.aggregates = aggregates
+    analyzer.term_frequencies = term_frequencies
+    analyzer.time_rollup = time_rollup
+    analyzer.topic_terms = topic_terms
+    analyzer.sketches = sketches
+    return analyzer
+
+
+def build_pipeline(incremental=False):
+    """
+    Граф этапов пайплайна: сбор -> обработка -> ключевые слова и агрегаты ->
+    отчёт, графики и интерактивный дашборд (последние три независимы)
+    При incremental=True обрабатываются только новые или изменённые отзывы
+    """
+    scraper = ReviewScraper()
+    # Результаты по текстам кэшируются на диске: дубли и уже обработанные тексты не пересчитываются;
+    # почти одинаковые отзывы получают номер группы в колонке dup_group_id, а темы - в topic_id
+    processor = ReviewProcessor(memoize=True, persist_text_cache=True, near_duplicates=True, topics=True)
+    storage = processor.storage
+    processed_path = f'data/processed/processed_reviews{storage.extension}'
+    aggregates_path = 'data/processed/aggregates.pkl'
+
+    pipeline = Pipeline()
+
+    # Данные, которыми обмениваются этапы, и как их загрузить, если этап был пропущен
+    pipeline.artifact('raw_reviews', [f'data/raw/reviews{scraper.storage.extension}'], load=processor.load_data)
+    pipeline.artifact('processed_reviews', [processed_path], load=lambda: storage.load(processed_path))
+    pipeline.artifact('time_rollups', [processor.time_rollups_path()],
+                      load=lambda: TimeSeriesRollup.load(storage, processor.time_rollups_path()))
+    pipeline.artifact('term_frequencies', [f'data/processed/term_frequencies{storage.extension}'],
+                      load=processor.load_term_frequencies)
+    pipeline.artifact('sketches', [processor.sketches_path()],
+                      load=lambda: ReviewSketches.load(processor.sketches_path()))
+    pipeline.artifact('topic_terms', [processor.topic_terms_path()], load=processor.load_topic_terms)
+    pipeline.artifact('aggregates', [aggregates_path], load=lambda: pd.read_pickle(aggregates_path))
+    pipeline.artifact('charts', [f'data/external/{name}.png' for name in CHART_METHODS])
+    pipeline.artifact('dashboard', ['data/external/dashboard.html'])
+
+    def scrape():
+        raw_df = scraper.get_sample_data()
+        print(f"✓ Собрано {len(raw_df)} отзывов")
+        return {'raw_reviews': raw_df}
+
+    def process(raw_reviews):
+        if incremental:
+            # Обрабатываем только новые отзывы и сохраняем вместе с уже обработанными
+            processed_df = processor.process_incremental(raw_df=raw_reviews)
+            rollup = TimeSeriesRollup.load(storage, processor.time_rollups_path())
+            sketches = ReviewSketches.load(processor.sketches_path())
+        else:
+            processed_df = processor.process_reviews(raw_reviews)
+            if processed_df is not None:
+                processor.save_processed_data(processed_df)
+                rollup = processor.save_time_rollups(processed_df)
+                sketches = processor.save_sketches(processed_df)
+
+        if processed_df is None:
+            raise RuntimeError("Не удалось обработать данные")
+
+        return {'processed_reviews': processed_df, 'time_rollups': rollup, 'sketches': sketches,
+                'topic_terms': processor.topic_terms}
+
+    def keywords(processed_reviews):
+        return {'term_frequencies': processor.save_term_frequencies(processed_reviews)}
+
+    def aggregates(processed_reviews):
+        stats = ReviewAggregates(processed_reviews)
+        pd.to_pickle(stats, aggregates_path)
+        return {'aggregates': stats}
+
+    def report(processed_reviews, aggregates, sketches, topic_terms):
+        analyzer = make_analyzer(processed_reviews, aggregates, topic_terms=topic_terms, sketches=sketches)
+        analyzer.basic_statistics()
+        analyzer.distribution_summary()
+        analyzer.correlation_analysis()
+        analyzer.topic_analysis()
+        analyzer.find_extreme_reviews()
+        analyzer.analyze_rating_sentiment_mismatch()
+        analyzer.generate_insights()
+
+    def charts(processed_reviews, aggregates, term_frequencies, time_rollups):
+        make_analyzer(processed_reviews, aggregates, term_frequencies, time_rollups).render_charts()
+
+    def dashboard(processed_reviews, aggregates):
+        make_analyzer(processed_reviews, aggregates).create_interactive_dashboard()
+
+    pipeline.stage('scrape', scrape, outputs=['raw_reviews'], always=True)
+    pipeline.stage('process', process, inputs=['raw_reviews'],
+                   outputs=['processed_reviews', 'time_rollups', 'sketches', 'topic_terms'],
+                   params={'incremental': incremental})
+    pipeline.stage('keywords', keywords, inputs=['processed_reviews'], outputs=['term_frequencies'])
+    pipeline.stage('aggregates', aggregates, inputs=['processed_reviews'], outputs=['aggregates'])
+    pipeline.stage('report', report, inputs=['processed_reviews', 'aggregates', 'sketches', 'topic_terms'])
+    pipeline.stage('charts', charts, inputs=['processed_reviews', 'aggregates', 'term_frequencies', 'time_rollups'],
+                   outputs=['charts'])
+    pipeline.stage('dashboard', dashboard, inputs=['processed_reviews', 'aggregates'], outputs=['dashboard'])
+
+    return pipeline
+
+
+def run_full_pipeline(incremental=False, force=False, trace=False, profile_stage=None):
+    """
+    Запускает полный пайплайн анализа отзывов
+    При incremental=True обрабатываются только новые или изменённые отзывы.
+    Этапы, входы которых не изменились с прошлого запуска, пропускаются (force=True - запустить все)
+    trace=True записывает спаны в data/processed/trace.jsonl и метрики в data/processed/metrics.prom,
+    profile_stage - имя этапа, для которого сохраняется профиль cProfile
+    """
     print("=" * 60)
     print("🚀 ЗАПУСК ПОЛНОГО ПАЙПЛАЙНА АНАЛИЗА ОТЗЫВОВ")
     print("=" * 60)
 
-    # 1. Создаем структуру проекта
-    print("\n1️⃣ Создание структуры проекта...")
+    # Создаем структуру проекта
+    print("\nСоздание структуры проекта...")
     create_directories()
 
-    # 2. Сбор данных (скрапинг)
-    print("\n2️⃣ Сбор данных...")
-    scraper = ReviewScraper()
-    try:
-        raw_data = scraper.get_sample_data()
-        print(f"✓ Собрано {len(raw_data)} отзывов")
-    except Exception as e:
-        print(f"❌ Ошибка при сборе данных: {e}")
-        return False
-
-    # 3. Обработка данных
-    print("\n3️⃣ Обработка данных...")
-    processor = ReviewProcessor()
-    try:
-        # Загружаем сырые данные
-        df = processor.load_data()
-        if df is not None:
-            # Обрабатываем
-            processed_df = processor.process_reviews(df)
-            if processed_df is not None:
-                # Сохраняем
-                processor.save_processed_data(processed_df)
+    if trace or profile_stage:
+        instrumentation.enable(profile_span=f'stage.{profile_stage}' if profile_stage else None)
 
-                # Выводим статистику
-                stats = processor.get_summary_stats(processed_df)
-                print("✓ Статистика обработанных данных:")
-                for key, value in stats.items():
-                    if isinstance(value, dict):
-                        print(f"  {key}:")
-                        for k, v in value.items():
-                            print(f"    {k}: {v}")
-                    else:
-                        print(f"  {key}: {value}")
-            else:
-                print("❌ Ошибка при обработке данных")
-                return False
-        else:
-            print("❌ Не удалось загрузить сырые данные")
-            return False
-    except Exception as e:
-        print(f"❌ Ошибка при обработке данных: {e}")
-        return False
-
-    # 4. Анализ данных
-    print("\n4️⃣ Анализ данных...")
-    analyzer = ReviewAnalyzer()
+    print("\nЗапуск этапов...")
     try:
-        analyzer.run_full_analysis()
-        print("✓ Анализ данных завершен")
-    except Exception as e:
-        print(f"❌ Ошибка при анализе данных: {e}")
-        return False
+        with instrumentation.span('pipeline'):
+            results = build_pipeline(incremental).run(force=force)
+    finally:
+        instrumentation.disable()
+
+    return all(result['status'] in ('done', 'skipped') for result in results.values())
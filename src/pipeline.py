@@ -0,0 +1,334 @@
+import contextvars
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from instrumentation import span, count_rows
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def file_fingerprint(path, cache=None):
+    """
+    Хеш содержимого файла (None, если файла нет)
+    cache хранит уже посчитанные хеши по размеру и времени изменения файла
+    """
+    if not os.path.exists(path):
+        return None
+
+    stat = os.stat(path)
+    key = f'{stat.st_size}:{stat.st_mtime_ns}'
+    if cache is not None and cache.get(path, {}).get('stat') == key:
+        return cache[path]['hash']
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    if cache is not None:
+        cache[path] = {'stat': key, 'hash': digest.hexdigest()}
+
+    return digest.hexdigest()
+
+
+def peak_memory_mb():
+    """
+    Пиковая память (RSS) процесса или самого большого из его дочерних процессов в МБ
+    за всё время работы (None, если недоступно). Это максимум процесса, а не отдельного этапа
+    """
+    if resource is None:
+        return None
+
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(usage, children) / 1024
+
+
+class Artifact:
+    """Данные, которыми обмениваются этапы: файлы на диске и способ загрузить их в память"""
+
+    def __init__(self, name, paths=(), load=None):
+        self.name = name
+        self.paths = list(paths)
+        self.load = load
+
+    def fingerprint(self, cache=None):
+        """Общий хеш файлов артефакта (None, если какого-то файла нет)"""
+        hashes = [file_fingerprint(path, cache) for path in self.paths]
+        if None in hashes:
+            return None
+        return hashlib.sha1('|'.join(hashes).encode()).hexdigest()
+
+    def exists(self):
+        """Все файлы артефакта на месте"""
+        return all(os.path.exists(path) for path in self.paths)
+
+
+class Stage:
+    """Этап пайплайна: функция от входных артефактов, которая пишет выходные"""
+
+    def __init__(self, name, func, inputs=(), outputs=(), params=None, always=False):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        # Параметры, от которых зависит результат (входят в отпечаток этапа)
+        self.params = params or {}
+        # Этап-источник (сбор данных) выполняется при каждом запуске: его результат
+        # зависит от внешнего мира, а не от входов. Следующие этапы всё равно пропускаются,
+        # если собранные файлы не изменились
+        self.always = always
+
+
+class StageOutput:
+    """
+    Поток вывода на время запуска пайплайна: печать каждого этапа собирается
+    в буфер его потока, а координирующий цикл выводит буфер целиком после
+    завершения этапа, поэтому строки одновременных этапов не перемешиваются
+    Печать остальных потоков проходит в исходный поток без изменений
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = {}
+
+    def write(self, text):
+        buffer = self.buffers.get(threading.get_ident())
+        if buffer is None:
+            return self.stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def capture(self):
+        """Начинает собирать печать текущего потока"""
+        self.buffers[threading.get_ident()] = io.StringIO()
+
+    def release(self):
+        """Заканчивает сбор и возвращает напечатанное текущим потоком"""
+        buffer = self.buffers.pop(threading.get_ident(), None)
+        return buffer.getvalue() if buffer is not None else ''
+
+
+class Pipeline:
+    """
+    Граф этапов пайплайна
+    Этапы получают данные от предыдущих этапов в памяти, а если предыдущий этап
+    был пропущен - загружают их с диска. Этап пропускается, если отпечаток его входов
+    (хеши входных файлов и параметры) не изменился с прошлого запуска и выходные файлы
+    на месте. Независимые этапы выполняются одновременно в пуле потоков (тяжёлые
+    этапы сами используют пулы процессов). Для каждого этапа записывается время,
+    а в конце выводится пиковая память процесса: этапы идут одновременно
+    и в одном процессе, поэтому память отдельного этапа не измеряется
+    """
+
+    STATUS_LABELS = {
+        'done': 'выполнен',
+        'skipped': 'пропущен',
+        'failed': 'ошибка',
+        'blocked': 'не запущен'
+    }
+
+    def __init__(self, state_path='data/processed/pipeline_state.json', max_workers=4):
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.artifacts = {}
+        self.stages = {}
+        self.producers = {}
+
+    def artifact(self, name, paths=(), load=None):
+        """Объявляет артефакт: его файлы и функцию загрузки с диска"""
+        self.artifacts[name] = Artifact(name, paths, load)
+        return self.artifacts[name]
+
+    def stage(self, name, func, inputs=(), outputs=(), params=None, always=False):
+        """
+        Добавляет этап; входы и выходы - имена объявленных артефактов
+        always=True - этап не пропускается (источники данных, например сбор отзывов)
+        """
+        for artifact in list(inputs) + list(outputs):
+            if artifact not in self.artifacts:
+                raise ValueError(f"Неизвестный артефакт {artifact} в этапе {name}")
+
+        for artifact in outputs:
+            if artifact in self.producers:
+                raise ValueError(f"Артефакт {artifact} уже создаётся этапом {self.producers[artifact]}")
+            self.producers[artifact] = name
+
+        self.stages[name] = Stage(name, func, inputs, outputs, params, always)
+        return self.stages[name]
+
+    def dependencies(self, stage):
+        """Этапы, которые создают входы этапа"""
+        return {self.producers[artifact] for artifact in stage.inputs if artifact in self.producers}
+
+    def _load_state(self):
+        """Отпечатки этапов и хеши файлов с прошлого запуска"""
+        if not os.path.exists(self.state_path):
+            return {'stages': {}, 'files': {}}
+
+        with open(self.state_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_state(self, state):
+        """Сохраняет состояние после каждого этапа, чтобы после ошибки продолжить с места сбоя"""
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+
+    def _stage_fingerprint(self, stage, state):
+        """Отпечаток этапа: имя, параметры и хеши всех входных артефактов"""
+        parts = {'stage': stage.name, 'params': stage.params, 'inputs': {}}
+        for name in stage.inputs:
+            artifact = self.artifacts[name]
+            if artifact.paths:
+                parts['inputs'][name] = artifact.fingerprint(state['files'])
+            else:
+                # Артефакт только в памяти: берём отпечаток создавшего его этапа
+                parts['inputs'][name] = state['stages'].get(self.producers.get(name))
+
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _get_input(self, name, values, locks):
+        """Значение артефакта из памяти или, если его создатель был пропущен, с диска"""
+        with locks[name]:
+            if name not in values:
+                artifact = self.artifacts[name]
+                if artifact.load is None:
+                    raise RuntimeError(f"Артефакт {name} нельзя загрузить с диска")
+                values[name] = artifact.load()
+            return values[name]
+
+    def _run_stage(self, stage, values, locks, stage_output):
+        """
+        Выполняет этап и возвращает его выходы, время, напечатанный этапом текст
+        и ошибку (None, если этап выполнен)
+        """
+        start = time.perf_counter()
+        stage_output.capture()
+        try:
+            with span(f'stage.{stage.name}') as current:
+                inputs = {name: self._get_input(name, values, locks) for name in stage.inputs}
+                outputs = stage.func(**inputs) or {}
+
+                if current is not None:
+                    current.rows = count_rows(None, list(outputs.values()) + list(inputs.values()))
+
+            unknown = set(outputs) - set(stage.outputs)
+            if unknown:
+                raise RuntimeError(f"Этап {stage.name} вернул необъявленные артефакты: {sorted(unknown)}")
+        except Exception as e:
+            return None, time.perf_counter() - start, stage_output.release(), e
+
+        return outputs, time.perf_counter() - start, stage_output.release(), None
+
+    def run(self, force=False):
+        """
+        Выполняет этапы в порядке зависимостей (force=True - без пропусков)
+        Возвращает для каждого этапа статус и время в секундах
+        """
+        pipeline_start = time.perf_counter()
+
+        # Печать этапов собирается по потокам и выводится циклом запуска целиком
+        stage_output = StageOutput(sys.stdout)
+        sys.stdout = stage_output
+        try:
+            results = self._run_stages(force, stage_output)
+        finally:
+            sys.stdout = stage_output.stream
+
+        self.print_report(results, time.perf_counter() - pipeline_start)
+
+        return results
+
+    def _run_stages(self, force, stage_output):
+        """Цикл запуска: планирует готовые этапы и выводит результаты завершившихся"""
+        state = self._load_state()
+        values = {}
+        locks = {name: threading.Lock() for name in self.artifacts}
+        results = {}
+        pending = list(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                scheduled = len(pending)
+                for name in list(pending):
+                    stage = self.stages[name]
+                    dependencies = self.dependencies(stage)
+
+                    if any(results.get(dep, {}).get('status') in ('failed', 'blocked') for dep in dependencies):
+                        pending.remove(name)
+                        results[name] = {'status': 'blocked', 'seconds': 0.0}
+                        continue
+
+                    if not all(results.get(dep, {}).get('status') in ('done', 'skipped') for dep in dependencies):
+                        continue
+
+                    pending.remove(name)
+                    fingerprint = self._stage_fingerprint(stage, state)
+                    outputs_exist = all(self.artifacts[output].exists() for output in stage.outputs)
+
+                    if not force and not stage.always and state['stages'].get(name) == fingerprint and outputs_exist:
+                        print(f"⏭ Этап {name}: входы не изменились, пропускаем")
+                        results[name] = {'status': 'skipped', 'seconds': 0.0}
+                        continue
+
+                    print(f"▶ Этап {name}...")
+                    # Этап выполняется в копии контекста, чтобы его спан был вложен в спан пайплайна
+                    context = contextvars.copy_context()
+                    running[executor.submit(context.run, self._run_stage, stage, values, locks, stage_output)] = \
+                        (name, fingerprint)
+
+                if not running:
+                    if len(pending) == scheduled:
+                        # Ни один этап не может начаться: зависимости образуют цикл
+                        for name in pending:
+                            results[name] = {'status': 'blocked', 'seconds': 0.0}
+                        print(f"❌ Циклические зависимости этапов: {pending}")
+                        break
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, fingerprint = running.pop(future)
+                    outputs, seconds, log, error = future.result()
+                    print(log, end='')
+
+                    if error is not None:
+                        print(f"❌ Ошибка на этапе {name}: {error}")
+                        results[name] = {'status': 'failed', 'seconds': seconds, 'error': str(error)}
+                        continue
+
+                    values.update(outputs)
+                    state['stages'][name] = fingerprint
+                    self._save_state(state)
+                    results[name] = {'status': 'done', 'seconds': seconds}
+                    print(f"✓ Этап {name} выполнен за {seconds:.2f} с")
+
+        return results
+
+    def print_report(self, results, total_seconds):
+        """Выводит таблицу этапов (статус и время) и пиковую память процесса"""
+        print("\n=== ЭТАПЫ ПАЙПЛАЙНА ===")
+        for name in self.stages:
+            result = results.get(name, {'status': 'blocked', 'seconds': 0.0})
+            print(f"{name:12} {self.STATUS_LABELS[result['status']]:11} {result['seconds']:7.2f} с")
+        print(f"Всего: {total_seconds:.2f} с")
+
+        peak_mb = peak_memory_mb()
+        if peak_mb is not None:
+            print(f"Пиковая память процесса (RSS): {peak_mb:.0f} МБ")
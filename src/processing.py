@@ -1,14 +1,66 @@
 import pandas as pd
 import numpy as np
+from scipy import sparse
 import re
 from textblob import TextBlob
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.utils import murmurhash3_32
+import copy
 import os
+from concurrent.futures import ProcessPoolExecutor
+from storage import get_storage, compact_review_frame, memory_report, data_version, save_data_version, \
+    matches_data_version
+from indexing import InvertedIndex, split_words, WHITESPACE_PATTERN, SPECIAL_CHARS_PATTERN
+from lemmatizer import Lemmatizer
+from textcache import TextResultCache, normalize_text, text_key
+from duplicates import NearDuplicateDetector
+from topics import StreamingTopicModel, TOPIC_TERM_COLUMNS
+from rollups import TimeSeriesRollup
+from sketches import ReviewSketches
+from instrumentation import traced, record_file_read, record_file_written
 
+# Предкомпилированные шаблоны очистки текста
 
 class ReviewProcessor:
-    def __init__(self):
+    def __init__(self, storage=None, compact=False, drop_clean_text=False, search_index=False, lemmatize=False,
+                 lemma_cache_size=100000, memoize=False, persist_text_cache=False, text_cache_size=500000,
+                 near_duplicates=False, topics=False, n_topics=8):
+        # Хранилище данных: 'csv' (по умолчанию), 'parquet' или объект хранилища
+        self.storage = get_storage(storage)
+
+        # Компактная схема типов для обработанных данных
+        self.compact = compact
+        self.drop_clean_text = drop_clean_text
+
+        # Строить инвертированный индекс для полнотекстового поиска при обработке
+        self.search_index = search_index
+        self.inverted_index = None
+
+        # Лемматизация слов для тональности и ключевых слов: словоформы ('отличное',
+        # 'качественная') сводятся к нормальной форме через LRU-кэш на lemma_cache_size слов
+        # Основы стеммера Snowball используются только для тональности: ключевые слова
+        # и частоты остаются исходными словами
+        self.lemmatizer = Lemmatizer(lemma_cache_size) if lemmatize else None
+
+        # Кэш результатов по содержимому текста: дубли отзывов обрабатываются один раз;
+        # persist_text_cache=True - кэш хранится на диске между запусками пайплайна
+        self.text_cache = None
+        if memoize:
+            self.text_cache = TextResultCache(
+                max_entries=text_cache_size,
+                filepath='data/processed/text_cache.pkl' if persist_text_cache else None
+            )
+
+        # Искать почти одинаковые отзывы (MinHash LSH) и записывать их группы в dup_group_id
+        self.near_duplicates = near_duplicates
+
+        # Кластеризовать отзывы по темам (MiniBatchKMeans по частям) в колонку topic_id;
+        # самые весомые слова тем сохраняются в topic_terms
+        self.topics = topics
+        self.n_topics = n_topics
+        self.topic_terms = None
+
         self.stop_words = [
             'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'все', 'она', 'так', 'его', 'но',
             'да', 'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было', 'вот', 'от', 'меня',
@@ -23,10 +75,94 @@ class ReviewProcessor:
             'лучше', 'чуть', 'том', 'нельзя', 'такой', 'им', 'более', 'всегда', 'конечно', 'всю', 'между'
         ]
 
-    def load_data(self, filepath='data/raw/reviews.csv'):
-        """Загружает данные из CSV файла"""
+        # Позитивные слова
+        self.positive_words = [
+            'отличный', 'хороший', 'прекрасный', 'замечательный', 'великолепный',
+            'качественный', 'рекомендую', 'доволен', 'довольна', 'нравится',
+            'превосходный', 'идеальный', 'быстро', 'быстрый', 'быстрая'
+        ]
+
+        # Негативные слова
+        self.negative_words = [
+            'плохой', 'ужасный', 'плохо', 'не рекомендую', 'разочарование',
+            'дефект', 'брак', 'медленно', 'долго', 'не работает', 'не стоит',
+            'зря', 'хуже', 'проблема', 'недочет'
+        ]
+
+        # Лексикон компилируется один раз на процессор
+        self._build_lexicon_matcher()
+
+    def _lexicon_lemmas(self, words):
+        """Нормальные формы слов лексикона в пробелах, чтобы совпадали только целые слова"""
+        return list(dict.fromkeys(f' {self.lemmatizer.lemmatize_text(word)} ' for word in words))
+
+    def _build_lexicon_matcher(self):
+        """
+        Готовит скомпилированный матчер лексикона для пакетного анализа тональности
+        При лемматизации лексикон (как и тексты) состоит из нормальных форм слов
+        """
+        if self.lemmatizer is None:
+            self._positive_lexicon = self.positive_words
+            self._negative_lexicon = self.negative_words
+        else:
+            self._positive_lexicon = self._lexicon_lemmas(self.positive_words)
+            self._negative_lexicon = self._lexicon_lemmas(self.negative_words)
+            self.lemmatizer.reset_stats()
+
+        words = list(dict.fromkeys(self._positive_lexicon + self._negative_lexicon))
+
+        self._lexicon_words = words
+        self._lexicon_ids = {word: i for i, word in enumerate(words)}
+        self._lexicon_pattern = re.compile(self._build_trie_pattern(words))
+
+        # +1 для позитивных слов, -1 для негативных
+        self._lexicon_polarity = np.array(
+            [(word in self._positive_lexicon) - (word in self._negative_lexicon) for word in words],
+            dtype=np.float64
+        )
+
+        # Найденное слово означает, что в тексте есть и все слова лексикона, входящие в него
+        # (например, 'не рекомендую' содержит 'рекомендую', а 'плохой' содержит 'плохо')
+        self._lexicon_closure = np.array(
+            [[other in word for other in words] for word in words],
+            dtype=bool
+        )
+
+        # Смещения внутри слова, с которых может начинаться другое слово лексикона,
+        # выходящее за его границу: их проверяем отдельно, чтобы не потерять пересечения
+        self._lexicon_overlaps = [
+            [k for k in range(1, len(word))
+             if any(other.startswith(word[k:]) and len(other) > len(word) - k for other in words)]
+            for word in words
+        ]
+
+    @staticmethod
+    def _build_trie_pattern(words):
+        """Строит регулярное выражение в виде префиксного дерева (самое длинное совпадение в позиции)"""
+        trie = {}
+        for word in words:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        def build(node):
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ''
+            body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+            return f'(?:{body})?' if '' in node else body
+
+        return build(trie)
+
+    @traced
+    def load_data(self, filepath=None):
+        """Загружает сырые данные из хранилища (по умолчанию CSV файл)"""
+        if filepath is None:
+            filepath = f'data/raw/reviews{self.storage.extension}'
+
         try:
-            df = pd.read_csv(filepath, encoding='utf-8')
+            df = self.storage.load(filepath)
             print(f"Загружено {len(df)} отзывов")
             return df
         except FileNotFoundError:
@@ -39,16 +175,59 @@ class ReviewProcessor:
             return ""
 
         # Убираем лишние пробелы и переносы строк
-        text = re.sub(r'\s+', ' ', str(text))
+        text = WHITESPACE_PATTERN.sub(' ', str(text))
 
         # Убираем специальные символы, оставляем только буквы, цифры и основные знаки
-        text = re.sub(r'[^\w\s!?.,]', '', text)
+        text = SPECIAL_CHARS_PATTERN.sub('', text)
 
         # Приводим к нижнему регистру
         text = text.lower().strip()
 
         return text
 
+    @traced
+    def tokenize_texts(self, texts, with_tokens=False):
+        """
+        Единый этап токенизации: за один проход по каждому отзыву считает
+        очищенный текст, число токенов в нём, длину и число слов исходного текста
+        При with_tokens=True добавляет колонку со списками слов без знаков препинания
+        """
+        clean_texts = []
+        token_counts = []
+        text_lengths = []
+        word_counts = []
+        token_lists = []
+
+        for text in texts:
+            clean = self.clean_text(text)
+            tokens = clean.split()
+
+            clean_texts.append(clean)
+            token_counts.append(len(tokens))
+            if with_tokens:
+                token_lists.append(split_words(clean))
+
+            # Длина и число слов считаются по исходному тексту
+            if text:
+                raw = str(text)
+                text_lengths.append(len(raw))
+                word_counts.append(len(raw.split()))
+            else:
+                text_lengths.append(0)
+                word_counts.append(0)
+
+        tokenized = pd.DataFrame({
+            'clean_text': clean_texts,
+            'token_count': token_counts,
+            'text_length': text_lengths,
+            'word_count': word_counts
+        }, index=texts.index)
+
+        if with_tokens:
+            tokenized['tokens'] = token_lists
+
+        return tokenized
+
     def get_sentiment_score(self, text):
         """
         Простой анализ тональности на основе ключевых слов
@@ -57,24 +236,14 @@ class ReviewProcessor:
         if not text:
             return 0
 
-        # Позитивные слова
-        positive_words = [
-            'отличный', 'хороший', 'прекрасный', 'замечательный', 'великолепный',
-            'качественный', 'рекомендую', 'доволен', 'довольна', 'нравится',
-            'превосходный', 'идеальный', 'быстро', 'быстрый', 'быстрая'
-        ]
-
-        # Негативные слова
-        negative_words = [
-            'плохой', 'ужасный', 'плохо', 'не рекомендую', 'разочарование',
-            'дефект', 'брак', 'медленно', 'долго', 'не работает', 'не стоит',
-            'зря', 'хуже', 'проблема', 'недочет'
-        ]
-
         text_lower = text.lower()
+        if self.lemmatizer is None:
+            lexicon_text = text_lower
+        else:
+            lexicon_text = f' {self.lemmatizer.lemmatize_text(text_lower)} '
 
-        positive_count = sum(1 for word in positive_words if word in text_lower)
-        negative_count = sum(1 for word in negative_words if word in text_lower)
+        positive_count = sum(1 for word in self._positive_lexicon if word in lexicon_text)
+        negative_count = sum(1 for word in self._negative_lexicon if word in lexicon_text)
 
         # Простая формула для расчета тональности
         total_words = len(text_lower.split())
@@ -86,6 +255,112 @@ class ReviewProcessor:
         # Нормализуем в диапазон [-1, 1]
         return max(-1, min(1, sentiment * 10))
 
+    @traced
+    def get_sentiment_scores(self, texts, token_counts=None):
+        """
+        Пакетный анализ тональности для целой колонки текстов
+        Возвращает те же значения, что и get_sentiment_score для каждой строки,
+        но сопоставляет лексикон со всеми строками за один проход регулярного выражения
+        token_counts - число токенов из tokenize_texts: тогда тексты считаются уже
+        очищенными (в нижнем регистре) и повторно не разбиваются на слова
+        При лемматизации лексикон сопоставляется с нормальными формами слов текста
+        """
+        texts = pd.Series(texts)
+        if token_counts is None:
+            lowered = texts.fillna('').astype(str).str.lower().tolist()
+        else:
+            lowered = texts.fillna('').tolist()
+        n_rows = len(lowered)
+
+        if self.lemmatizer is None:
+            lexicon_texts = lowered
+        else:
+            lexicon_texts = [f' {text} ' for text in self.lemmatizer.lemmatize_texts(lowered)]
+
+        # Склеиваем колонку в одну строку: '\x00' не встречается в лексиконе,
+        # поэтому совпадение не может пересечь границу между отзывами
+        blob = '\x00'.join(lexicon_texts)
+        row_ends = np.cumsum([len(text) + 1 for text in lexicon_texts])
+
+        starts = []
+        word_ids = []
+        match_at = self._lexicon_pattern.match
+        for match in self._lexicon_pattern.finditer(blob):
+            start = match.start()
+            word_id = self._lexicon_ids[match.group()]
+            starts.append(start)
+            word_ids.append(word_id)
+
+            for offset in self._lexicon_overlaps[word_id]:
+                inner = match_at(blob, start + offset)
+                if inner:
+                    starts.append(start + offset)
+                    word_ids.append(self._lexicon_ids[inner.group()])
+
+        # Каждое слово лексикона учитывается в отзыве не более одного раза
+        rows = np.searchsorted(row_ends, np.array(starts, dtype=np.int64), side='right')
+        match_idx, entry_idx = np.nonzero(self._lexicon_closure[np.array(word_ids, dtype=np.intp)])
+        n_words = len(self._lexicon_words)
+        hits = np.unique(rows[match_idx] * n_words + entry_idx)
+        balance = np.bincount(
+            hits // n_words,
+            weights=self._lexicon_polarity[hits % n_words],
+            minlength=n_rows
+        )
+
+        if token_counts is None:
+            total_words = np.array([len(text.split()) for text in lowered], dtype=np.int64)
+        else:
+            total_words = np.asarray(token_counts, dtype=np.int64)
+        scores = np.clip(balance / np.maximum(total_words, 1) * 10, -1, 1)
+        scores[total_words == 0] = 0
+
+        return pd.Series(scores, index=texts.index, dtype=np.float64)
+
+    def _keyword_lemmatizer(self):
+        """Лемматизатор для ключевых слов и частот (None, если он выключен или даёт основы, а не слова)"""
+        if self.lemmatizer is None or not self.lemmatizer.produces_words:
+            return None
+        return self.lemmatizer
+
+    def _keyword_texts(self, texts):
+        """Тексты для ключевых слов: при лемматизации слова заменяются нормальными формами"""
+        if self._keyword_lemmatizer() is None:
+            return texts
+        return self.lemmatizer.lemmatize_texts(texts)
+
+    def _keyword_stop_words(self):
+        """Стоп-слова для ключевых слов (при лемматизации - вместе с их нормальными формами)"""
+        if self._keyword_lemmatizer() is None:
+            return self.stop_words
+        return list(dict.fromkeys(self.stop_words + self.lemmatizer.lemmatize_tokens(self.stop_words)))
+
+    def lemma_stats(self):
+        """Статистика кэша лемматизации (None, если лемматизация выключена)"""
+        return self.lemmatizer.stats() if self.lemmatizer is not None else None
+
+    def print_lemma_stats(self):
+        """Печатает число слов и долю попаданий в кэш лемматизации"""
+        stats = self.lemma_stats()
+        if stats is not None:
+            print(f"Лемматизация ({stats['backend']}): {stats['tokens']} слов, {stats['lookups']} запросов к кэшу, "
+                  f"попаданий {stats['hit_rate']:.1%}, в кэше {stats['cache_size']} слов")
+
+    def print_text_cache_stats(self):
+        """Печатает долю дублей текстов в последнем пакете и сколько результатов взято из кэша"""
+        if self.text_cache is None:
+            return
+
+        stats = self.text_cache.stats(last=True)
+        print(f"Различных текстов: {stats['unique_texts']} из {stats['rows']} "
+              f"(дублей {stats['dedup_ratio']:.1%}), из кэша: {stats['cache_hits']}, "
+              f"посчитано: {stats['computed']}")
+
+    def save_text_cache(self):
+        """Сохраняет кэш результатов по текстам на диск (если он включён с сохранением)"""
+        if self.text_cache is not None and self.text_cache.save():
+            print(f"Кэш текстов ({len(self.text_cache)} записей) сохранен в {self.text_cache.filepath}")
+
     def categorize_sentiment(self, sentiment_score):
         """Категоризует тональность на основе числового значения"""
         if sentiment_score > 0.1:
@@ -95,15 +370,23 @@ class ReviewProcessor:
         else:
             return 'Нейтральная'
 
-    def extract_keywords(self, texts, max_features=20):
-        """Извлекает ключевые слова из текстов"""
+    @traced
+    def extract_keywords(self, texts, max_features=20, cleaned=False):
+        """
+        Извлекает ключевые слова из текстов
+        cleaned=True - тексты уже очищены (например, колонка clean_text) и не чистятся повторно
+        """
         # Очищаем тексты
-        clean_texts = [self.clean_text(text) for text in texts if text]
+        if cleaned:
+            clean_texts = [text for text in texts if text]
+        else:
+            clean_texts = [self.clean_text(text) for text in texts if text]
+        clean_texts = self._keyword_texts(clean_texts)
 
         # Убираем стоп-слова
         vectorizer = TfidfVectorizer(
             max_features=max_features,
-            stop_words=self.stop_words,
+            stop_words=self._keyword_stop_words(),
             ngram_range=(1, 2)
         )
 
@@ -111,8 +394,8 @@ class ReviewProcessor:
             tfidf_matrix = vectorizer.fit_transform(clean_texts)
             feature_names = vectorizer.get_feature_names_out()
 
-            # Получаем средние значения TF-IDF для каждого слова
-            mean_scores = np.mean(tfidf_matrix.toarray(), axis=0)
+            # Получаем средние значения TF-IDF для каждого слова (матрица остаётся разреженной)
+            mean_scores = np.asarray(tfidf_matrix.mean(axis=0)).ravel()
 
             # Создаем словарь слово-важность
             keywords = dict(zip(feature_names, mean_scores))
@@ -126,29 +409,242 @@ class ReviewProcessor:
             print(f"Ошибка при извлечении ключевых слов: {e}")
             return {}
 
-    def process_reviews(self, df):
-        """Основной метод обработки отзывов"""
+    @traced
+    def extract_segment_keywords(self, df, segment_columns=('rating', 'sentiment_category'), max_features=20,
+                                 chunksize=100000):
+        """
+        Ключевые слова по всему корпусу и по сегментам (рейтинг, тональность) за один проход
+        Возвращает {'all': {...}, 'rating': {5: {...}, ...}, 'sentiment_category': {...}}
+        """
+        extractor = StreamingKeywordExtractor(stop_words=self._keyword_stop_words())
+        self.ensure_clean_text(df)
+
+        for start in range(0, len(df), chunksize):
+            chunk = df.iloc[start:start + chunksize]
+            extractor.partial_fit(self._keyword_texts(chunk['clean_text'].fillna('').tolist()),
+                                  chunk[list(segment_columns)])
+
+        return extractor.all_keywords(max_features)
+
+    @traced
+    def extract_keywords_streaming(self, filepath=None, segment_columns=('rating', 'sentiment_category'),
+                                   max_features=20, chunksize=100000):
+        """
+        Ключевые слова по обработанным данным, которые не помещаются в память:
+        файл читается частями, в памяти остаются только счётчики фиксированного размера
+        """
+        if filepath is None:
+            filepath = f'data/processed/processed_reviews{self.storage.extension}'
+
+        if not os.path.exists(filepath):
+            print(f"Файл {filepath} не найден")
+            return {}
+
+        extractor = StreamingKeywordExtractor(stop_words=self._keyword_stop_words())
+        columns = ['clean_text'] + list(segment_columns)
+
+        for chunk in self.storage.iter_chunks(filepath, chunksize=chunksize, columns=columns):
+            extractor.partial_fit(self._keyword_texts(chunk['clean_text'].fillna('').tolist()),
+                                  chunk[list(segment_columns)])
+
+        return extractor.all_keywords(max_features)
+
+    @traced
+    def compute_term_frequencies(self, df, segment_columns=('rating', 'sentiment_category'), max_terms=1000):
+        """
+        Таблица частот слов для облака слов: по всему корпусу и по сегментам
+        Слова выделяются так же, как в WordCloud (шаблон \\w[\\w']*, без чисел),
+        для каждого сегмента сохраняется max_terms самых частых слов
+        Колонки: segment ('all' или имя колонки), value, term, count
+        """
+        columns = ['segment', 'value', 'term', 'count']
+        self.ensure_clean_text(df)
+
+        vectorizer = CountVectorizer(token_pattern=r"(?u)\w[\w']*", lowercase=False)
+        try:
+            counts = vectorizer.fit_transform(df['clean_text'].fillna(''))
+        except ValueError:
+            return pd.DataFrame(columns=columns)
+
+        terms = vectorizer.get_feature_names_out()
+        keep = ~np.char.isdigit(terms.astype(str))
+
+        segments = df[list(segment_columns)] if segment_columns else None
+        keys, group_rows = segment_groups(len(df), segments)
+        totals = (segment_indicator(group_rows, len(df)) @ counts).toarray()
+
+        tables = []
+        for key, row in zip(keys, totals):
+            row = np.where(keep, row, 0)
+            top = np.argsort(row, kind='stable')[::-1][:max_terms]
+            top = top[row[top] > 0]
+
+            segment, value = ('all', '') if key == 'all' else key
+            tables.append(pd.DataFrame({
+                'segment': segment,
+                'value': str(value),
+                'term': terms[top],
+                'count': row[top].astype(np.int64)
+            }))
+
+        return pd.concat(tables, ignore_index=True)[columns]
+
+    @traced
+    def save_term_frequencies(self, df, filename=None):
+        """Считает и сохраняет таблицу частот слов рядом с обработанными данными"""
         if df is None:
             return None
 
-        print("Обработка отзывов...")
+        if filename is None:
+            filename = f'term_frequencies{self.storage.extension}'
 
-        # Создаем копию датафрейма
-        processed_df = df.copy()
+        table = self.compute_term_frequencies(df)
+        filepath = f'data/processed/{filename}'
+        self.storage.save(table, filepath)
+        print(f"Частоты слов сохранены в {filepath}")
 
-        # Очищаем тексты
-        processed_df['clean_text'] = processed_df['text'].apply(self.clean_text)
+        return table
+
+    def load_term_frequencies(self, filepath=None):
+        """Загружает таблицу частот слов (None, если её нет)"""
+        if filepath is None:
+            filepath = f'data/processed/term_frequencies{self.storage.extension}'
+
+        try:
+            table = self.storage.load(filepath)
+        except FileNotFoundError:
+            return None
+
+        table['value'] = table['value'].fillna('').astype(str)
+        return table
+
+    def _text_results(self, texts):
+        """Результаты, которые зависят только от текста: очищенный текст, число токенов, тональность"""
+        tokenized = self.tokenize_texts(texts)
+        return pd.DataFrame({
+            'clean_text': tokenized['clean_text'],
+            'token_count': tokenized['token_count'],
+            'sentiment_score': self.get_sentiment_scores(tokenized['clean_text'], tokenized['token_count'])
+        }, index=texts.index)
+
+    def _text_cache_signature(self):
+        """Подпись настроек, от которых зависит результат по тексту: лексикон и лемматизация"""
+        backend = self.lemmatizer.backend if self.lemmatizer is not None else ''
+        return text_key('|'.join(self._positive_lexicon) + '#' + '|'.join(self._negative_lexicon), backend)
+
+    def _memoized_text_features(self, texts, with_tokens=False, compute=None):
+        """
+        Текстовые признаки с дедупликацией по содержимому: различные тексты выделяются
+        через pd.factorize, для каждого считается ключ нормализованного текста, заново
+        считаются только тексты, которых нет в кэше (compute, по умолчанию _text_results),
+        а результаты раздаются всем строкам по кодам (take)
+        Длина и число слов считаются по исходным текстам, как в tokenize_texts
+        """
+        compute = compute or self._text_results
+        cache = self.text_cache
+
+        raw_texts = texts.to_numpy(dtype=object)
+        codes, uniques = pd.factorize(raw_texts)
+
+        # Пропуски (None, NaN) получают отдельный код с пустым текстом
+        missing_rows = np.flatnonzero(codes < 0)
+        uniques = list(uniques)
+        if len(missing_rows):
+            codes[missing_rows] = len(uniques)
+            uniques.append('')
+
+        # Варианты текста, отличающиеся только пробелами, получают один ключ;
+        # число слов исходного текста - число пробелов в нормализованном плюс один
+        normalized = np.array([normalize_text(text) for text in uniques], dtype=object)
+
+        text_lengths = np.array([len(str(text)) if text else 0 for text in uniques], dtype=np.int64)[codes]
+        word_counts = np.array([text.count(' ') + 1 if raw and text else 0
+                                for raw, text in zip(uniques, normalized)], dtype=np.int64)[codes]
+        for row in missing_rows:
+            text = raw_texts[row]
+            text_lengths[row] = len(str(text)) if text else 0
+            word_counts[row] = len(str(text).split()) if text else 0
+        signature = self._text_cache_signature()
+        key_codes, keys = pd.factorize(np.array([text_key(text, signature) for text in normalized], dtype=object))
+
+        # Первый исходный текст для каждого ключа
+        first = np.empty(len(keys), dtype=np.intp)
+        first[key_codes[::-1]] = np.arange(len(key_codes))[::-1]
+
+        positions = cache.lookup(keys)
+        found = positions >= 0
+        missing = np.flatnonzero(~found)
+
+        clean_texts = np.empty(len(keys), dtype=object)
+        token_counts = np.zeros(len(keys), dtype=np.int64)
+        scores = np.zeros(len(keys), dtype=np.float64)
+
+        cached = cache.results(positions[found])
+        clean_texts[found] = cached['clean_text'].to_numpy()
+        token_counts[found] = cached['token_count'].to_numpy()
+        scores[found] = cached['sentiment_score'].to_numpy()
+
+        if len(missing):
+            computed = compute(pd.Series(normalized[first[missing]], dtype=object))
+            clean_texts[missing] = computed['clean_text'].to_numpy()
+            token_counts[missing] = computed['token_count'].to_numpy()
+            scores[missing] = computed['sentiment_score'].to_numpy()
+            cache.add(keys[missing], computed)
+
+        cache.record(len(texts), len(keys), int(found.sum()), len(missing))
+
+        row_keys = key_codes[codes]
+        categories = np.array([self.categorize_sentiment(score) for score in scores], dtype=object)
+
+        features = pd.DataFrame(index=texts.index)
+        features['clean_text'] = clean_texts[row_keys]
+        features['sentiment_score'] = scores[row_keys]
+        features['sentiment_category'] = categories[row_keys]
+        features['text_length'] = text_lengths
+        features['word_count'] = word_counts
+
+        if with_tokens:
+            tokens = np.empty(len(keys), dtype=object)
+            for i, text in enumerate(clean_texts):
+                tokens[i] = split_words(text)
+            features['tokens'] = tokens[row_keys]
+
+        return features
+
+    def _text_features(self, texts, with_tokens=False):
+        """Считает текстовые признаки отзывов: очищенный текст, тональность и длину"""
+        if self.text_cache is not None:
+            return self._memoized_text_features(texts, with_tokens=with_tokens)
+
+        # Очищаем и токенизируем тексты за один проход
+        tokenized = self.tokenize_texts(texts, with_tokens=with_tokens)
+
+        features = pd.DataFrame(index=texts.index)
+        features['clean_text'] = tokenized['clean_text']
 
         # Анализируем тональность
-        processed_df['sentiment_score'] = processed_df['clean_text'].apply(self.get_sentiment_score)
-        processed_df['sentiment_category'] = processed_df['sentiment_score'].apply(self.categorize_sentiment)
+        features['sentiment_score'] = self.get_sentiment_scores(tokenized['clean_text'], tokenized['token_count'])
+        features['sentiment_category'] = features['sentiment_score'].apply(self.categorize_sentiment)
 
         # Добавляем длину отзыва
-        processed_df['text_length'] = processed_df['text'].apply(lambda x: len(str(x)) if x else 0)
-        processed_df['word_count'] = processed_df['text'].apply(lambda x: len(str(x).split()) if x else 0)
+        features['text_length'] = tokenized['text_length']
+        features['word_count'] = tokenized['word_count']
+
+        if with_tokens:
+            features['tokens'] = tokenized['tokens']
+
+        return features
+
+    def _add_review_features(self, df, text_features=None):
+        """Добавляет в датафрейм признаки отзывов (изменяет его на месте)"""
+        if text_features is None:
+            text_features = self._text_features(df['text'])
+
+        for column in text_features.columns:
+            df[column] = text_features[column].array
 
         # Конвертируем дату
-        processed_df['date'] = pd.to_datetime(processed_df['date'])
+        df['date'] = pd.to_datetime(df['date'])
 
         # Создаем категории по рейтингу
         def rating_category(rating):
@@ -159,24 +655,482 @@ class ReviewProcessor:
             else:
                 return 'Низкий'
 
-        processed_df['rating_category'] = processed_df['rating'].apply(rating_category)
+        df['rating_category'] = df['rating'].apply(rating_category)
+
+        return df
+
+    @traced
+    def process_reviews(self, df):
+        """Основной метод обработки отзывов"""
+        if df is None:
+            return None
+
+        print("Обработка отзывов...")
+
+        # Создаем копию датафрейма
+        processed_df = df.copy()
+
+        text_features = self._text_features(processed_df['text'], with_tokens=self.search_index)
+
+        # Индекс для поиска строится из слов, полученных при токенизации
+        if self.search_index:
+            self.inverted_index = InvertedIndex.from_token_lists(text_features.pop('tokens'))
+
+        self._add_review_features(processed_df, text_features)
+
+        if self.near_duplicates:
+            self.detect_near_duplicates(processed_df)
+
+        if self.topics:
+            self.cluster_topics(processed_df)
+
+        if self.compact:
+            processed_df = self.compact_frame(processed_df)
+
+        self.print_lemma_stats()
+        self.print_text_cache_stats()
+        print("Обработка завершена!")
+
+        return processed_df
+
+    @traced
+    def process_reviews_parallel(self, df, n_workers=None, n_partitions=None):
+        """
+        Параллельная обработка отзывов в пуле процессов
+        Текстовые признаки считаются по частям датафрейма в n_workers процессах,
+        результат совпадает с process_reviews и собирается в исходном порядке
+        """
+        if df is None:
+            return None
+
+        n_workers = n_workers or os.cpu_count() or 1
+        n_partitions = min(n_partitions or n_workers * 4, len(df))
+
+        if n_workers <= 1 or n_partitions <= 1:
+            return self.process_reviews(df)
+
+        print(f"Параллельная обработка отзывов ({n_workers} процессов, {n_partitions} частей)...")
+
+        processed_df = df.copy()
+
+        # В задачи уходит только колонка текста; состояние процессора (без кэша текстов)
+        # передаётся каждому процессу один раз при его запуске
+        worker_processor = copy.copy(self)
+        worker_processor.text_cache = None
+
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(worker_processor,)) as executor:
+            if self.text_cache is None:
+                partitions = split_series(processed_df['text'], n_partitions)
+                text_features = pd.concat(list(executor.map(_text_features_worker, partitions)))
+            else:
+                # Дубли отсеиваются до пула: в процессы уходят только тексты, которых нет в кэше
+                text_features = self._memoized_text_features(
+                    processed_df['text'],
+                    compute=lambda texts: pd.concat(list(executor.map(
+                        _text_results_worker, split_series(texts, min(n_partitions, len(texts)))
+                    )))
+                )
+                self.print_text_cache_stats()
+
+        # Даты и категории рейтинга считаются по всему датафрейму сразу,
+        # чтобы формат дат определялся так же, как при последовательной обработке
+        self._add_review_features(processed_df, text_features)
+
+        if self.search_index:
+            self.build_search_index(processed_df)
+
+        if self.near_duplicates:
+            self.detect_near_duplicates(processed_df)
+
+        if self.topics:
+            self.cluster_topics(processed_df)
+
+        if self.compact:
+            processed_df = self.compact_frame(processed_df)
 
         print("Обработка завершена!")
 
         return processed_df
 
-    def save_processed_data(self, df, filename='processed_reviews.csv'):
+    @traced
+    def compact_frame(self, df):
+        """Переводит обработанные отзывы в компактную схему и печатает отчёт о памяти"""
+        compact_df = compact_review_frame(df, drop_clean_text=self.drop_clean_text)
+
+        report = memory_report(df, compact_df)
+        print(f"Память: {report['before_mb']:.1f} МБ -> {report['after_mb']:.1f} МБ "
+              f"(в {report['reduction']:.1f} раза меньше)")
+
+        return compact_df
+
+    @traced
+    def build_search_index(self, df):
+        """Строит инвертированный индекс по колонке clean_text обработанных отзывов"""
+        self.ensure_clean_text(df)
+        self.inverted_index = InvertedIndex.from_token_lists(
+            split_words(text) if isinstance(text, str) else [] for text in df['clean_text']
+        )
+        return self.inverted_index
+
+    @traced
+    def detect_near_duplicates(self, df, chunksize=100000):
+        """
+        Ищет почти одинаковые отзывы по clean_text (MinHash LSH, по частям из chunksize строк)
+        и записывает в колонку dup_group_id номер группы (-1 - похожих отзывов нет)
+        """
+        self.ensure_clean_text(df)
+
+        detector = NearDuplicateDetector()
+        for start in range(0, len(df), chunksize):
+            detector.partial_fit(df['clean_text'].iloc[start:start + chunksize].tolist())
+
+        group_ids = detector.group_ids()
+        df['dup_group_id'] = group_ids
+
+        n_groups = group_ids.max() + 1 if len(group_ids) else 0
+        print(f"Почти одинаковых отзывов: {(group_ids >= 0).sum()} в {n_groups} группах")
+
+        return df
+
+    @traced
+    def cluster_topics(self, df, n_topics=None, chunksize=100000):
+        """
+        Кластеризует отзывы по темам и записывает номер темы в колонку topic_id
+        (-1 - в отзыве нет значимых слов). Хешированный TF-IDF по clean_text сжимается
+        TruncatedSVD и кластеризуется MiniBatchKMeans частями по chunksize строк
+        Самые весомые слова каждой темы сохраняются в self.topic_terms
+        """
+        self.ensure_clean_text(df)
+
+        texts = df['clean_text'].fillna('').astype(str)
+        model = StreamingTopicModel(n_topics=n_topics or self.n_topics, stop_words=self._keyword_stop_words())
+
+        def chunks():
+            for start in range(0, len(texts), chunksize):
+                yield self._keyword_texts(texts.iloc[start:start + chunksize].tolist())
+
+        model.fit(chunks)
+        topic_ids = model.predict(chunks)
+        df['topic_id'] = topic_ids
+        self.topic_terms = model.top_terms()
+
+        n_topics = model.kmeans.n_clusters if model.kmeans is not None else 0
+        print(f"Тем найдено: {n_topics}, отзывов без темы: {(topic_ids < 0).sum()}")
+
+        return df
+
+    def topic_terms_path(self):
+        """Путь к таблице слов тем рядом с обработанными данными"""
+        return f'data/processed/topic_terms{self.storage.extension}'
+
+    def save_topic_terms(self):
+        """Сохраняет слова тем последней кластеризации (если она была)"""
+        if self.topic_terms is None:
+            return None
+
+        self.storage.save(self.topic_terms, self.topic_terms_path())
+        print(f"Слова тем сохранены в {self.topic_terms_path()}")
+
+        return self.topic_terms
+
+    def load_topic_terms(self, filepath=None):
+        """Загружает таблицу слов тем (None, если её нет)"""
+        try:
+            table = self.storage.load(filepath or self.topic_terms_path())
+        except FileNotFoundError:
+            return None
+
+        if table.empty:
+            return pd.DataFrame(columns=TOPIC_TERM_COLUMNS)
+
+        table['term'] = table['term'].astype(str)
+        return table
+
+    def ensure_clean_text(self, df):
+        """Пересчитывает колонку clean_text, если она была удалена компактной схемой"""
+        if 'clean_text' not in df.columns:
+            df['clean_text'] = df['text'].apply(self.clean_text)
+
+        return df
+
+    @traced
+    def save_processed_data(self, df, filename=None):
         """Сохраняет обработанные данные"""
         if df is None:
             return
 
-        # Создаем директорию если её нет
-        os.makedirs('data/processed', exist_ok=True)
+        if filename is None:
+            filename = f'processed_reviews{self.storage.extension}'
 
         filepath = f'data/processed/{filename}'
-        df.to_csv(filepath, index=False, encoding='utf-8')
+        self.storage.save(df, filepath)
         print(f"Обработанные данные сохранены в {filepath}")
+        self.save_text_cache()
+        self.save_topic_terms()
+
+        # Индекс поиска сохраняется рядом с данными, если он построен для этого датафрейма
+        if self.inverted_index is not None and self.inverted_index.n_rows == len(df):
+            self.inverted_index.save('data/processed/search_index.npz')
+            record_file_written('data/processed/search_index.npz')
+            print("Индекс поиска сохранен в data/processed/search_index.npz")
+
+    def processed_path(self):
+        """Путь к обработанным данным по умолчанию"""
+        return f'data/processed/processed_reviews{self.storage.extension}'
+
+    def time_rollups_path(self):
+        """Путь к файлу временных агрегатов рядом с обработанными данными"""
+        return f'data/processed/time_rollups{self.storage.extension}'
+
+    @traced
+    def save_time_rollups(self, df, data_path=None):
+        """
+        Считает по обработанным отзывам агрегаты по дням, неделям и месяцам и сохраняет их
+        вместе с версией файла обработанных данных data_path (по умолчанию processed_path)
+        """
+        if df is None:
+            return None
+
+        rollup = TimeSeriesRollup().update(df)
+        rollup.save(self.storage, self.time_rollups_path())
+        save_data_version(self.time_rollups_path(), data_version(data_path or self.processed_path()))
+        print(f"Временные агрегаты сохранены в {self.time_rollups_path()}")
+
+        return rollup
+
+    @traced
+    def update_time_rollups(self, added_df=None, removed_df=None, processed_df=None, base_version=None):
+        """
+        Обновляет сохранённые временные агрегаты: добавляет новые отзывы и вычитает удалённые
+        base_version - версия обработанных данных до обновления: если агрегатов нет или они
+        посчитаны по другой версии, они пересчитываются заново по processed_df
+        """
+        rollup = TimeSeriesRollup.load(self.storage, self.time_rollups_path())
+        if rollup is None:
+            return self.save_time_rollups(processed_df)
+
+        if not matches_data_version(self.time_rollups_path(), base_version):
+            print("Временные агрегаты посчитаны по другим данным, пересчитываем")
+            return self.save_time_rollups(processed_df)
+
+        rollup.update(removed_df, sign=-1).update(added_df)
+        rollup.save(self.storage, self.time_rollups_path())
+        save_data_version(self.time_rollups_path(), data_version(self.processed_path()))
+        print(f"Временные агрегаты обновлены в {self.time_rollups_path()}")
+
+        return rollup
+
+    def sketches_path(self):
+        """Путь к файлу скетчей квантилей и различных значений рядом с обработанными данными"""
+        return 'data/processed/sketches.pkl'
+
+    @traced
+    def save_sketches(self, df, data_path=None):
+        """
+        Считает по обработанным отзывам дневные скетчи (квантили, авторы, слова) и сохраняет их
+        вместе с версией файла обработанных данных data_path (по умолчанию processed_path)
+        """
+        if df is None:
+            return None
+
+        self.ensure_clean_text(df)
+        sketches = ReviewSketches().update(df)
+        sketches.save(self.sketches_path())
+        record_file_written(self.sketches_path())
+        save_data_version(self.sketches_path(), data_version(data_path or self.processed_path()))
+        size_kb = os.path.getsize(self.sketches_path()) // 1024
+        print(f"Скетчи статистик ({size_kb} КБ) сохранены в {self.sketches_path()}")
+
+        return sketches
+
+    @traced
+    def update_sketches(self, added_df=None, removed_df=None, processed_df=None, base_version=None):
+        """
+        Добавляет в сохранённые скетчи новые отзывы объединением (merge) со скетчами новой части
+        Скетчи не умеют вычитать, поэтому при удалённых отзывах, а также если скетчей нет
+        или они посчитаны не по base_version (версии обработанных данных до обновления),
+        они пересчитываются заново по processed_df
+        """
+        sketches = ReviewSketches.load(self.sketches_path())
+        if sketches is None or (removed_df is not None and len(removed_df)):
+            return self.save_sketches(processed_df)
+
+        if not matches_data_version(self.sketches_path(), base_version):
+            print("Скетчи статистик посчитаны по другим данным, пересчитываем")
+            return self.save_sketches(processed_df)
+
+        if added_df is not None and len(added_df):
+            self.ensure_clean_text(added_df)
+            sketches.merge(ReviewSketches().update(added_df))
+
+        sketches.save(self.sketches_path())
+        record_file_written(self.sketches_path())
+        save_data_version(self.sketches_path(), data_version(self.processed_path()))
+        print(f"Скетчи статистик обновлены в {self.sketches_path()}")
+
+        return sketches
+
+    @traced
+    def process_csv_in_chunks(self, filepath='data/raw/reviews.csv', filename=None, chunksize=100000):
+        """
+        Потоковая обработка CSV файла частями фиксированного размера
+        Каждая обработанная часть дописывается в выходной файл в формате хранилища
+        (CSV или Parquet), поэтому расход памяти не зависит от размера входных данных
+        Возвращает статистику как get_summary_stats
+        """
+        if not os.path.exists(filepath):
+            print(f"Файл {filepath} не найден")
+            return {}
+
+        if filename is None:
+            filename = f'processed_reviews{self.storage.extension}'
+
+        output_path = f'data/processed/{filename}'
+
+        stats = ReviewStatsAccumulator()
+        rollup = TimeSeriesRollup()
+        sketches = ReviewSketches()
+
+        print(f"Потоковая обработка {filepath} частями по {chunksize} строк...")
+        record_file_read(filepath)
 
+        with self.storage.writer(output_path) as writer:
+            for chunk in pd.read_csv(filepath, encoding='utf-8', chunksize=chunksize):
+                self._add_review_features(chunk)
+                stats.update(chunk)
+                rollup.update(chunk)
+                sketches.update(chunk)
+
+                writer.write(chunk)
+
+                print(f"  обработано {stats.count} отзывов")
+
+        print(f"Обработанные данные сохранены в {output_path}")
+
+        rollup.save(self.storage, self.time_rollups_path())
+        save_data_version(self.time_rollups_path(), data_version(output_path))
+        sketches.save(self.sketches_path())
+        record_file_written(self.sketches_path())
+        save_data_version(self.sketches_path(), data_version(output_path))
+        self.save_text_cache()
+
+        result = stats.to_dict()
+        if result:
+            result['sketch_summary'] = sketches.summary()
+        if self.text_cache is not None:
+            result['text_dedup'] = self.text_cache.stats()
+
+        return result
+
+    @traced
+    def compute_row_hashes(self, df):
+        """
+        Считает стабильный хеш содержимого каждого отзыва (текст + автор + дата + рейтинг)
+        Значения приводятся к строкам, поэтому хеш не зависит от формата хранения
+        (рейтинг 5 и 5.0 дают одну строку, пропуск - пустую)
+        """
+        ratings = pd.to_numeric(df['rating'], errors='coerce').astype(float)
+        key = pd.DataFrame({
+            'text': df['text'].fillna('').astype(str),
+            'author': df['author'].fillna('').astype(str),
+            'date': pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d %H:%M:%S'),
+            'rating': ratings.map('{:g}'.format).where(ratings.notna(), '')
+        })
+
+        hashes = pd.util.hash_pandas_object(key, index=False)
+        return pd.Series([f'{value:016x}' for value in hashes], index=df.index, dtype=object)
+
+    @traced
+    def process_incremental(self, filepath=None, manifest_path='data/processed/manifest.csv', raw_df=None):
+        """
+        Инкрементальная обработка: через process_reviews проходят только новые
+        или изменённые отзывы, остальные берутся из уже обработанных данных
+        Манифест хранит хеши отзывов, которые уже обработаны, и подпись настроек
+        обработки (лексикон, лемматизация): если настройки изменились, все отзывы
+        обрабатываются заново. Сырые данные можно передать готовым датафреймом raw_df
+        вместо чтения файла
+        """
+        if raw_df is None:
+            raw_df = self.load_data(filepath)
+        if raw_df is None:
+            return None
+
+        raw_hashes = self.compute_row_hashes(raw_df)
+        signature = self._text_cache_signature()
+        processed_path = self.processed_path()
+        # Версия данных, по которой посчитаны сохранённые агрегаты и скетчи
+        base_version = data_version(processed_path)
+
+        # Загружаем манифест и ранее обработанные данные
+        existing_df = None
+        manifest = set()
+        if os.path.exists(manifest_path) and os.path.exists(processed_path):
+            existing_df = self.storage.load(processed_path)
+            manifest_df = pd.read_csv(manifest_path, dtype=str)
+            if 'row_hash' not in existing_df.columns:
+                existing_df = None
+            elif 'signature' not in manifest_df.columns or not (manifest_df['signature'] == signature).all():
+                # Старые отзывы посчитаны с другим лексиконом или лемматизацией
+                print("Настройки обработки изменились, обрабатываем все отзывы заново")
+                existing_df = None
+            else:
+                manifest = set(manifest_df['row_hash'])
+
+        new_mask = ~raw_hashes.isin(manifest)
+        print(f"Новых или изменённых отзывов: {new_mask.sum()} из {len(raw_df)}")
+
+        parts = []
+        new_df = None
+        removed_df = None
+        if existing_df is not None:
+            # Удалённые и изменённые отзывы больше не встречаются среди хешей сырых данных
+            kept = existing_df['row_hash'].isin(raw_hashes)
+            removed_df = existing_df[~kept]
+            parts.append(existing_df[kept])
+
+        if new_mask.any():
+            # Дубли и темы ищутся ниже по всем отзывам, а не только по новым
+            flags = self.near_duplicates, self.topics
+            self.near_duplicates = self.topics = False
+            try:
+                new_df = self.process_reviews(raw_df[new_mask])
+            finally:
+                self.near_duplicates, self.topics = flags
+            new_df['row_hash'] = raw_hashes[new_mask]
+            parts.append(new_df)
+
+        # Собираем результат в порядке сырых данных
+        merged = pd.concat(parts, ignore_index=True).drop_duplicates('row_hash')
+        processed_df = merged.set_index('row_hash').loc[raw_hashes.values].reset_index()
+        processed_df = processed_df[[c for c in merged.columns if c != 'row_hash'] + ['row_hash']]
+
+        if self.search_index:
+            self.build_search_index(processed_df)
+
+        # Группы дублей зависят от всех отзывов, поэтому пересчитываются целиком (за линейное время)
+        if self.near_duplicates:
+            self.detect_near_duplicates(processed_df)
+
+        # Темы обучаются заново на всех отзывах, иначе номера тем частей не согласованы
+        if self.topics:
+            self.cluster_topics(processed_df)
+
+        self.save_processed_data(processed_df)
+        pd.DataFrame({'row_hash': processed_df['row_hash'].unique(), 'signature': signature}).to_csv(
+            manifest_path, index=False)
+
+        # Агрегаты по времени и скетчи обновляются только на изменившиеся отзывы
+        if existing_df is None:
+            self.save_time_rollups(processed_df)
+            self.save_sketches(processed_df)
+        else:
+            self.update_time_rollups(new_df, removed_df, processed_df, base_version)
+            self.update_sketches(new_df, removed_df, processed_df, base_version)
+
+        return processed_df
+
+    @traced
     def get_summary_stats(self, df):
         """Получает основную статистику по данным"""
         if df is None:
@@ -191,9 +1145,224 @@ class ReviewProcessor:
             'avg_word_count': df['word_count'].mean()
         }
 
+        # Доля дублей текстов за время работы процессора (если включён кэш текстов)
+        if self.text_cache is not None:
+            stats['text_dedup'] = self.text_cache.stats()
+
         return stats
 
 
+# Процессор внутри процесса пула, создаётся один раз при запуске процесса
+_worker_processor = None
+
+
+def _init_worker(processor):
+    """Сохраняет процессор (стоп-слова и лексикон) в глобальной переменной процесса пула"""
+    global _worker_processor
+    _worker_processor = processor
+
+
+def _text_features_worker(texts):
+    """Считает текстовые признаки для части отзывов внутри процесса пула"""
+    return _worker_processor._text_features(texts)
+
+
+def _text_results_worker(texts):
+    """Считает результаты по различным текстам (без дублей) внутри процесса пула"""
+    return _worker_processor._text_results(texts)
+
+
+def split_series(series, n_partitions):
+    """Делит колонку на n_partitions подряд идущих частей примерно равного размера"""
+    bounds = np.linspace(0, len(series), n_partitions + 1, dtype=int)
+    return [series.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def segment_frequencies(table, segment='all', value=''):
+    """Словарь слово -> частота для сегмента из таблицы compute_term_frequencies"""
+    rows = table[(table['segment'] == segment) & (table['value'] == str(value))]
+    return dict(zip(rows['term'], rows['count'].astype(int)))
+
+
+def segment_groups(n_rows, segments=None):
+    """
+    Разбивает строки на сегменты: 'all' и (колонка, значение) для каждой колонки segments
+    Возвращает ключи сегментов и массивы номеров строк каждого сегмента
+    """
+    keys = ['all']
+    group_rows = [np.arange(n_rows)]
+
+    if segments is not None:
+        for column in segments.columns:
+            codes, values = pd.factorize(segments[column])
+            for code, value in enumerate(values):
+                keys.append((column, value))
+                group_rows.append(np.flatnonzero(codes == code))
+
+    return keys, group_rows
+
+
+def segment_indicator(group_rows, n_rows):
+    """Разреженная матрица принадлежности строк сегментам: одна строка матрицы на сегмент"""
+    return sparse.csr_matrix((
+        np.ones(sum(len(rows) for rows in group_rows)),
+        np.concatenate(group_rows),
+        np.cumsum([0] + [len(rows) for rows in group_rows])
+    ), shape=(len(group_rows), n_rows))
+
+
+class StreamingKeywordExtractor:
+    """
+    Онлайн-извлечение ключевых слов по частям корпуса
+    Термины каждой части хешируются в пространство фиксированного размера (hashing trick),
+    где накапливаются число документов с термином (DF) и сумма нормированных частот (TF)
+    для всего корпуса и для каждого сегмента. Оценка термина = средний нормированный TF * IDF,
+    IDF считается по итоговым DF (как smooth_idf в TfidfVectorizer)
+    """
+
+    def __init__(self, stop_words=None, ngram_range=(1, 2), n_features=2 ** 18):
+        self.vectorizer = CountVectorizer(stop_words=stop_words, ngram_range=ngram_range)
+        self.n_features = n_features
+        self.n_docs = {}
+        self.doc_freq = {}
+        self.tf_sum = {}
+        # Имя термина для каждого хеша (первый встреченный термин)
+        self.terms = {}
+
+    def _accumulate(self, key, n_docs, doc_freq, tf_sum, feature_ids):
+        """Добавляет счётчики части корпуса к сегменту key"""
+        if key not in self.n_docs:
+            self.n_docs[key] = 0
+            self.doc_freq[key] = np.zeros(self.n_features, dtype=np.int64)
+            self.tf_sum[key] = np.zeros(self.n_features, dtype=np.float64)
+
+        self.n_docs[key] += n_docs
+        self.doc_freq[key] += np.bincount(feature_ids, weights=doc_freq, minlength=self.n_features).astype(np.int64)
+        self.tf_sum[key] += np.bincount(feature_ids, weights=tf_sum, minlength=self.n_features)
+
+    def partial_fit(self, texts, segments=None):
+        """
+        Обновляет счётчики по части корпуса
+        segments - датафрейм с колонками сегментов (например, rating и sentiment_category)
+        """
+        if len(texts) == 0:
+            return self
+
+        try:
+            counts = self.vectorizer.fit_transform(texts)
+        except ValueError:
+            # В части нет ни одного термина (все тексты пустые или из стоп-слов)
+            counts = None
+
+        if counts is None:
+            feature_ids = np.zeros(0, dtype=np.intp)
+        else:
+            terms = self.vectorizer.get_feature_names_out()
+            feature_ids = np.array(
+                [abs(murmurhash3_32(term, seed=0)) % self.n_features for term in terms],
+                dtype=np.intp
+            )
+            for feature_id, term in zip(feature_ids, terms):
+                self.terms.setdefault(feature_id, term)
+
+        keys, group_rows = segment_groups(len(texts), segments)
+
+        if counts is None:
+            for key, rows in zip(keys, group_rows):
+                self._accumulate(key, len(rows), np.zeros(0), np.zeros(0), feature_ids)
+            return self
+
+        indicator = segment_indicator(group_rows, len(texts))
+
+        doc_freq = (indicator @ (counts > 0).astype(np.float64)).tocsr()
+        tf_sum = (indicator @ normalize(counts)).tocsr()
+
+        for i, key in enumerate(keys):
+            self._accumulate(key, len(group_rows[i]), doc_freq.getrow(i).toarray().ravel(),
+                             tf_sum.getrow(i).toarray().ravel(), feature_ids)
+
+        return self
+
+    def keywords(self, key='all', max_features=20):
+        """Возвращает топ ключевых слов сегмента: словарь термин -> оценка"""
+        if key not in self.n_docs or self.n_docs[key] == 0:
+            return {}
+
+        n_docs = self.n_docs[key]
+        idf = np.log((1 + n_docs) / (1 + self.doc_freq[key])) + 1
+        scores = self.tf_sum[key] / n_docs * idf
+
+        top = np.argsort(scores)[::-1][:max_features]
+        return {self.terms[i]: scores[i] for i in top if scores[i] > 0}
+
+    def all_keywords(self, max_features=20):
+        """Ключевые слова по всему корпусу и по каждому сегменту"""
+        result = {'all': self.keywords('all', max_features)}
+
+        for key in self.n_docs:
+            if key == 'all':
+                continue
+            column, value = key
+            result.setdefault(column, {})[value] = self.keywords(key, max_features)
+
+        return result
+
+
+class ReviewStatsAccumulator:
+    """
+    Накапливает сводную статистику по отзывам частями, не храня сами данные
+    Хранит только счётчики и суммы, поэтому части можно обрабатывать независимо
+    и объединять через merge
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.rating_sum = 0
+        self.text_length_sum = 0
+        self.word_count_sum = 0
+        self.sentiment_counts = pd.Series(dtype='int64')
+        self.rating_counts = pd.Series(dtype='int64')
+
+    def update(self, df):
+        """Добавляет в статистику очередную часть обработанных отзывов"""
+        if df is None or len(df) == 0:
+            return self
+
+        self.count += len(df)
+        self.rating_sum += df['rating'].sum()
+        self.text_length_sum += df['text_length'].sum()
+        self.word_count_sum += df['word_count'].sum()
+        self.sentiment_counts = self.sentiment_counts.add(df['sentiment_category'].value_counts(), fill_value=0)
+        self.rating_counts = self.rating_counts.add(df['rating'].value_counts(), fill_value=0)
+
+        return self
+
+    def merge(self, other):
+        """Объединяет статистику, накопленную по другой части данных"""
+        self.count += other.count
+        self.rating_sum += other.rating_sum
+        self.text_length_sum += other.text_length_sum
+        self.word_count_sum += other.word_count_sum
+        self.sentiment_counts = self.sentiment_counts.add(other.sentiment_counts, fill_value=0)
+        self.rating_counts = self.rating_counts.add(other.rating_counts, fill_value=0)
+
+        return self
+
+    def to_dict(self):
+        """Возвращает статистику в формате ReviewProcessor.get_summary_stats"""
+        if self.count == 0:
+            return {}
+
+        return {
+            'total_reviews': self.count,
+            'avg_rating': self.rating_sum / self.count,
+            'sentiment_distribution': self.sentiment_counts.astype('int64').sort_values(ascending=False).to_dict(),
+            'rating_distribution': self.rating_counts.astype('int64').sort_index().to_dict(),
+            'avg_text_length': self.text_length_sum / self.count,
+            'avg_word_count': self.word_count_sum / self.count
+        }
+
+
 if __name__ == "__main__":
     processor = ReviewProcessor()
 
@@ -206,6 +1375,9 @@ if __name__ == "__main__":
 
         # Сохраняем
         processor.save_processed_data(processed_df)
+        processor.save_term_frequencies(processed_df)
+        processor.save_time_rollups(processed_df)
+        processor.save_sketches(processed_df)
 
         # Выводим статистику
         stats = processor.get_summary_stats(processed_df)
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+# Гранулярности агрегатов: имя -> частота pandas
+GRAINS = {
+    'day': 'D',
+    'week': 'W',
+    'month': 'M'
+}
+
+# Категориальные колонки, по значениям которых считаются количества отзывов
+ROLLUP_CATEGORY_COLUMNS = ['sentiment_category', 'rating_category']
+
+KEY_COLUMNS = ['grain', 'period']
+SUM_COLUMNS = ['count', 'rating_sum', 'sentiment_sum']
+
+
+def period_labels(dates, grain):
+    """
+    Метки периодов для дат, как у resample: начало дня для 'day',
+    последний день недели или месяца для 'week' и 'month'
+    """
+    periods = pd.to_datetime(pd.Series(dates)).dt.to_period(GRAINS[grain])
+    if grain == 'day':
+        return periods.dt.start_time
+    return periods.dt.end_time.dt.normalize()
+
+
+class TimeSeriesRollup:
+    """
+    Предагрегированные временные ряды отзывов по дням, неделям и месяцам
+    Для каждого периода хранятся количество отзывов, суммы рейтинга и тональности
+    и количества отзывов по категориям, поэтому таблицу можно дополнять новыми
+    отзывами (и вычитать удалённые), а графики строятся по числу периодов,
+    а не по числу отзывов
+    """
+
+    def __init__(self, table=None):
+        if table is None:
+            table = pd.DataFrame({
+                'grain': pd.Series(dtype=object),
+                'period': pd.Series(dtype='datetime64[ns]'),
+                **{column: pd.Series(dtype='int64' if column == 'count' else 'float64') for column in SUM_COLUMNS}
+            })
+        self.table = table
+
+    @property
+    def count(self):
+        """Количество отзывов в агрегатах (по дневной гранулярности)"""
+        return int(self.table.loc[self.table['grain'] == 'day', 'count'].sum())
+
+    @staticmethod
+    def aggregate(df):
+        """Считает агрегаты по всем гранулярностям для части обработанных отзывов"""
+        dated = df['date'].notna()
+        df = df[dated]
+
+        values = pd.DataFrame({
+            'count': np.ones(len(df), dtype=np.int64),
+            'rating_sum': df['rating'].to_numpy(dtype=np.float64),
+            'sentiment_sum': df['sentiment_score'].to_numpy(dtype=np.float64)
+        })
+        for column in ROLLUP_CATEGORY_COLUMNS:
+            if column in df.columns:
+                dummies = pd.get_dummies(df[column].astype(str).to_numpy(), prefix=column, prefix_sep=':',
+                                         dtype=np.int64)
+                values = pd.concat([values, dummies], axis=1)
+
+        tables = []
+        for grain in GRAINS:
+            labels = period_labels(df['date'].to_numpy(), grain).rename('period')
+            grouped = values.groupby(labels, sort=True).sum().reset_index()
+            grouped.insert(0, 'grain', grain)
+            tables.append(grouped)
+
+        return pd.concat(tables, ignore_index=True)
+
+    def update(self, df, sign=1):
+        """
+        Добавляет в агрегаты новые отзывы (sign=1) или вычитает удалённые (sign=-1)
+        Работа пропорциональна размеру df, а не всей истории отзывов
+        """
+        if df is None or len(df) == 0:
+            return self
+
+        part = self.aggregate(df)
+        value_columns = [column for column in part.columns if column not in KEY_COLUMNS]
+        part[value_columns] = part[value_columns] * sign
+
+        table = pd.concat([self.table, part], ignore_index=True)
+        table = table.groupby(KEY_COLUMNS, sort=True).sum(min_count=0).reset_index()
+
+        category_columns = [column for column in table.columns if ':' in column]
+        table[['count'] + category_columns] = table[['count'] + category_columns].fillna(0).astype('int64')
+
+        # Периоды, в которых не осталось отзывов, удаляем
+        self.table = table[table['count'] > 0].reset_index(drop=True)
+
+        return self
+
+    def merge(self, other):
+        """Объединяет агрегаты, посчитанные по другой части данных"""
+        table = pd.concat([self.table, other.table], ignore_index=True)
+        table = table.groupby(KEY_COLUMNS, sort=True).sum(min_count=0).reset_index()
+
+        category_columns = [column for column in table.columns if ':' in column]
+        table[category_columns] = table[category_columns].fillna(0).astype('int64')
+        self.table = table
+
+        return self
+
+    def date_range(self):
+        """Первый и последний день, за которые есть отзывы (None, если агрегаты пусты)"""
+        days = self.table.loc[self.table['grain'] == 'day', 'period']
+        if days.empty:
+            return None
+        return days.min(), days.max()
+
+    def frame(self, grain='month', start=None, end=None):
+        """
+        Временной ряд для графиков, как resample(...).agg: review_count, средние rating
+        и sentiment_score и количества по категориям. Пустые периоды внутри ряда
+        заполняются нулями (средние - NaN). start и end ограничивают ряд периодами,
+        в которые попадают эти даты
+        """
+        rows = self.table[self.table['grain'] == grain].set_index('period').sort_index()
+        rows = rows.drop(columns='grain')
+
+        if not rows.empty:
+            index = pd.date_range(rows.index[0], rows.index[-1], freq=GRAINS[grain], name='date')
+            rows = rows.reindex(index, fill_value=0)
+
+        if start is not None:
+            rows = rows[rows.index >= period_labels([start], grain)[0]]
+        if end is not None:
+            rows = rows[rows.index <= period_labels([end], grain)[0]]
+
+        counts = rows['count'].astype('int64')
+        result = pd.DataFrame({
+            'review_count': counts,
+            'rating': rows['rating_sum'] / counts.where(counts > 0),
+            'sentiment_score': rows['sentiment_sum'] / counts.where(counts > 0)
+        }, index=rows.index)
+
+        category_columns = [column for column in rows.columns if ':' in column]
+        return pd.concat([result, rows[category_columns].astype('int64')], axis=1)
+
+    def save(self, storage, filepath):
+        """Сохраняет агрегаты через хранилище отзывов"""
+        storage.save(self.table, filepath)
+
+    @classmethod
+    def load(cls, storage, filepath):
+        """Загружает агрегаты (None, если файла нет)"""
+        try:
+            table = storage.load(filepath)
+        except FileNotFoundError:
+            return None
+
+        table['period'] = pd.to_datetime(table['period'])
+        category_columns = [column for column in table.columns if ':' in column]
+        table[category_columns] = table[category_columns].fillna(0).astype('int64')
+
+        return cls(table)
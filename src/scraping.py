@@ -5,10 +5,15 @@ import time
 import random
 from urllib.parse import urljoin, urlparse
 import os
+from storage import get_storage
+from instrumentation import traced, record_bytes
 
 
 class ReviewScraper:
-    def __init__(self):
+    def __init__(self, storage=None):
+        # Хранилище данных: 'csv' (по умолчанию), 'parquet' или объект хранилища
+        self.storage = get_storage(storage)
+
         self.session = requests.Session()
         # Добавляем заголовки чтобы выглядеть как обычный браузер
         self.session.headers.update({
@@ -88,6 +93,49 @@ class ReviewScraper:
 
         return sample_reviews
 
+    @traced
+    def parse_reviews_page(self, html):
+        """
+        Разбирает HTML страницу с отзывами
+        Ожидаемая разметка: <div class="review" data-rating="5"> с вложенными
+        .review-author, <time datetime="YYYY-MM-DD"> и .review-text
+        """
+        soup = BeautifulSoup(html, 'lxml')
+        reviews = []
+
+        for item in soup.select('div.review'):
+            try:
+                reviews.append({
+                    'rating': int(item['data-rating']),
+                    'text': item.select_one('.review-text').get_text(strip=True),
+                    'date': item.select_one('time')['datetime'],
+                    'author': item.select_one('.review-author').get_text(strip=True)
+                })
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                print(f"Пропущен отзыв с некорректной разметкой: {e}")
+
+        return reviews
+
+    @traced
+    def scrape_pages(self, urls, delay=(0.5, 1.5)):
+        """Последовательно скачивает и разбирает страницы с паузой между запросами"""
+        reviews = []
+
+        for url in urls:
+            try:
+                response = self.session.get(url, timeout=10)
+                response.raise_for_status()
+                record_bytes(read=len(response.content))
+                reviews.extend(self.parse_reviews_page(response.text))
+            except requests.RequestException as e:
+                print(f"Ошибка при загрузке {url}: {e}")
+
+            # Пауза, чтобы не перегружать сайт
+            time.sleep(random.uniform(*delay))
+
+        return reviews
+
+    @traced
     def save_reviews_to_csv(self, reviews, filename='reviews.csv'):
         """Сохраняет отзывы в CSV файл"""
         df = pd.DataFrame(reviews)
@@ -101,6 +149,21 @@ class ReviewScraper:
 
         return df
 
+    @traced
+    def save_reviews(self, reviews, filename=None):
+        """Сохраняет отзывы в выбранное хранилище"""
+        df = pd.DataFrame(reviews)
+
+        if filename is None:
+            filename = f'reviews{self.storage.extension}'
+
+        filepath = f'data/raw/{filename}'
+        self.storage.save(df, filepath)
+        print(f"Сохранено {len(reviews)} отзывов в файл {filepath}")
+
+        return df
+
+    @traced
     def get_sample_data(self):
         """Получает образцы данных для анализа"""
         print("Получение образцов отзывов...")
@@ -130,8 +193,8 @@ class ReviewScraper:
 
         reviews.extend(additional_reviews)
 
-        # Сохраняем в CSV
-        df = self.save_reviews_to_csv(reviews)
+        # Сохраняем в хранилище (по умолчанию CSV)
+        df = self.save_reviews(reviews)
 
         return df
 
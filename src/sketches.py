@@ -0,0 +1,403 @@
+"""
+Потоковые приближённые статистики отзывов: квантили и число различных значений
+Квантили (медиана, p90, p99 длины и тональности) считаются скетчем KLL, число
+различных авторов и слов - HyperLogLog. Оба скетча дополняются частями данных
+и объединяются (merge) между процессами и между днями, а их размер не зависит
+от числа отзывов, поэтому статистика за всю историю считается по нескольким
+килобайтам состояния на день, а не повторным чтением всех отзывов
+"""
+
+import os
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from indexing import split_words
+from rollups import period_labels
+
+# Колонки, по которым хранятся скетчи квантилей
+SKETCH_COLUMNS = ['word_count', 'text_length', 'sentiment_score']
+
+# Квантили сводки по умолчанию
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def leading_zeros(values):
+    """Число ведущих нулевых бит 64-битных чисел (64 для нуля), двоичным поиском без циклов по числам"""
+    values = np.asarray(values, dtype=np.uint64).copy()
+    zeros = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        empty = (values >> np.uint64(64 - shift)) == 0
+        zeros += np.where(empty, shift, 0)
+        values = np.where(empty, values << np.uint64(shift), values)
+
+    return zeros + (values == 0)
+
+
+class KLLSketch:
+    """
+    Скетч квантилей KLL: значения хранятся уровнями, элемент уровня h весит 2^h
+    Переполненный уровень сортируется, и каждый второй элемент (со случайным
+    сдвигом) переходит на уровень выше, поэтому хранится O(k log(n / k)) чисел,
+    а ошибка ранга квантиля порядка 1 / k. Минимум и максимум хранятся точно
+    """
+
+    def __init__(self, k=128, seed=42):
+        self.k = k
+        self.levels = [np.zeros(0, dtype=np.float64)]
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        # Состояние генератора случайных сдвигов (64-битный LCG): в отличие от
+        # np.random.Generator занимает одно число в сохранённых скетчах
+        self.state = seed
+
+    def __getstate__(self):
+        # Уровни сохраняются одним массивом и их длинами: у дневных скетчей мало значений,
+        # и накладные расходы на отдельные массивы были бы больше самих данных
+        state = self.__dict__.copy()
+        state['levels'] = np.concatenate(self.levels)
+        state['level_sizes'] = np.array([len(items) for items in self.levels], dtype=np.int64)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        items = state.pop('levels')
+        sizes = state.pop('level_sizes')
+        self.__dict__.update(state)
+        self.levels = np.split(items, np.cumsum(sizes)[:-1])
+
+    def _random_bit(self):
+        self.state = (self.state * 6364136223846793005 + 1442695040888963407) % 2 ** 64
+        return self.state >> 63
+
+    def __len__(self):
+        return self.count
+
+    def capacity(self, level):
+        """Вместимость уровня: k у верхнего уровня, в 1.5 раза меньше у каждого следующего вниз"""
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        """Уплотняет переполненные уровни снизу вверх"""
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0, dtype=np.float64))
+
+                # При нечётном числе элементов один остаётся на уровне, чтобы вес сохранился точно
+                items = np.sort(items)
+                odd = len(items) % 2
+                promoted = items[odd:][self._random_bit()::2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                self.levels[level] = items[:odd]
+            level += 1
+
+    def update(self, values):
+        """Добавляет значения (пропуски NaN не учитываются)"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+        return self
+
+    def merge(self, other):
+        """Объединяет скетч, посчитанный по другой части данных"""
+        if other.count == 0:
+            return self
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+        return self
+
+    def quantiles(self, qs=DEFAULT_QUANTILES):
+        """Приближённые квантили уровней qs (NaN для пустого скетча)"""
+        qs = np.atleast_1d(np.asarray(qs, dtype=np.float64))
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=np.int64)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+
+        positions = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+        result = items[np.minimum(positions, len(items) - 1)]
+        result[qs <= 0] = self.min
+        result[qs >= 1] = self.max
+
+        return result
+
+    def quantile(self, q):
+        """Приближённый квантиль уровня q"""
+        return self.quantiles([q])[0]
+
+    def size(self):
+        """Число хранимых значений"""
+        return sum(len(items) for items in self.levels)
+
+
+class HyperLogLog:
+    """
+    Оценка числа различных значений HyperLogLog по 2^p регистрам (1 байт каждый)
+    Значения хешируются pd.util.hash_array (одинаково во всех процессах), первые p бит
+    хеша выбирают регистр, а в регистре хранится максимум позиции первой единицы
+    в остальных битах. Относительная ошибка около 1.04 / sqrt(2^p): 2.3% при p=11
+    """
+
+    def __init__(self, p=11):
+        self.p = p
+        self.registers = np.zeros(2 ** p, dtype=np.uint8)
+
+    def __getstate__(self):
+        # Разреженная запись (номера и значения непустых регистров), если она короче плотной
+        nonzero = np.flatnonzero(self.registers)
+        if len(nonzero) * 5 < len(self.registers):
+            return {'p': self.p, 'indices': nonzero.astype(np.uint32), 'values': self.registers[nonzero]}
+        return {'p': self.p, 'registers': self.registers}
+
+    def __setstate__(self, state):
+        self.p = state['p']
+        if 'registers' in state:
+            self.registers = state['registers']
+        else:
+            self.registers = np.zeros(2 ** self.p, dtype=np.uint8)
+            self.registers[state['indices']] = state['values']
+
+    def update_hashes(self, hashes):
+        """Добавляет значения по их 64-битным хешам"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) == 0:
+            return self
+
+        indices = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        ranks = np.minimum(leading_zeros(hashes << np.uint64(self.p)), 64 - self.p) + 1
+        np.maximum.at(self.registers, indices, ranks.astype(np.uint8))
+
+        return self
+
+    def update(self, values):
+        """Добавляет значения (строки или числа); пропуски не учитываются"""
+        values = pd.Series(values).dropna()
+        if len(values) == 0:
+            return self
+
+        return self.update_hashes(pd.util.hash_array(values.astype(str).to_numpy(dtype=object)))
+
+    def merge(self, other):
+        """Объединяет скетч другой части данных (p должны совпадать)"""
+        if other.p != self.p:
+            raise ValueError(f"Нельзя объединить HyperLogLog с p={self.p} и p={other.p}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        """Оценка числа различных значений (для малых чисел - линейный подсчёт по пустым регистрам)"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+
+        empty = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and empty:
+            estimate = m * np.log(m / empty)
+
+        return int(round(estimate))
+
+
+class ReviewSketches:
+    """
+    Скетчи обработанных отзывов по дням: KLL для колонок SKETCH_COLUMNS
+    и HyperLogLog авторов и слов (по clean_text). Недели, месяцы и вся история
+    получаются объединением дневных скетчей; отзывы без даты учитываются
+    только в сводке за всю историю
+    """
+
+    def __init__(self, k=128, p=11):
+        self.k = k
+        self.p = p
+        # День (Timestamp или None для отзывов без даты) -> скетчи этого дня
+        self.days = {}
+
+    @property
+    def count(self):
+        """Количество отзывов в скетчах"""
+        return sum(day['reviews'] for day in self.days.values())
+
+    def _empty_day(self):
+        day = {column: KLLSketch(self.k) for column in SKETCH_COLUMNS}
+        day['reviews'] = 0
+        day['authors'] = HyperLogLog(self.p)
+        day['vocabulary'] = HyperLogLog(self.p)
+        return day
+
+    def update(self, df):
+        """Добавляет в скетчи часть обработанных отзывов"""
+        if df is None or len(df) == 0:
+            return self
+
+        if 'date' in df.columns:
+            dates = period_labels(df['date'].to_numpy(), 'day')
+            day_codes, day_values = pd.factorize(dates)
+        else:
+            day_codes, day_values = np.full(len(df), -1, dtype=np.int64), pd.DatetimeIndex([])
+        day_keys = list(day_values) + [None]
+
+        columns = {column: df[column].to_numpy(dtype=np.float64) for column in SKETCH_COLUMNS if column in df.columns}
+        # Авторы хешируются один раз на часть, по дням раскладываются только хеши
+        author_hashes = None
+        if 'author' in df.columns:
+            authors = df['author']
+            author_hashes = pd.util.hash_array(authors.astype(str).to_numpy(dtype=object))
+            has_author = authors.notna().to_numpy()
+
+        rows_by_day = pd.Series(np.arange(len(df))).groupby(day_codes).indices
+        for code, rows in rows_by_day.items():
+            day = self.days.setdefault(day_keys[code], self._empty_day())
+            day['reviews'] += len(rows)
+            for column, values in columns.items():
+                day[column].update(values[rows])
+            if author_hashes is not None:
+                day['authors'].update_hashes(author_hashes[rows[has_author[rows]]])
+
+        if 'clean_text' in df.columns:
+            self._update_vocabulary(df['clean_text'], day_codes, day_keys)
+
+        return self
+
+    def _update_vocabulary(self, texts, day_codes, day_keys):
+        """
+        Слова текстов в HyperLogLog их дней: пары (день, слово) схлопываются
+        до уникальных, и каждое слово части хешируется один раз
+        """
+        token_lists = [split_words(text) if isinstance(text, str) else [] for text in texts]
+        lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=len(token_lists))
+        tokens = np.fromiter(chain.from_iterable(token_lists), dtype=object, count=int(lengths.sum()))
+        if len(tokens) == 0:
+            return
+
+        token_codes, uniques = pd.factorize(tokens)
+        token_hashes = pd.util.hash_array(np.asarray(uniques, dtype=object))
+
+        # Отзывы без даты имеют код дня -1, он становится последним ключом (None)
+        token_days = np.repeat(np.where(day_codes < 0, len(day_keys) - 1, day_codes), lengths)
+        pairs = np.unique(token_days * len(uniques) + token_codes)
+        pair_days, pair_tokens = np.divmod(pairs, len(uniques))
+
+        # Пары отсортированы по дню, поэтому слова каждого дня - непрерывный отрезок
+        codes, starts = np.unique(pair_days, return_index=True)
+        ends = np.append(starts[1:], len(pairs))
+        for code, start, end in zip(codes, starts, ends):
+            self.days[day_keys[code]]['vocabulary'].update_hashes(token_hashes[pair_tokens[start:end]])
+
+    def merge(self, other):
+        """Объединяет скетчи, посчитанные по другой части данных (другим процессом или за другие дни)"""
+        for key, other_day in other.days.items():
+            day = self.days.setdefault(key, self._empty_day())
+            day['reviews'] += other_day['reviews']
+            for name, sketch in other_day.items():
+                if name != 'reviews':
+                    day[name].merge(sketch)
+
+        return self
+
+    def combined(self, start=None, end=None):
+        """Скетчи дней с start по end, объединённые в один (без границ - вся история)"""
+        bounded = start is not None or end is not None
+        start = pd.Timestamp(start).normalize() if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+
+        result = self._empty_day()
+        for key, day in self.days.items():
+            if bounded and (key is None or (start is not None and key < start) or (end is not None and key > end)):
+                continue
+            result['reviews'] += day['reviews']
+            for name, sketch in day.items():
+                if name != 'reviews':
+                    result[name].merge(sketch)
+
+        return result
+
+    @staticmethod
+    def _summary_row(day, qs):
+        """Количество отзывов, оценки различных авторов и слов и квантили колонок"""
+        row = {
+            'review_count': day['reviews'],
+            'authors': day['authors'].count(),
+            'vocabulary': day['vocabulary'].count()
+        }
+        for column in SKETCH_COLUMNS:
+            for q, value in zip(qs, day[column].quantiles(qs)):
+                row[f'{column}_p{q * 100:g}'] = value
+        return row
+
+    def summary(self, start=None, end=None, qs=DEFAULT_QUANTILES):
+        """
+        Сводка за период (по умолчанию за всю историю): количество отзывов,
+        различных авторов и слов, квантили qs колонок ('word_count_p50', 'sentiment_score_p99'...)
+        """
+        return self._summary_row(self.combined(start, end), qs)
+
+    def frame(self, grain='month', qs=DEFAULT_QUANTILES):
+        """Сводка по периодам гранулярности grain ('day', 'week', 'month')"""
+        keys = sorted(key for key in self.days if key is not None)
+        if not keys:
+            return pd.DataFrame()
+
+        periods = period_labels(keys, grain)
+        rows = {}
+        for key, period in zip(keys, periods):
+            if period not in rows:
+                rows[period] = self._empty_day()
+            day = self.days[key]
+            rows[period]['reviews'] += day['reviews']
+            for name, sketch in day.items():
+                if name != 'reviews':
+                    rows[period][name].merge(sketch)
+
+        table = pd.DataFrame([self._summary_row(day, qs) for day in rows.values()],
+                             index=pd.DatetimeIndex(list(rows), name='date'))
+        return table
+
+    def nbytes(self):
+        """Размер состояния скетчей в байтах (значения KLL и регистры HyperLogLog)"""
+        total = 0
+        for day in self.days.values():
+            for name, sketch in day.items():
+                if isinstance(sketch, KLLSketch):
+                    total += sketch.size() * 8
+                elif isinstance(sketch, HyperLogLog):
+                    total += sketch.registers.nbytes
+        return total
+
+    def save(self, filepath):
+        """Сохраняет скетчи в pickle"""
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        pd.to_pickle(self, filepath)
+
+    @classmethod
+    def load(cls, filepath):
+        """Загружает скетчи (None, если файла нет)"""
+        if not os.path.exists(filepath):
+            return None
+        return pd.read_pickle(filepath)
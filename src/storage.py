@@ -0,0 +1,284 @@
+import json
+import os
+
+import pandas as pd
+
+from instrumentation import traced, record_file_read, record_file_written
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Колонки-категории обработанных отзывов
+CATEGORY_COLUMNS = ['sentiment_category', 'rating_category']
+
+
+def is_review_frame(df):
+    """Датафрейм отзывов (а не таблица агрегатов, частот или тем): в нём есть тексты"""
+    return 'text' in df.columns
+
+
+def is_whole_rating(ratings):
+    """Рейтинг можно хранить в int8: нет пропусков и все значения - целые от -128 до 127"""
+    if not pd.api.types.is_numeric_dtype(ratings) or ratings.isna().any():
+        return False
+
+    values = ratings.to_numpy()
+    return bool(((values % 1 == 0) & (values >= -128) & (values <= 127)).all())
+
+
+def apply_review_schema(df):
+    """
+    Приводит колонки отзывов к компактным типам: дата, категории, int8 для рейтинга
+    Рейтинг переводится в int8, только если это целые числа без пропусков
+    """
+    df = df.copy()
+
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'])
+
+    if 'rating' in df.columns and is_whole_rating(df['rating']):
+        df['rating'] = df['rating'].astype('int8')
+
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    return df
+
+
+def compact_review_frame(df, drop_clean_text=False):
+    """
+    Компактная схема обработанных отзывов: категории вместо строк,
+    минимальные целые типы, float32 для тональности и (если есть pyarrow)
+    строки в формате Arrow. clean_text можно удалить и пересчитать при необходимости
+    """
+    df = apply_review_schema(df)
+
+    for column in ['text_length', 'word_count']:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+
+    if 'sentiment_score' in df.columns:
+        df['sentiment_score'] = df['sentiment_score'].astype('float32')
+
+    # Авторы часто повторяются
+    if 'author' in df.columns:
+        df['author'] = df['author'].astype('category')
+
+    if drop_clean_text and 'clean_text' in df.columns:
+        df = df.drop(columns='clean_text')
+
+    if pyarrow is not None:
+        for column in ['text', 'clean_text', 'row_hash']:
+            if column in df.columns:
+                df[column] = df[column].astype('string[pyarrow]')
+
+    return df
+
+
+def memory_report(before_df, after_df):
+    """Сравнивает занимаемую датафреймами память (memory_usage(deep=True))"""
+    before = before_df.memory_usage(deep=True).sum()
+    after = after_df.memory_usage(deep=True).sum()
+
+    return {
+        'before_mb': before / 1024 ** 2,
+        'after_mb': after / 1024 ** 2,
+        'reduction': before / after if after else float('inf')
+    }
+
+
+def data_version(filepath):
+    """Версия файла данных (путь, время изменения в нс, размер), как у ключей кэша дашборда; None, если файла нет"""
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return filepath, stat.st_mtime_ns, stat.st_size
+
+
+def save_data_version(filepath, version):
+    """
+    Запоминает рядом с производным файлом (агрегатами, скетчами) версию данных,
+    по которым он посчитан: время изменения и размер в {filepath}.version.json
+    """
+    version_path = f'{filepath}.version.json'
+    if version is None:
+        if os.path.exists(version_path):
+            os.remove(version_path)
+        return
+
+    with open(version_path, 'w', encoding='utf-8') as f:
+        json.dump({'mtime_ns': version[1], 'size': version[2]}, f)
+
+
+def matches_data_version(filepath, version):
+    """Производный файл посчитан по данным этой версии (False, если версия не записана)"""
+    version_path = f'{filepath}.version.json'
+    if version is None or not os.path.exists(version_path):
+        return False
+
+    with open(version_path, encoding='utf-8') as f:
+        saved = json.load(f)
+    return saved.get('mtime_ns') == version[1] and saved.get('size') == version[2]
+
+
+class CsvStorage:
+    """Хранилище отзывов в CSV (UTF-8)"""
+
+    extension = '.csv'
+
+    @traced
+    def save(self, df, filepath):
+        """Сохраняет датафрейм в CSV файл"""
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        df.to_csv(filepath, index=False, encoding='utf-8')
+        record_file_written(filepath)
+
+    @traced
+    def load(self, filepath, columns=None):
+        """Загружает датафрейм из CSV файла (опционально только нужные колонки)"""
+        df = pd.read_csv(filepath, encoding='utf-8', usecols=columns)
+        record_file_read(filepath)
+
+        if 'date' in df.columns:
+            df['date'] = pd.to_datetime(df['date'])
+
+        return df
+
+    def iter_chunks(self, filepath, chunksize=100000, columns=None):
+        """Читает CSV файл частями по chunksize строк"""
+        for chunk in pd.read_csv(filepath, encoding='utf-8', usecols=columns, chunksize=chunksize):
+            if 'date' in chunk.columns:
+                chunk['date'] = pd.to_datetime(chunk['date'])
+            yield chunk
+
+    def writer(self, filepath):
+        """Запись файла частями: первая часть с заголовком, следующие дописываются"""
+        return CsvChunkWriter(filepath)
+
+
+class CsvChunkWriter:
+    """Пишет датафрейм в CSV файл частями (with storage.writer(path) as writer: writer.write(chunk))"""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.first_chunk = True
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
+
+    def write(self, df):
+        df.to_csv(self.filepath, mode='w' if self.first_chunk else 'a', header=self.first_chunk,
+                  index=False, encoding='utf-8')
+        self.first_chunk = False
+
+    def close(self):
+        if not self.first_chunk:
+            record_file_written(self.filepath)
+
+
+class ParquetStorage:
+    """
+    Колоночное хранилище отзывов в Parquet
+    Сохраняет типы колонок и позволяет читать только нужные колонки,
+    не декодируя тексты
+    """
+
+    extension = '.parquet'
+
+    def __init__(self, compression='snappy'):
+        if pyarrow is None:
+            raise ImportError("Для хранения в Parquet установите pyarrow: pip install pyarrow")
+        self.compression = compression
+
+    @traced
+    def save(self, df, filepath):
+        """Сохраняет датафрейм в Parquet файл (отзывы - с компактной схемой, остальные таблицы как есть)"""
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        if is_review_frame(df):
+            df = apply_review_schema(df)
+        df.to_parquet(filepath, index=False, compression=self.compression)
+        record_file_written(filepath)
+
+    @traced
+    def load(self, filepath, columns=None):
+        """Загружает датафрейм из Parquet файла (опционально только нужные колонки)"""
+        df = pd.read_parquet(filepath, columns=columns)
+        record_file_read(filepath)
+        return df
+
+    def iter_chunks(self, filepath, chunksize=100000, columns=None):
+        """Читает Parquet файл частями по chunksize строк"""
+        parquet_file = pyarrow.parquet.ParquetFile(filepath)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+
+    def writer(self, filepath):
+        """Запись файла частями: каждая часть - отдельная группа строк Parquet со схемой первой части"""
+        return ParquetChunkWriter(filepath, self.compression)
+
+
+class ParquetChunkWriter:
+    """
+    Пишет датафрейм в Parquet файл частями через pyarrow ParquetWriter
+    Схема берётся из первой части, следующие части приводятся к ней
+    """
+
+    def __init__(self, filepath, compression='snappy'):
+        self.filepath = filepath
+        self.compression = compression
+        self.writer = None
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
+
+    def write(self, df):
+        if is_review_frame(df):
+            df = apply_review_schema(df)
+
+        if self.writer is None:
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            self.writer = pyarrow.parquet.ParquetWriter(self.filepath, table.schema, compression=self.compression)
+        else:
+            table = pyarrow.Table.from_pandas(df, preserve_index=False).cast(self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            record_file_written(self.filepath)
+
+
+STORAGE_BACKENDS = {
+    'csv': CsvStorage,
+    'parquet': ParquetStorage
+}
+
+
+def get_storage(storage=None):
+    """Возвращает хранилище по имени ('csv', 'parquet') или готовый объект хранилища"""
+    if storage is None:
+        return CsvStorage()
+
+    if isinstance(storage, str):
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError(f"Неизвестный формат хранения: {storage}")
+        return STORAGE_BACKENDS[storage]()
+
+    return storage
@@ -0,0 +1,136 @@
+"""
+Детерминированный генератор синтетических отзывов для бенчмарков
+Словарь русских слов включает слова лексикона тональности ReviewProcessor,
+длины отзывов и рейтинги распределены как в реальных отзывах, даты - за несколько лет
+"""
+
+import numpy as np
+import pandas as pd
+
+from processing import ReviewProcessor
+
+# Нейтральные слова отзывов (частоты по закону Ципфа в порядке списка)
+NEUTRAL_WORDS = [
+    'товар', 'заказ', 'доставка', 'качество', 'цена', 'упаковка', 'продавец', 'покупка', 'размер', 'цвет',
+    'пришел', 'пришла', 'заказывала', 'заказывал', 'получил', 'получила', 'курьер', 'срок', 'магазин', 'фото',
+    'описание', 'соответствует', 'материал', 'работает', 'использую', 'неделю', 'месяц', 'день', 'коробка',
+    'инструкция', 'батарея', 'экран', 'звук', 'ткань', 'шов', 'модель', 'вес', 'комплект', 'подарок', 'сайт',
+    'отзыв', 'оплата', 'возврат', 'гарантия', 'сервис', 'поддержка', 'приложение', 'зарядка', 'кабель', 'ручка',
+    'в', 'и', 'на', 'не', 'что', 'с', 'за', 'по', 'для', 'очень', 'все', 'но', 'как', 'это', 'уже', 'был', 'была',
+    'еще', 'вполне', 'своих', 'денег', 'в целом', 'первый', 'второй', 'раз', 'пока', 'сразу', 'дома', 'ребенку',
+    'мужу', 'маме', 'себе', 'работы', 'каждый', 'день', 'немного', 'чуть', 'совсем', 'точно', 'рад', 'ожидания'
+]
+
+# Имена авторов
+FIRST_NAMES = ['Анна', 'Михаил', 'Елена', 'Дмитрий', 'Ольга', 'Сергей', 'Мария', 'Алексей', 'Наталья', 'Иван',
+               'Татьяна', 'Андрей', 'Светлана', 'Павел', 'Юлия', 'Николай', 'Ирина', 'Владимир', 'Екатерина', 'Олег']
+INITIALS = list('АБВГДЕЗИКЛМНОПРСТФХЧШЮЯ')
+
+# Распределение рейтингов (J-образное, как на маркетплейсах)
+RATING_PROBABILITIES = [0.08, 0.05, 0.10, 0.25, 0.52]
+
+# Доля позитивных слов среди слов тональности для каждого рейтинга
+POSITIVE_SHARE = {1: 0.1, 2: 0.25, 3: 0.5, 4: 0.8, 5: 0.92}
+
+# Доля слов тональности в тексте и длина предложения в словах
+SENTIMENT_WORD_SHARE = 0.12
+SENTENCE_LENGTH = 8
+
+
+class SyntheticReviews:
+    """
+    Генератор синтетических отзывов в формате сырых данных (rating, text, date, author)
+    При одинаковых seed и chunksize результат всегда один и тот же
+    """
+
+    def __init__(self, seed=42, start_date='2019-01-01', end_date='2024-12-31', mean_words=18):
+        self.seed = seed
+        self.start_date = pd.Timestamp(start_date)
+        self.end_date = pd.Timestamp(end_date)
+        self.mean_words = mean_words
+
+        processor = ReviewProcessor()
+        self.positive_words = np.array(processor.positive_words, dtype=object)
+        self.negative_words = np.array(processor.negative_words, dtype=object)
+
+        neutral = np.array(NEUTRAL_WORDS, dtype=object)
+        weights = 1.0 / np.arange(1, len(neutral) + 1)
+        self.neutral_words = neutral
+        self.neutral_probabilities = weights / weights.sum()
+
+        # Словарь: нейтральные, позитивные, негативные слова; для каждого слова
+        # заранее готовы варианты с заглавной буквой и точкой в конце предложения
+        vocabulary = np.concatenate([self.neutral_words, self.positive_words, self.negative_words])
+        self.n_neutral = len(self.neutral_words)
+        self.n_positive = len(self.positive_words)
+        self.variants = np.array([
+            vocabulary,
+            [word[:1].upper() + word[1:] for word in vocabulary],
+            [word + '.' for word in vocabulary],
+            [word[:1].upper() + word[1:] + '.' for word in vocabulary]
+        ], dtype=object)
+
+    def generate_chunk(self, n_rows, chunk_index=0):
+        """Генерирует одну часть отзывов (своё случайное состояние для каждой части)"""
+        rng = np.random.default_rng([self.seed, chunk_index])
+
+        ratings = rng.choice(np.arange(1, 6), size=n_rows, p=RATING_PROBABILITIES)
+
+        # Длина отзыва: логнормальное распределение, от 3 до 300 слов
+        lengths = np.clip(rng.lognormal(np.log(self.mean_words) - 0.32, 0.8, n_rows), 3, 300).astype(np.int64)
+        total = lengths.sum()
+        row_of_word = np.repeat(np.arange(n_rows), lengths)
+        starts = np.cumsum(lengths) - lengths
+        position = np.arange(total) - starts[row_of_word]
+
+        # Слова: нейтральные по Ципфу, слова тональности с учётом рейтинга
+        word_ids = rng.choice(self.n_neutral, size=total, p=self.neutral_probabilities)
+        is_sentiment = rng.random(total) < SENTIMENT_WORD_SHARE
+        positive_share = np.array([POSITIVE_SHARE[rating] for rating in range(1, 6)])[ratings[row_of_word] - 1]
+        is_positive = rng.random(total) < positive_share
+        positive_ids = self.n_neutral + rng.integers(0, self.n_positive, total)
+        negative_ids = self.n_neutral + self.n_positive + rng.integers(0, len(self.negative_words), total)
+        word_ids = np.where(is_sentiment, np.where(is_positive, positive_ids, negative_ids), word_ids)
+
+        # Начало предложения - с заглавной буквы, конец - с точкой
+        sentence_start = position % SENTENCE_LENGTH == 0
+        sentence_end = (position % SENTENCE_LENGTH == SENTENCE_LENGTH - 1) | (position == lengths[row_of_word] - 1)
+        tokens = self.variants[sentence_start + 2 * sentence_end, word_ids].tolist()
+        ends = starts + lengths
+        texts = [' '.join(tokens[start:end]) for start, end in zip(starts.tolist(), ends.tolist())]
+
+        # Даты за весь период, отзывов со временем становится больше
+        span_days = (self.end_date - self.start_date).days
+        days = (np.sqrt(rng.random(n_rows)) * span_days).astype(np.int64)
+        dates = (self.start_date + pd.to_timedelta(days, unit='D')).strftime('%Y-%m-%d')
+
+        authors = (pd.Series(rng.choice(FIRST_NAMES, n_rows)) + ' '
+                   + pd.Series(rng.choice(INITIALS, n_rows)) + '.')
+
+        return pd.DataFrame({
+            'rating': ratings,
+            'text': texts,
+            'date': dates,
+            'author': authors.to_numpy()
+        })
+
+    def iter_chunks(self, n_rows, chunksize=1000000):
+        """Генерирует n_rows отзывов частями по chunksize строк"""
+        for chunk_index, start in enumerate(range(0, n_rows, chunksize)):
+            yield self.generate_chunk(min(chunksize, n_rows - start), chunk_index)
+
+    def generate(self, n_rows, chunksize=1000000):
+        """Генерирует датафрейм из n_rows отзывов"""
+        return pd.concat(self.iter_chunks(n_rows, chunksize), ignore_index=True)
+
+    def write_csv(self, filepath, n_rows, chunksize=1000000):
+        """Записывает n_rows отзывов в CSV частями, не держа все данные в памяти"""
+        for chunk_index, chunk in enumerate(self.iter_chunks(n_rows, chunksize)):
+            chunk.to_csv(filepath, mode='w' if chunk_index == 0 else 'a', header=chunk_index == 0,
+                         index=False, encoding='utf-8')
+        return filepath
+
+
+def generate_reviews(n_rows, seed=42):
+    """Синтетические отзывы в формате data/raw/reviews.csv"""
+    return SyntheticReviews(seed).generate(n_rows)
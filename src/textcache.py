@@ -0,0 +1,149 @@
+"""
+Кэш результатов обработки текстов отзывов по содержимому
+В отзывах много точных дублей и вариантов, отличающихся только пробелами
+("Отличный товар!", "Всё супер"), поэтому очистка текста и тональность считаются
+один раз на каждый различный нормализованный текст и раздаются всем строкам
+Ключ - хеш нормализованного текста вместе с подписью настроек процессора
+(лексикон, лемматизация), поэтому после их изменения старые результаты не используются
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def normalize_text(text):
+    """Текст без лишних пробелов: варианты одного отзыва с разными пробелами совпадают"""
+    return ' '.join(str(text).split())
+
+
+def text_key(text, signature=''):
+    """Ключ кэша: 128-битный хеш нормализованного текста и подписи настроек"""
+    return hashlib.blake2b(f'{signature}\x00{text}'.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class TextResultCache:
+    """
+    Результаты обработки текстов по ключу содержимого (не больше max_entries записей)
+    Для каждой записи хранится номер последнего использования: при переполнении
+    удаляются записи, которые дольше всего не использовались
+    Если задан filepath, кэш загружается с диска при первом обращении и сохраняется
+    методом save, поэтому переживает перезапуски пайплайна. Кэш хранится в pickle,
+    а не в хранилище отзывов: CSV округляет тональность в последнем знаке
+    """
+
+    def __init__(self, max_entries=500000, filepath=None):
+        self.max_entries = max_entries
+        self.filepath = filepath
+        self.table = self._empty_table()
+        self.generation = 0
+        self.loaded = filepath is None
+
+        # Статистика за всё время работы и за последний пакет
+        self.totals = dict.fromkeys(['rows', 'unique_texts', 'cache_hits', 'computed'], 0)
+        self.last = dict(self.totals)
+
+    @staticmethod
+    def _empty_table():
+        return pd.DataFrame({
+            'clean_text': pd.Series(dtype=object),
+            'token_count': pd.Series(dtype='int64'),
+            'sentiment_score': pd.Series(dtype='float64'),
+            'last_used': pd.Series(dtype='int64')
+        }, index=pd.Index([], dtype=object, name='key'))
+
+    def __len__(self):
+        self.ensure_loaded()
+        return len(self.table)
+
+    def ensure_loaded(self):
+        """Загружает сохранённый кэш (один раз; если файла нет - начинает с пустого)"""
+        if self.loaded:
+            return self
+        self.loaded = True
+
+        if not os.path.exists(self.filepath):
+            return self
+
+        try:
+            self.table = pd.read_pickle(self.filepath)
+        except Exception as e:
+            print(f"Не удалось загрузить кэш текстов {self.filepath}: {e}")
+            return self
+
+        self.generation = int(self.table['last_used'].max()) if len(self.table) else 0
+
+        return self
+
+    def lookup(self, keys):
+        """
+        Позиции ключей в кэше (-1 для отсутствующих); найденные записи
+        помечаются как использованные в текущем пакете
+        """
+        self.ensure_loaded()
+        self.generation += 1
+
+        positions = self.table.index.get_indexer(keys)
+        found = positions[positions >= 0]
+        if len(found):
+            self.table.iloc[found, self.table.columns.get_loc('last_used')] = self.generation
+
+        return positions
+
+    def add(self, keys, results):
+        """Добавляет результаты новых текстов и вытесняет давно не использованные записи"""
+        if len(keys) == 0:
+            return self
+
+        part = pd.DataFrame({
+            'clean_text': np.asarray(results['clean_text'], dtype=object),
+            'token_count': np.asarray(results['token_count'], dtype=np.int64),
+            'sentiment_score': np.asarray(results['sentiment_score'], dtype=np.float64),
+            'last_used': self.generation
+        }, index=pd.Index(keys, dtype=object, name='key'))
+
+        table = pd.concat([self.table, part]) if len(self.table) else part
+        self.table = table[~table.index.duplicated(keep='last')]
+        self.evict()
+
+        return self
+
+    def evict(self):
+        """Оставляет max_entries записей, использованных последними"""
+        if len(self.table) > self.max_entries:
+            order = np.argsort(-self.table['last_used'].to_numpy(), kind='stable')[:self.max_entries]
+            self.table = self.table.iloc[np.sort(order)]
+        return self
+
+    def results(self, positions):
+        """Результаты записей кэша по позициям"""
+        return self.table.iloc[positions]
+
+    def record(self, rows, unique_texts, cache_hits, computed):
+        """Запоминает статистику пакета"""
+        self.last = {'rows': rows, 'unique_texts': unique_texts, 'cache_hits': cache_hits, 'computed': computed}
+        for name, value in self.last.items():
+            self.totals[name] += value
+
+    def stats(self, last=False):
+        """
+        Статистика дедупликации: строки, различные тексты, доля дублей (dedup_ratio),
+        найдено в кэше, посчитано заново и размер кэша
+        last=True - только за последний пакет
+        """
+        values = dict(self.last if last else self.totals)
+        values['dedup_ratio'] = 1 - values['unique_texts'] / values['rows'] if values['rows'] else 0.0
+        values['cache_size'] = len(self.table)
+        values['max_entries'] = self.max_entries
+        return values
+
+    def save(self):
+        """Сохраняет кэш в filepath"""
+        if self.filepath is None or not self.loaded:
+            return None
+
+        os.makedirs(os.path.dirname(self.filepath) or '.', exist_ok=True)
+        self.table.to_pickle(self.filepath)
+        return self.filepath
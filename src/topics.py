@@ -0,0 +1,189 @@
+"""
+Тематическая кластеризация отзывов (доставка, качество, упаковка, поддержка)
+Тексты векторизуются хешированием слов в пространство фиксированного размера (TF-IDF),
+при необходимости сжимаются TruncatedSVD, обученным на ограниченной выборке,
+и кластеризуются MiniBatchKMeans.partial_fit по частям корпуса. В памяти держится
+только одна часть данных и счётчики фиксированного размера, сколько бы ни было отзывов
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.utils import murmurhash3_32
+
+TOPIC_TERM_COLUMNS = ['topic_id', 'rank', 'term', 'weight']
+
+
+def topic_labels(topic_terms, n_terms=3):
+    """Подписи тем из первых n_terms слов: topic_id -> 'доставка, курьер, срок'"""
+    if topic_terms is None or topic_terms.empty:
+        return {}
+
+    top = topic_terms[topic_terms['rank'] < n_terms].sort_values(['topic_id', 'rank'])
+    return top.groupby('topic_id')['term'].agg(', '.join).to_dict()
+
+
+class StreamingTopicModel:
+    """
+    Темы отзывов по частям корпуса за три прохода: частоты документов для IDF
+    (и выборка для SVD), обучение MiniBatchKMeans, назначение тем и веса слов тем
+    chunks - функция без аргументов, которая каждый раз заново отдаёт части текстов
+    """
+
+    def __init__(self, n_topics=8, stop_words=None, n_features=2 ** 18, svd_components=100, svd_sample=20000,
+                 batch_size=2048, n_terms=10, seed=42):
+        self.n_topics = n_topics
+        self.n_features = n_features
+        self.svd_components = svd_components
+        self.svd_sample = svd_sample
+        self.batch_size = max(batch_size, n_topics)
+        self.n_terms = n_terms
+        self.seed = seed
+
+        self.vectorizer = CountVectorizer(stop_words=stop_words)
+        # Имя слова для каждого хеша (первое встреченное слово)
+        self.terms = {}
+        self.n_docs = 0
+        self.doc_freq = np.zeros(n_features, dtype=np.int64)
+        self.idf = None
+        self.svd = None
+        self.svd_columns = None
+        self.kmeans = None
+        self.term_weights = None
+        self.topic_sizes = None
+
+    def hashed_counts(self, texts):
+        """Частоты слов части текстов в пространстве хешей (n_features колонок)"""
+        try:
+            counts = self.vectorizer.fit_transform(texts)
+        except ValueError:
+            # В части нет ни одного слова (пустые тексты или только стоп-слова)
+            return sparse.csr_matrix((len(texts), self.n_features), dtype=np.float64)
+
+        names = self.vectorizer.get_feature_names_out()
+        feature_ids = np.array([abs(murmurhash3_32(term, seed=0)) % self.n_features for term in names],
+                               dtype=np.int64)
+        for feature_id, term in zip(feature_ids, names):
+            self.terms.setdefault(feature_id, term)
+
+        mapping = sparse.csr_matrix(
+            (np.ones(len(names)), (np.arange(len(names)), feature_ids)),
+            shape=(len(names), self.n_features)
+        )
+        return (counts @ mapping).tocsr()
+
+    def tfidf(self, texts):
+        """Нормированный TF-IDF части текстов и маска текстов, в которых есть слова"""
+        counts = self.hashed_counts(texts)
+        return normalize(counts.multiply(self.idf).tocsr()), counts.getnnz(axis=1) > 0
+
+    def vectors(self, tfidf):
+        """Векторы для кластеризации: TF-IDF или его проекция SVD (нормированная)"""
+        if self.svd is None:
+            return tfidf
+        return normalize(self.svd.transform(tfidf[:, self.svd_columns]))
+
+    def fit(self, chunks):
+        """Обучает модель: IDF и SVD за первый проход, MiniBatchKMeans за второй"""
+        sample = []
+        n_nonempty = 0
+        for texts in chunks():
+            counts = self.hashed_counts(texts)
+            self.n_docs += counts.shape[0]
+            self.doc_freq += np.bincount(counts.indices, minlength=self.n_features)
+            n_nonempty += int((counts.getnnz(axis=1) > 0).sum())
+
+            if len(sample) < self.svd_sample:
+                sample.extend(texts[:self.svd_sample - len(sample)])
+
+        self.idf = np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1
+
+        n_clusters = min(self.n_topics, n_nonempty)
+        if n_clusters < 2:
+            return self
+
+        # SVD обучается на выборке ограниченного размера и только по хешам, которые
+        # в ней встретились: у остальных колонок компоненты всё равно нулевые,
+        # а плотные матрицы SVD по всем n_features колонкам намного больше
+        if self.svd_components:
+            sample_tfidf, nonempty = self.tfidf(sample)
+            self.svd_columns = np.unique(sample_tfidf.indices)
+            n_components = min(self.svd_components, int(nonempty.sum()) - 1, len(self.svd_columns) - 1)
+            if n_components >= 2:
+                self.svd = TruncatedSVD(n_components=n_components, random_state=self.seed)
+                self.svd.fit(sample_tfidf[nonempty][:, self.svd_columns])
+
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=self.batch_size, random_state=self.seed,
+                                      n_init=3)
+
+        # Пакеты меньше числа кластеров присоединяются к следующему пакету
+        pending = None
+        for texts in chunks():
+            tfidf, nonempty = self.tfidf(texts)
+            vectors = self.vectors(tfidf[nonempty])
+            for start in range(0, vectors.shape[0], self.batch_size):
+                batch = vectors[start:start + self.batch_size]
+                if pending is not None:
+                    batch = sparse.vstack([pending, batch]) if sparse.issparse(batch) else np.vstack([pending, batch])
+                    pending = None
+                if batch.shape[0] < n_clusters:
+                    pending = batch
+                    continue
+                self.kmeans.partial_fit(batch)
+
+        if pending is not None and hasattr(self.kmeans, 'cluster_centers_'):
+            self.kmeans.partial_fit(pending)
+
+        return self
+
+    def predict(self, chunks):
+        """
+        Номера тем всех текстов (-1 - в тексте нет слов) за один проход по частям
+        Заодно накапливает суммарный TF-IDF слов каждой темы для top_terms
+        """
+        labels = []
+        n_clusters = self.kmeans.n_clusters if self.kmeans is not None else 0
+        self.term_weights = np.zeros((n_clusters, self.n_features), dtype=np.float64)
+        self.topic_sizes = np.zeros(n_clusters, dtype=np.int64)
+
+        for texts in chunks():
+            chunk_labels = np.full(len(texts), -1, dtype=np.int64)
+            if self.kmeans is not None:
+                tfidf, nonempty = self.tfidf(texts)
+                if nonempty.any():
+                    chunk_labels[nonempty] = self.kmeans.predict(self.vectors(tfidf[nonempty]))
+
+                    rows = np.flatnonzero(nonempty)
+                    indicator = sparse.csr_matrix(
+                        (np.ones(len(rows)), (chunk_labels[rows], rows)),
+                        shape=(n_clusters, len(texts))
+                    )
+                    self.term_weights += (indicator @ tfidf).toarray()
+                    self.topic_sizes += np.bincount(chunk_labels[rows], minlength=n_clusters)
+            labels.append(chunk_labels)
+
+        return np.concatenate(labels) if labels else np.zeros(0, dtype=np.int64)
+
+    def top_terms(self, n_terms=None):
+        """Самые весомые слова каждой темы: колонки topic_id, rank, term, weight (средний TF-IDF)"""
+        n_terms = n_terms or self.n_terms
+        tables = []
+        for topic_id in range(0 if self.term_weights is None else len(self.term_weights)):
+            weights = self.term_weights[topic_id] / max(self.topic_sizes[topic_id], 1)
+            top = np.argsort(weights, kind='stable')[::-1][:n_terms]
+            top = top[weights[top] > 0]
+            tables.append(pd.DataFrame({
+                'topic_id': topic_id,
+                'rank': np.arange(len(top)),
+                'term': [self.terms[feature_id] for feature_id in top],
+                'weight': weights[top]
+            }))
+
+        if not tables:
+            return pd.DataFrame(columns=TOPIC_TERM_COLUMNS)
+
+        return pd.concat(tables, ignore_index=True)[TOPIC_TERM_COLUMNS]
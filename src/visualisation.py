@@ -1,12 +1,19 @@
+import os
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
-from processing import ReviewProcessor
+from processing import ReviewProcessor, segment_frequencies
+from storage import get_storage, compact_review_frame, matches_data_version
+from indexing import ReviewIndex, InvertedIndex
+from rollups import TimeSeriesRollup
+from aggregates import ReviewAggregates
+from topics import topic_labels
+import instrumentation
+from instrumentation import traced
 
 # Конфигурация страницы
 st.set_page_config(
@@ -16,51 +23,157 @@ st.set_page_config(
 )
 
 
+@st.cache_resource(max_entries=4, show_spinner="Загрузка данных...")
+def load_processed_frame(filepath, mtime_ns, size, storage_name, compact, _storage):
+    """
+    Загружает обработанные данные один раз на процесс
+    Один и тот же датафрейм отдаётся всем сессиям и перезапускам страницы (только для чтения).
+    Ключ кэша включает время изменения и размер файла, поэтому после записи новых данных
+    пайплайном кэш обновляется автоматически
+    """
+    df = _storage.load(filepath)
+    if compact:
+        df = compact_review_frame(df)
+    return df
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_term_frequencies(data_version, _storage, _df):
+    """
+    Таблица частот слов для текущей версии данных: сохранённая пайплайном
+    или, если файла нет, посчитанная один раз по датафрейму
+    """
+    processor = ReviewProcessor(storage=_storage)
+    table = processor.load_term_frequencies()
+    if table is None:
+        # Частотам нужны только тексты и колонки сегментов: копируются они, а не весь датафрейм
+        text_column = 'clean_text' if 'clean_text' in _df.columns else 'text'
+        table = processor.compute_term_frequencies(_df[[text_column, 'rating', 'sentiment_category']])
+    return table
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def render_word_cloud(segment, value, max_words, width, height, data_version, _table):
+    """Строит облако слов по готовым частотам; результат запоминается по сегменту и размеру"""
+    frequencies = segment_frequencies(_table, segment, value)
+    if not frequencies:
+        return None
+
+    return WordCloud(
+        width=width,
+        height=height,
+        background_color='white',
+        max_words=max_words,
+        colormap='viridis'
+    ).generate_from_frequencies(frequencies)
+
+
+@st.cache_resource(max_entries=4, show_spinner="Построение индекса отзывов...")
+def load_review_index(data_version, _df):
+    """Индекс фильтров и сортировок для текущей версии данных"""
+    return ReviewIndex(_df)
+
+
+@st.cache_resource(max_entries=4, show_spinner="Загрузка индекса поиска...")
+def load_search_index(data_version, _df, filepath='data/processed/search_index.npz'):
+    """
+    Инвертированный индекс для поиска: сохранённый пайплайном, если он не старше данных
+    и построен для того же числа строк, иначе строится по датафрейму
+    """
+    _, data_mtime_ns, _ = data_version
+    if os.path.exists(filepath) and os.stat(filepath).st_mtime_ns >= data_mtime_ns:
+        index = InvertedIndex.load(filepath)
+        if index.n_rows == len(_df):
+            return index
+
+    df = _df if 'clean_text' in _df.columns else _df[['text']].copy()
+    return ReviewProcessor().build_search_index(df)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_time_rollup(data_version, _storage, _df):
+    """
+    Агрегаты по дням, неделям и месяцам для текущей версии данных: сохранённые
+    пайплайном, если они посчитаны по этой версии файла, иначе посчитанные по датафрейму
+    """
+    path = ReviewProcessor(storage=_storage).time_rollups_path()
+    rollup = TimeSeriesRollup.load(_storage, path)
+    if rollup is None or not matches_data_version(path, data_version):
+        rollup = TimeSeriesRollup().update(_df)
+    return rollup
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_aggregates(data_version, _df):
+    """Сводная статистика для текущей версии данных, общая для всех страниц и сессий"""
+    return ReviewAggregates(_df)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_topic_terms(data_version, _storage):
+    """Слова тем, сохранённые пайплайном вместе с данными (None, если тем нет)"""
+    return ReviewProcessor(storage=_storage).load_topic_terms()
+
+
 class ReviewDashboard:
-    def __init__(self):
+    def __init__(self, storage=None, compact=False):
         self.df = None
-
+        # Версия данных (путь, время изменения, размер) для ключей кэша
+        self.data_version = None
+        # Хранилище данных: 'csv' (по умолчанию), 'parquet' или объект хранилища
+        self.storage = get_storage(storage)
+        # Держать данные в памяти в компактной схеме типов
+        self.compact = compact
+
+    @traced
     def load_data(self):
-        """Загружает данные"""
+        """Загружает данные (из кэша процесса, если файл не менялся)"""
+        filepath = f'data/processed/processed_reviews{self.storage.extension}'
         try:
-            self.df = pd.read_csv('data/processed/processed_reviews.csv')
-            self.df['date'] = pd.to_datetime(self.df['date'])
+            stat = os.stat(filepath)
+            self.data_version = (filepath, stat.st_mtime_ns, stat.st_size)
+            self.df = load_processed_frame(filepath, stat.st_mtime_ns, stat.st_size,
+                                           type(self.storage).__name__, self.compact, self.storage)
             return True
         except FileNotFoundError:
             return False
 
+    @traced
     def show_header(self):
         """Показывает заголовок приложения"""
         st.title("📊 Анализ отзывов покупателей")
         st.markdown("---")
 
         if self.df is not None:
+            stats = load_aggregates(self.data_version, self.df)
             col1, col2, col3, col4 = st.columns(4)
 
             with col1:
-                st.metric("Всего отзывов", len(self.df))
+                st.metric("Всего отзывов", stats.count)
 
             with col2:
-                avg_rating = self.df['rating'].mean()
+                avg_rating = stats.rating_mean
                 st.metric("Средний рейтинг", f"{avg_rating:.2f}")
 
             with col3:
-                positive_pct = len(self.df[self.df['sentiment_category'] == 'Позитивная']) / len(self.df) * 100
+                positive_pct = stats.share('Позитивная')
                 st.metric("Позитивных отзывов", f"{positive_pct:.1f}%")
 
             with col4:
-                avg_words = self.df['word_count'].mean()
+                avg_words = stats.word_count_mean
                 st.metric("Средняя длина", f"{avg_words:.0f} слов")
 
+    @traced
     def show_rating_analysis(self):
         """Показывает анализ рейтингов"""
         st.header("📈 Анализ рейтингов")
 
+        stats = load_aggregates(self.data_version, self.df)
         col1, col2 = st.columns(2)
 
         with col1:
             # Распределение рейтингов
-            rating_counts = self.df['rating'].value_counts().sort_index()
+            rating_counts = stats.rating_distribution
             fig_bar = px.bar(
                 x=rating_counts.index,
                 y=rating_counts.values,
@@ -73,7 +186,7 @@ class ReviewDashboard:
 
         with col2:
             # Круговая диаграмма по категориям рейтинга
-            rating_categories = self.df['rating_category'].value_counts()
+            rating_categories = stats.rating_category_distribution
             fig_pie = px.pie(
                 values=rating_categories.values,
                 names=rating_categories.index,
@@ -81,15 +194,17 @@ class ReviewDashboard:
             )
             st.plotly_chart(fig_pie, use_container_width=True)
 
+    @traced
     def show_sentiment_analysis(self):
         """Показывает анализ тональности"""
         st.header("😊 Анализ тональности")
 
+        stats = load_aggregates(self.data_version, self.df)
         col1, col2 = st.columns(2)
 
         with col1:
             # Распределение тональности
-            sentiment_counts = self.df['sentiment_category'].value_counts()
+            sentiment_counts = stats.sentiment_distribution
             colors = ['#ff6b6b', '#feca57', '#48dbfb']
             fig_pie = px.pie(
                 values=sentiment_counts.values,
@@ -113,9 +228,10 @@ class ReviewDashboard:
             st.plotly_chart(fig_scatter, use_container_width=True)
 
         # Корреляция
-        correlation = self.df['rating'].corr(self.df['sentiment_score'])
+        correlation = stats.correlation
         st.info(f"Корреляция между рейтингом и тональностью: {correlation:.3f}")
 
+    @traced
     def show_text_analysis(self):
         """Показывает анализ текста"""
         st.header("📝 Анализ текста отзывов")
@@ -146,32 +262,100 @@ class ReviewDashboard:
 
         # Облако слов
         st.subheader("☁️ Облако слов")
+        segments = {"Все отзывы": ('all', '')}
+        for rating in sorted(self.df['rating'].unique()):
+            segments[f"Рейтинг {rating}"] = ('rating', rating)
+        for category in self.df['sentiment_category'].unique():
+            segments[f"Тональность: {category}"] = ('sentiment_category', category)
+
+        segment_name = st.selectbox("Отзывы для облака слов:", list(segments.keys()))
+
         if st.button("Создать облако слов"):
-            all_text = ' '.join(self.df['clean_text'].dropna())
-            if all_text.strip():
-                wordcloud = WordCloud(
-                    width=800,
-                    height=400,
-                    background_color='white',
-                    max_words=100,
-                    colormap='viridis'
-                ).generate(all_text)
+            segment, value = segments[segment_name]
+            table = load_term_frequencies(self.data_version, self.storage, self.df)
+            wordcloud = render_word_cloud(segment, str(value), 100, 800, 400, self.data_version, table)
 
+            if wordcloud is not None:
                 fig, ax = plt.subplots(figsize=(10, 5))
                 ax.imshow(wordcloud, interpolation='bilinear')
                 ax.axis('off')
                 st.pyplot(fig)
 
+    @traced
+    def show_topic_analysis(self):
+        """Показывает разбивку отзывов по темам"""
+        st.header("🗂️ Темы отзывов")
+
+        groups = load_aggregates(self.data_version, self.df).topic_groups
+        if groups is None:
+            st.info("Темы не найдены: обработайте отзывы с topics=True")
+            return
+
+        labels = topic_labels(load_topic_terms(self.data_version, self.storage))
+        table = groups.copy()
+        table.insert(0, 'Тема', [labels.get(topic_id, 'без темы' if topic_id < 0 else str(topic_id))
+                                 for topic_id in table.index])
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            fig_sizes = px.bar(
+                table,
+                x='count',
+                y='Тема',
+                orientation='h',
+                title='Количество отзывов по темам',
+                labels={'count': 'Количество отзывов'}
+            )
+            st.plotly_chart(fig_sizes, use_container_width=True)
+
+        with col2:
+            fig_sentiment = px.bar(
+                table,
+                x='sentiment_mean',
+                y='Тема',
+                orientation='h',
+                color='rating_mean',
+                color_continuous_scale='RdYlGn',
+                title='Средняя тональность и рейтинг по темам',
+                labels={'sentiment_mean': 'Средняя тональность', 'rating_mean': 'Средний рейтинг'}
+            )
+            st.plotly_chart(fig_sentiment, use_container_width=True)
+
+        st.dataframe(table.rename(columns={
+            'count': 'Отзывов',
+            'share': 'Доля, %',
+            'rating_mean': 'Средний рейтинг',
+            'sentiment_mean': 'Средняя тональность',
+            'negative_share': 'Негативных, %'
+        }), use_container_width=True)
+
+    @traced
     def show_time_analysis(self):
         """Показывает временной анализ"""
         st.header("📅 Временной анализ")
 
-        # Группировка по месяцам
-        monthly_data = self.df.set_index('date').resample('M').agg({
-            'rating': 'mean',
-            'sentiment_score': 'mean',
-            'text': 'count'
-        }).rename(columns={'text': 'review_count'})
+        rollup = load_time_rollup(self.data_version, self.storage, self.df)
+        date_range = rollup.date_range()
+        if date_range is None:
+            st.info("Нет отзывов с датами")
+            return
+
+        # Гранулярность и диапазон дат выбираются по готовым агрегатам, без пересчёта отзывов
+        grains = {'Месяц': 'month', 'Неделя': 'week', 'День': 'day'}
+        col1, col2 = st.columns(2)
+        with col1:
+            grain = st.selectbox("Группировка:", list(grains))
+        with col2:
+            selected = st.date_input("Период:", value=(date_range[0].date(), date_range[1].date()),
+                                     min_value=date_range[0].date(), max_value=date_range[1].date())
+
+        if isinstance(selected, (tuple, list)) and len(selected) == 2:
+            start, end = selected
+        else:
+            start, end = date_range
+
+        monthly_data = rollup.frame(grains[grain], start, end)
 
         col1, col2 = st.columns(2)
 
@@ -195,10 +379,17 @@ class ReviewDashboard:
             )
             st.plotly_chart(fig_line2, use_container_width=True)
 
+    @traced
     def show_detailed_reviews(self):
         """Показывает детальный анализ отзывов"""
         st.header("🔍 Детальный анализ отзывов")
 
+        # Полнотекстовый поиск
+        search_query = st.text_input(
+            "Поиск по тексту:",
+            placeholder="доставка брак (все слова) или доставка OR брак (любое слово)"
+        )
+
         # Фильтры
         col1, col2, col3 = st.columns(3)
 
@@ -220,27 +411,31 @@ class ReviewDashboard:
                 ["Дате", "Рейтингу", "Тональности"]
             )
 
-        # Применяем фильтры
-        filtered_df = self.df.copy()
+        # Фильтрация и сортировка по заранее построенному индексу, без копирования данных
+        index = load_review_index(self.data_version, self.df)
+        rating = None if rating_filter == "Все" else rating_filter
+        sentiment = None if sentiment_filter == "Все" else sentiment_filter
+        sort_key = {"Дате": 'date', "Рейтингу": 'rating', "Тональности": 'sentiment_score'}[sort_by]
 
-        if rating_filter != "Все":
-            filtered_df = filtered_df[filtered_df['rating'] == rating_filter]
+        rows = index.filter_rows(rating, sentiment)
+        if search_query.strip():
+            found = load_search_index(self.data_version, self.df).search(search_query)
+            rows = found if rows is None else np.intersect1d(rows, found, assume_unique=True)
+        total = index.n_rows if rows is None else len(rows)
 
-        if sentiment_filter != "Все":
-            filtered_df = filtered_df[filtered_df['sentiment_category'] == sentiment_filter]
+        # Показываем отзывы
+        st.write(f"Найдено отзывов: {total}")
 
-        # Сортировка
-        if sort_by == "Дате":
-            filtered_df = filtered_df.sort_values('date', ascending=False)
-        elif sort_by == "Рейтингу":
-            filtered_df = filtered_df.sort_values('rating', ascending=False)
-        else:
-            filtered_df = filtered_df.sort_values('sentiment_score', ascending=False)
+        col1, col2 = st.columns(2)
+        with col1:
+            page_size = st.selectbox("Отзывов на странице:", [10, 25, 50, 100])
+        with col2:
+            n_pages = max(1, -(-total // page_size))
+            page = st.number_input(f"Страница (из {n_pages}):", min_value=1, max_value=n_pages, value=1)
 
-        # Показываем отзывы
-        st.write(f"Найдено отзывов: {len(filtered_df)}")
+        _, positions = index.top_rows(rows, sort_key, (page - 1) * page_size, page_size)
 
-        for idx, row in filtered_df.head(10).iterrows():
+        for _, row in self.df.iloc[positions].iterrows():
             with st.expander(
                     f"Рейтинг: {row['rating']} | Тональность: {row['sentiment_category']} | {row['date'].strftime('%Y-%m-%d')}"):
                 st.write(f"**Автор:** {row['author']}")
@@ -248,15 +443,18 @@ class ReviewDashboard:
                 st.write(f"**Score тональности:** {row['sentiment_score']:.3f}")
                 st.write(f"**Количество слов:** {row['word_count']}")
 
+    @traced
     def show_insights(self):
         """Показывает основные инсайты"""
         st.header("💡 Основные инсайты")
 
+        stats = load_aggregates(self.data_version, self.df)
+
         # Общая статистика
-        total_reviews = len(self.df)
-        avg_rating = self.df['rating'].mean()
-        positive_ratio = len(self.df[self.df['sentiment_category'] == 'Позитивная']) / total_reviews * 100
-        correlation = self.df['rating'].corr(self.df['sentiment_score'])
+        total_reviews = stats.count
+        avg_rating = stats.rating_mean
+        positive_ratio = stats.share('Позитивная')
+        correlation = stats.correlation
 
         insights = [
             f"📊 Проанализировано **{total_reviews}** отзывов",
@@ -273,10 +471,9 @@ class ReviewDashboard:
             insights.append("❌ Слабое соответствие между рейтингом и тональностью")
 
         # Распределение по рейтингам
-        rating_dist = self.df['rating'].value_counts().sort_index()
-        most_common_rating = rating_dist.idxmax()
-        high_ratings = (rating_dist.get(4, 0) + rating_dist.get(5, 0)) / total_reviews * 100
-        low_ratings = (rating_dist.get(1, 0) + rating_dist.get(2, 0)) / total_reviews * 100
+        most_common_rating = stats.rating_distribution.idxmax()
+        high_ratings = stats.rating_share([4, 5])
+        low_ratings = stats.rating_share([1, 2])
 
         insights.extend([
             f"🏆 Наиболее частый рейтинг: **{most_common_rating}**",
@@ -294,16 +491,17 @@ class ReviewDashboard:
 
         with col1:
             st.write("**Самый позитивный отзыв:**")
-            most_positive = self.df.loc[self.df['sentiment_score'].idxmax()]
+            most_positive = self.df.iloc[stats.most_positive[0]]
             st.info(f"Рейтинг: {most_positive['rating']}, Score: {most_positive['sentiment_score']:.3f}")
             st.write(f"*{most_positive['text']}*")
 
         with col2:
             st.write("**Самый негативный отзыв:**")
-            most_negative = self.df.loc[self.df['sentiment_score'].idxmin()]
+            most_negative = self.df.iloc[stats.most_negative[0]]
             st.error(f"Рейтинг: {most_negative['rating']}, Score: {most_negative['sentiment_score']:.3f}")
             st.write(f"*{most_negative['text']}*")
 
+    @traced
     def run_dashboard(self):
         """Запускает дашборд"""
         # Пытаемся загрузить данные
@@ -324,6 +522,7 @@ python src/analysis.py
             "Анализ рейтингов": self.show_rating_analysis,
             "Анализ тональности": self.show_sentiment_analysis,
             "Анализ текста": self.show_text_analysis,
+            "Темы": self.show_topic_analysis,
             "Временной анализ": self.show_time_analysis,
             "Детальные отзывы": self.show_detailed_reviews,
             "Инсайты": self.show_insights
@@ -341,9 +540,14 @@ python src/analysis.py
 
 
 def main():
+    # REVIEWS_TRACE=1 streamlit run visualisation.py - записывать спаны и метрики
+    instrumentation.enable_from_env()
+
     dashboard = ReviewDashboard()
     dashboard.run_dashboard()
 
+    instrumentation.flush()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file